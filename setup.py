@@ -12,10 +12,18 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/lisp3r/SpotifyAPI",
     packages=["spotifyapi"],
+    extras_require={
+        "async": ["aiohttp"],
+        "fast": ["orjson"],
+        "http2": ["httpx[http2]"],
+        "metrics": ["prometheus_client"],
+        "parquet": ["pyarrow"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.8',
     include_package_data=True,
+    package_data={"spotifyapi": ["mockserver.crt", "mockserver.key"]},
 )
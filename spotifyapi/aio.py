@@ -0,0 +1,329 @@
+""" asyncio Spotify client
+
+Needs aiohttp: pip install spotifyapi[async]
+"""
+import asyncio
+import functools
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from spotifyapi import batch, endpoints, models, paging
+from spotifyapi.coalesce import request_key
+from spotifyapi.decoders import get_decoder
+from spotifyapi.common import logger
+from spotifyapi.exceptions import SpotifyError, SpotifyRequestError, SpotifyRequestNoContent
+from spotifyapi.metrics import RequestEvent
+from spotifyapi.ratelimit import RateLimiter
+from spotifyapi.retry import RetryPolicy
+
+
+__all__ = [
+    "AsyncAuth",
+    "AsyncSpotify"
+]
+
+# errors meaning the request got no response, see spotifyapi.retry
+_TRANSPORT_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError) if aiohttp else (asyncio.TimeoutError,)
+
+
+class AsyncAuth():
+    """ Async-aware wrapper for the auth managers from `spotifyapi.auth`
+
+    A valid token is returned from memory without leaving the event loop. Getting a new
+    token (cache file, accounts service) is blocking, so it runs in the default executor
+    and only one coroutine does it at a time, the others wait for its result.
+    """
+
+    def __init__(self, auth_manager):
+        self.auth_manager = auth_manager
+        self._lock = None
+
+    @property
+    def scope(self):
+        return getattr(self.auth_manager, 'scope', None)
+
+    async def get_token(self) -> str:
+        auth_manager = self.auth_manager
+        # the manager's own margin: within refresh_margin ClientCredentials.get_token starts its refresh
+        margin = getattr(auth_manager, 'refresh_margin', 60)
+        if auth_manager.token_info and not auth_manager._is_token_expired(margin):
+            return auth_manager.token_info['access_token']
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, auth_manager.get_token)
+
+
+def _endpoint(build):
+    """ Make an `AsyncSpotify` method from an endpoint definition """
+    @functools.wraps(build)
+    async def method(self, *args, raw=False, **kwargs):
+        api_call = build(*args, **kwargs)
+        if raw:
+            return await self._call(api_call._replace(decode=False))
+        body = await self._call(api_call)
+        if not api_call.decode:
+            # pauseUserPlayback, startOrResumeUserPlayback: None for 204, as in Spotify
+            return body or None
+        return models.wrap(api_call, body) if self.models else body
+    return method
+
+def _paged_endpoint(build):
+    """ Make an `AsyncSpotify` method returning an async iterator over the items of a paged endpoint """
+    @functools.wraps(build)
+    def method(self, *args, workers=None, **kwargs):
+        api_call = build(*args, **kwargs)
+        item_model = models.result_model(api_call).item_model if self.models else None
+        return paging.iter_items_async(self._call, api_call, workers=workers, item_model=item_model)
+    method.__name__ = method.__qualname__ = paging.iter_name(build)
+    method.__doc__ = f""" Iterate over the items of all `{build.__name__}` pages: async for item in ...
+
+        Takes the arguments of `{build.__name__}` plus `workers`, see `spotifyapi.paging`.
+        """
+    return method
+
+def _batch_endpoint(build):
+    """ Make an `AsyncSpotify` method looking up any number of IDs with a "Get Several ..." endpoint """
+    @functools.wraps(build)
+    async def method(self, ids, *args, **kwargs):
+        model = models.result_model(build([], *args, **kwargs)) if self.models else None
+        return await batch.get_several_async(self._call, build, ids, *args, model=model, **kwargs)
+    return method
+
+
+class AsyncSpotify:
+    """ asyncio version of `Spotify` with the same methods
+
+    All requests go through one aiohttp connection pool of `max_connections` connections,
+    and no more than `max_concurrency` requests are in flight at once. The iter* methods
+    return async iterators.
+
+    timeout:  Optional. Request timeout in seconds. Default: the one of the aiohttp session.
+
+        async with AsyncSpotify(auth_manager=AuthorizationCode(...)) as sp:
+            albums = await asyncio.gather(*(sp.getAlbum(id) for id in ids))
+    """
+    SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
+
+    def __init__(self, auth_manager=None, token=None, session=None, max_connections=100, max_concurrency=None,
+                 rate_limiter=None, cache=None, coalescer=None, models=False, decoder=None, hooks=None,
+                 retry_policy=None, catalog=None, timeout=None):
+        if aiohttp is None:
+            raise SpotifyError('AsyncSpotify needs aiohttp. Install it with "pip install spotifyapi[async]"')
+        if auth_manager and not isinstance(auth_manager, AsyncAuth):
+            auth_manager = AsyncAuth(auth_manager)
+        self.auth_manager = auth_manager
+        self.__token = token
+        self.__headers = None
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency or max_connections
+        self._session = session
+        self._own_session = session is None
+        self._semaphore = None
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.cache = cache
+        self.coalescer = coalescer
+        self.catalog = catalog
+        self.models = models
+        self.decoder = get_decoder(decoder)
+        self.timeout = timeout
+        self._request_kwargs = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        self.hooks = hooks
+        if hooks and auth_manager is not None and getattr(auth_manager.auth_manager, 'hooks', None) is None:
+            auth_manager.auth_manager.hooks = hooks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self) -> None:
+        """Make sure the connection (pool) gets closed"""
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        # aiohttp objects have to be created inside the running loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _get_headers(self) -> dict:
+        if not self.auth_manager:
+            return {}
+        token = await self.auth_manager.get_token()
+        if token != self.__token or self.__headers is None:
+            self.__token = token
+            self.__headers = {'Authorization': f'Bearer {token}'}
+        return self.__headers
+
+    async def _api_request(self, method, url_path, params=None, data=None, endpoint=None, idempotent=None) -> tuple:
+        """ Returns status code and body of the response """
+        session = self._get_session()
+        # endpoint paths are relative to SPOTIFY_API_URL (ending with /), `next` URLs of pages are absolute
+        url = url_path if url_path.startswith(('https://', 'http://')) else self.SPOTIFY_API_URL + url_path
+        rate_limiter = self.rate_limiter
+        hooks = self.hooks
+        attempt = 0
+        throttled = 0
+
+        cache = self.cache
+        cache_key = cache.key(method, url, params) if cache else None
+        cache_entry = cache.get(cache_key) if cache_key else None
+        cache_headers = None
+        if cache_entry:
+            if cache_entry.fresh:
+                if hooks:
+                    hooks.request(RequestEvent(endpoint or url_path, method, 200, 0.0, 0, len(cache_entry.body), True))
+                return 200, cache_entry.body
+            if cache_entry.etag:
+                cache_headers = {'If-None-Match': cache_entry.etag}
+
+        retry = self.retry_policy.start(method, idempotent)
+        while True:
+            retry.before_request()
+            await rate_limiter.acquire_async()
+            headers = await self._get_headers()
+            if cache_headers:
+                headers = dict(headers, **cache_headers)
+            attempt += 1
+            async with self._semaphore:
+                start = time.perf_counter() if hooks else None
+                try:
+                    async with session.request(method=method, url=url, headers=headers, params=params,
+                                               data=data, **self._request_kwargs) as resp:
+                        body = await resp.read()
+                        status, reason, resp_headers = resp.status, resp.reason, resp.headers
+                        retry_after = resp_headers.get('Retry-After')
+                except Exception as err:
+                    if hooks:
+                        hooks.request(RequestEvent(endpoint or url_path, method, None, time.perf_counter() - start,
+                                                   attempt, 0, False, err.__class__.__name__))
+                    delay = retry.next_delay() if retry.error(err, _TRANSPORT_ERRORS) else None
+                    if delay is None:
+                        raise
+                    logger.warning('%s on %s %s, retry %d in %.2fs', err.__class__.__name__, method, url_path,
+                                   retry.retries, delay)
+                else:
+                    delay = None
+                    if hooks:
+                        hooks.request(RequestEvent(endpoint or url_path, method, status, time.perf_counter() - start,
+                                                   attempt, len(body), False))
+            if delay is not None:
+                await asyncio.sleep(delay)
+                continue
+
+            failed = retry.response(status)
+            if status == 429:
+                if throttled >= rate_limiter.max_retries:
+                    break
+                throttled += 1
+                delay = rate_limiter.pause(retry_after)
+                if not retry.fits_deadline(delay):
+                    break
+                logger.warning('Rate limited on %s %s, retry %d in %ss', method, url_path, throttled, delay)
+                continue
+            if failed:
+                delay = retry.next_delay()
+                if delay is not None:
+                    logger.warning('%s on %s %s, retry %d in %.2fs', status, method, url_path, retry.retries, delay)
+                    await asyncio.sleep(delay)
+                    continue
+            break
+
+        if status >= 400:
+            logger.error('%s Error: %s for url: %s', status, reason, url)
+            raise SpotifyRequestError(body, status)
+
+        if cache_key:
+            if status == 304 and cache_entry:
+                return 200, cache.revalidate(cache_key, cache_entry, resp_headers).body
+            if status == 200:
+                cache.store(cache_key, resp_headers, body)
+
+        return status, body
+
+    async def _call(self, api_call):
+        # the catalog's SQLite lookups take microseconds, they run on the loop
+        catalog = self.catalog
+        if catalog is None:
+            return await self._fetch(api_call)
+        body = catalog.lookup(api_call)
+        if body is not None:
+            if self.hooks:
+                self.hooks.request(RequestEvent(api_call.template, api_call.method, 200, 0.0, 0, 0, True))
+            return body
+        try:
+            body = await self._fetch(api_call)
+        except Exception as err:
+            body = catalog.fallback(api_call, err)
+            if body is None:
+                raise
+            return body
+        if api_call.decode:
+            catalog.store(api_call, body)
+        return body
+
+    async def _fetch(self, api_call):
+        if self.coalescer and api_call.method == 'GET':
+            headers = await self._get_headers()
+            key = request_key(api_call, getattr(self.auth_manager, 'scope', None), headers.get('Authorization'))
+            return await self.coalescer.do_async(key, lambda: self._send(api_call))
+        return await self._send(api_call)
+
+    async def _send(self, api_call):
+        status, body = await self._api_request(method=api_call.method, url_path=api_call.url_path,
+                                               params=api_call.params, data=api_call.data,
+                                               endpoint=api_call.template, idempotent=api_call.idempotent)
+        if api_call.no_content and status == 204:
+            raise SpotifyRequestNoContent
+        return self.decoder(body) if api_call.decode else body
+
+    ## Album
+
+    getAlbum = _endpoint(endpoints.getAlbum)
+    getAlbumTracks = _endpoint(endpoints.getAlbumTracks)
+    iterAlbumTracks = _paged_endpoint(endpoints.getAlbumTracks)
+    getAlbums = _batch_endpoint(endpoints.getAlbums)
+
+    ## Artist
+
+    getArtist = _endpoint(endpoints.getArtist)
+    getArtistAlbums = _endpoint(endpoints.getArtistAlbums)
+    iterArtistAlbums = _paged_endpoint(endpoints.getArtistAlbums)
+    getRelatedArtists = _endpoint(endpoints.getRelatedArtists)
+    getArtists = _batch_endpoint(endpoints.getArtists)
+
+    ## Track
+
+    getTracks = _batch_endpoint(endpoints.getTracks)
+    getAudioFeatures = _batch_endpoint(endpoints.getAudioFeatures)
+
+    ## Misc
+
+    search = _endpoint(endpoints.search)
+    iterSearch = _paged_endpoint(endpoints.search)
+    getCategories = _endpoint(endpoints.getCategories)
+    iterCategories = _paged_endpoint(endpoints.getCategories)
+    getCategoryPlaylist = _endpoint(endpoints.getCategoryPlaylist)
+    iterCategoryPlaylist = _paged_endpoint(endpoints.getCategoryPlaylist)
+    getAvalGenres = _endpoint(endpoints.getAvalGenres)
+
+    ## User
+
+    getUserAvaliableDevices = _endpoint(endpoints.getUserAvaliableDevices)
+    getUserCurrentPlayback = _endpoint(endpoints.getUserCurrentPlayback)
+    getUserCurrentTrack = _endpoint(endpoints.getUserCurrentTrack)
+    pauseUserPlayback = _endpoint(endpoints.pauseUserPlayback)
+    startOrResumeUserPlayback = _endpoint(endpoints.startOrResumeUserPlayback)
@@ -2,13 +2,17 @@ import os
 import requests
 from urllib.parse import urlparse, parse_qs, urljoin, quote
 import time
-import json
 from base64 import b64encode, urlsafe_b64encode
 import hashlib
+import logging
 import random
+import sqlite3
 import string
+import threading
 
 from spotifyapi.common import logger
+from spotifyapi.metrics import TokenEvent
+from spotifyapi.tokenstore import FileTokenStore, MemoryTokenStore
 
 
 CLIENT_CREDS_ENV_VARS = {
@@ -18,6 +22,17 @@ CLIENT_CREDS_ENV_VARS = {
     "redirect_uri": "SPOTIFY_REDIRECT_URI",
 }
 
+class _LazyCtime():
+    """ Log argument formatting a timestamp only when the record is emitted """
+    __slots__ = ('timestamp',)
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return time.ctime(int(self.timestamp))
+
+
 class Scope():
     def __init__(self, scope_list=None):
         if isinstance(scope_list, list):
@@ -59,8 +74,10 @@ class AuthFlowBase():
     AUTH_CODE_URL = 'https://accounts.spotify.com/authorize'
     AUTH_TOKEN_URL = 'https://accounts.spotify.com/api/token'
 
-    def __init__(self, request_session, cache_token_path='.cached_spotify_token'):
-        if isinstance(request_session, requests.Session):
+    def __init__(self, request_session, cache_token_path='.cached_spotify_token', token_store=None):
+        # a session from spotifyapi.transport (or any requests.Session) can be shared with the Spotify client
+        self._own_session = isinstance(request_session, bool)
+        if not self._own_session:
             self._session = request_session
         else:
             if request_session:
@@ -68,11 +85,17 @@ class AuthFlowBase():
             else:
                 self._session = requests.api
         self.cache_token_path = cache_token_path
+        # spotifyapi.tokenstore: FileTokenStore(cache_token_path) by default
+        self.token_store = token_store or FileTokenStore(cache_token_path)
         self.token_info = None
+        self._clock = time.time
+        self._token_lock = threading.RLock()
+        # spotifyapi.metrics.Hooks getting a TokenEvent for every token request
+        self.hooks = None
 
     def __del__(self):
         """Make sure the connection (pool) gets closed"""
-        if isinstance(self._session, requests.Session):
+        if self._own_session and isinstance(self._session, requests.Session):
             self._session.close()
 
     def _enshure_creds(self, value, env_key):
@@ -119,34 +142,136 @@ class AuthFlowBase():
         letters_and_digits = string.ascii_letters + string.digits
         return ''.join((random.choice(letters_and_digits) for i in range(length)))
 
-    def _get_cached_token(self) -> None:
-        token_info = None
+    def get_token(self) -> str:
+        """ Return a valid access token
+
+        The validated token is kept in memory, so the cache file and the accounts service
+        are only touched on first use or when the token is close to `expires_at`.
+        """
+        if self.token_info and not self._is_token_expired():
+            return self.token_info['access_token']
+        with self._token_lock, self.token_store.lock():
+            # somebody could get a new token while we were waiting for the lock
+            if self.token_info and not self._is_token_expired():
+                return self.token_info['access_token']
+            return self._instrumented('get', self._get_token)
+
+    def refresh(self, margin=60) -> str:
+        """ Refresh the token if it expires in less than `margin` seconds
+
+        Only one refresh is in flight at a time: concurrent callers wait for it and reuse its result.
+        """
+        with self._token_lock, self.token_store.lock():
+            if not self.token_info:
+                return self._instrumented('get', self._get_token)
+            # another process could refresh it already
+            stored = self._get_cached_token()
+            if stored and stored.get('expires_at', 0) > self.token_info['expires_at'] and self._is_compatible(stored):
+                self.token_info = stored
+            if self._is_token_expired(margin):
+                self._instrumented('refresh', self._refresh_authorization_token)
+            return self.token_info['access_token']
+
+    def start_refresher(self, margin=300, retry_interval=30) -> 'TokenRefresher':
+        """ Start renewing the token on a background thread `margin` seconds before `expires_at` """
+        refresher = TokenRefresher(self, margin=margin, retry_interval=retry_interval)
+        refresher.start()
+        return refresher
+
+    def _instrumented(self, action, fn):
+        hooks = self.hooks
+        if not hooks:
+            return fn()
+        start = time.perf_counter()
+        error = None
         try:
-            with open(self.cache_token_path, 'r') as f:
-                token_info = json.load(f)
-                logger.info('Got cached token')
-        except (IOError, json.decoder.JSONDecodeError) as e:
-            logger.warning(f'Can not get token from {self.cache_token_path}: {e}')
-        # self.token_info = token_info
-        return token_info
-
-    def _is_token_expired(self) -> bool:
-        now = int(time.time())
-        return self.token_info["expires_at"] - now < 60
+            return fn()
+        except Exception as err:
+            error = err.__class__.__name__
+            raise
+        finally:
+            hooks.token(TokenEvent(self.__class__.__name__, action, time.perf_counter() - start, error))
+
+    def _get_token(self) -> str:
+        raise NotImplementedError
+
+    def _get_cached_token(self) -> dict:
+        return self.token_store.load()
+
+    def _is_compatible(self, token_info) -> bool:
+        """ Whether a stored token can be used by this auth manager """
+        scope = getattr(self, 'scope', None)
+        return scope is None or Scope(token_info.get('scope')) == scope
+
+    def _refresh_margin(self, margin) -> float:
+        """ `margin` clamped to half the token lifetime: with a longer one every new token would be due at once """
+        lifetime = self.token_info.get('expires_in') if self.token_info else None
+        return min(margin, lifetime / 2) if lifetime else margin
+
+    def _is_token_expired(self, margin=60) -> bool:
+        now = int(self._clock())
+        return self.token_info["expires_at"] - now < self._refresh_margin(margin)
 
     def _cache_token(self) -> None:
         try:
             if not self.token_info.get('refresh_token'):
                 logger.debug('No refresh token in a new token!!!')
                 _tk = self._get_cached_token()
-                self.token_info['refresh_token'] = _tk['refresh_token']
-            with open(self.cache_token_path, 'w') as f:
-                json.dump(self.token_info, f)
-        except IOError as e:
-            logger.warning(f'Can not save token in {self.cache_token_path}: {e}')
+                if _tk and _tk.get('refresh_token'):
+                    self.token_info['refresh_token'] = _tk['refresh_token']
+            self.token_store.save(self.token_info)
+        except (IOError, sqlite3.Error) as e:
+            logger.warning('Can not save token in %s: %s', self.token_store, e)
 
     def _clean_cache(self) -> None:
-        os.remove(self.cache_token_path)
+        self.token_store.clear()
+
+class TokenRefresher():
+    """ Renews the token of an auth manager ahead of `expires_at` on a background thread
+
+    Requests keep using the still valid token while the refresh is going on.
+    The refresher never starts an interactive authorization: until the auth manager
+    has got its first token it just waits.
+    """
+
+    def __init__(self, auth_manager, margin=300, retry_interval=30):
+        self.auth_manager = auth_manager
+        self.margin = margin
+        self.retry_interval = retry_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='spotify-token-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> float:
+        """ Refresh the token if it is due and return the number of seconds to the next check """
+        auth_manager = self.auth_manager
+        if not auth_manager.token_info:
+            return self.retry_interval
+        if auth_manager._is_token_expired(self.margin):
+            try:
+                auth_manager.refresh(self.margin)
+            except (AuthFlowError, requests.exceptions.RequestException) as err:
+                logger.warning('Background token refresh failed: %s', err)
+                return self.retry_interval
+        delay = auth_manager.token_info['expires_at'] - auth_manager._refresh_margin(self.margin) - auth_manager._clock()
+        return delay if delay > 0 else self.retry_interval
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._stop_event.wait(self.run_once())
+
 
 class AuthorizationCode(AuthFlowBase):
     """ Authorization Code
@@ -165,10 +290,11 @@ class AuthorizationCode(AuthFlowBase):
                  scope=None,
                  redirect_uri=None,
                  show_dialog=False,
-                 cache_token_path='.cached_spotify_token'
+                 cache_token_path='.cached_spotify_token',
+                 token_store=None
                  ):
 
-        super(AuthorizationCode, self).__init__(request_session, cache_token_path)
+        super(AuthorizationCode, self).__init__(request_session, cache_token_path, token_store)
 
         self.client_id = client_id
         self.client_secret = client_secret
@@ -176,15 +302,15 @@ class AuthorizationCode(AuthFlowBase):
         self.redirect_uri = redirect_uri
         self.show_dialog = show_dialog
 
-    def get_token(self) -> str:
+    def _get_token(self) -> str:
         logger.info('Authorizing with Authorization Code Flow')
         self.token_info = self._get_cached_token()
 
         if self.token_info:
-            logger.debug(f'Cached token: {self.token_info["access_token"][:10]}...')
+            logger.debug('Cached token: %.10s...', self.token_info['access_token'])
             if Scope(self.token_info['scope']) == self.scope:
                 if self._is_token_expired():
-                    logger.debug(f'Token expired at {time.ctime(int(self.token_info["expires_at"]))}. Refreshing token...')
+                    logger.debug('Token expired at %s. Refreshing token...', _LazyCtime(self.token_info['expires_at']))
                     try:
                         self._refresh_authorization_token()
                     except AuthFlowRequestError as err:
@@ -199,7 +325,8 @@ class AuthorizationCode(AuthFlowBase):
         else:
             self._get_authorization_token()
 
-        logger.info(f'Authorization complite. Token {self.token_info["access_token"][:10]}... will be expire at {time.ctime(int(self.token_info["expires_at"]))}')
+        logger.info('Authorization complite. Token %.10s... will be expire at %s',
+                    self.token_info['access_token'], _LazyCtime(self.token_info['expires_at']))
         return self.token_info['access_token']
 
     def _get_authorization_code(self) -> str:
@@ -279,7 +406,7 @@ class AuthorizationCode(AuthFlowBase):
             logger.error('Getting responce token error')
             raise AuthFlowRequestError(error=result['error'], error_descr=result['error_description'], code=resp.status_code)
         self.token_info = resp.json() # {'access_token': 'BQ...', 'token_type': 'Bearer', 'expires_in': 3600, 'refresh_token': 'AQ...', 'scope': '...'}
-        self.token_info['expires_at'] = int(time.time()) + self.token_info["expires_in"]
+        self.token_info['expires_at'] = int(self._clock()) + self.token_info["expires_in"]
 
         if cache_token:
             self._cache_token()
@@ -302,9 +429,10 @@ class AuthorizationCode(AuthFlowBase):
             result = resp.json()
             logger.error('Getting responce token error')
             raise AuthFlowRequestError(error=result['error'], error_descr=result['error_description'], code=resp.status_code)
-        logger.debug(resp.text)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(resp.text)
         self.token_info = resp.json()
-        self.token_info['expires_at'] = int(time.time()) + self.token_info["expires_in"]
+        self.token_info['expires_at'] = int(self._clock()) + self.token_info["expires_in"]
         if cache_token:
             self._cache_token()
 
@@ -327,23 +455,24 @@ class AuthorizationCodeWithPKCE(AuthFlowBase):
                  request_session=True,
                  scope=None,
                  redirect_uri=None,
-                 cache_token_path='.cached_spotify_token'
+                 cache_token_path='.cached_spotify_token',
+                 token_store=None
                  ):
-        super(AuthorizationCodeWithPKCE, self).__init__(request_session, cache_token_path)
+        super(AuthorizationCodeWithPKCE, self).__init__(request_session, cache_token_path, token_store)
 
         self.client_id = client_id
         self.scope = Scope(scope)
         self.redirect_uri = redirect_uri
 
-    def get_token(self) -> str:
+    def _get_token(self) -> str:
         logger.info('Authorizing with Authorization Code Flow')
         self.token_info = self._get_cached_token()
 
         if self.token_info:
-            logger.debug(f'Cached token: {str(self.token_info)[:25]}...')
+            logger.debug('Cached token: %.25s...', self.token_info)
             if Scope(self.token_info['scope']) == self.scope:
                 if self._is_token_expired():
-                    logger.debug(f'Token expired at {time.ctime(int(self.token_info["expires_at"]))}. Refreshing token...')
+                    logger.debug('Token expired at %s. Refreshing token...', _LazyCtime(self.token_info['expires_at']))
                     try:
                         self._refresh_authorization_token()
                     except AuthFlowRequestError as err:
@@ -358,7 +487,8 @@ class AuthorizationCodeWithPKCE(AuthFlowBase):
         else:
             self._get_authorization_token()
 
-        logger.info(f'Authorization complite. Token "{self.token_info["access_token"][:7]}..." will be expire at {time.ctime(int(self.token_info["expires_at"]))}')
+        logger.info('Authorization complite. Token "%.7s..." will be expire at %s',
+                    self.token_info['access_token'], _LazyCtime(self.token_info['expires_at']))
         return self.token_info['access_token']
 
     def _generate_consts(self) -> tuple:
@@ -437,7 +567,7 @@ class AuthorizationCodeWithPKCE(AuthFlowBase):
             raise AuthFlowRequestError(error=result['error'], error_descr=result['error_description'], code=resp.status_code)
 
         self.token_info = resp.json()
-        self.token_info['expires_at'] = int(time.time()) + self.token_info["expires_in"]
+        self.token_info['expires_at'] = int(self._clock()) + self.token_info["expires_in"]
 
         if cache_token:
             self._cache_token()
@@ -460,7 +590,7 @@ class AuthorizationCodeWithPKCE(AuthFlowBase):
             logger.error('Getting responce token error')
             raise AuthFlowRequestError(error=result['error'], error_descr=result['error_description'], code=resp.status_code)
         self.token_info = resp.json()
-        self.token_info['expires_at'] = int(time.time()) + self.token_info["expires_in"]
+        self.token_info['expires_at'] = int(self._clock()) + self.token_info["expires_in"]
         if cache_token:
             self._cache_token()
 
@@ -468,4 +598,82 @@ class ImplicitGrant(AuthFlowBase):
     pass
 
 class ClientCredentials(AuthFlowBase):
-    pass
\ No newline at end of file
+    """ Client Credentials
+
+    For server-to-server authentication. Only endpoints that do not access user information
+    can be accessed. There is no user interaction and no refresh token: a new access token is
+    requested whenever the old one gets close to `expires_at`.
+
+    The token is kept in memory (`MemoryTokenStore`) unless another token store is passed.
+    One instance can be shared by many threads and `Spotify` clients.
+
+    refresh_margin:   When the token expires in less than that many seconds, callers keep
+                      using it while a new one is requested on a background thread.
+    """
+
+    def __init__(self,
+                 client_id=None,
+                 client_secret=None,
+                 request_session=True,
+                 token_store=None,
+                 refresh_margin=300
+                 ):
+        super(ClientCredentials, self).__init__(request_session, token_store=token_store or MemoryTokenStore())
+
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self._refresh_thread = None
+
+    def get_token(self) -> str:
+        token_info = self.token_info
+        if token_info and not self._is_token_expired() and self._is_token_expired(self.refresh_margin):
+            self._refresh_in_background()
+            return token_info['access_token']
+        return super(ClientCredentials, self).get_token()
+
+    def _refresh_in_background(self) -> None:
+        with self._token_lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh, name='spotify-token-refresh',
+                                                    daemon=True)
+            self._refresh_thread.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh(self.refresh_margin)
+        except (AuthFlowError, requests.exceptions.RequestException) as err:
+            logger.warning('Background token refresh failed: %s', err)
+
+    def _get_token(self) -> str:
+        logger.info('Authorizing with Client Credentials Flow')
+        self.token_info = self._get_cached_token()
+
+        if not self.token_info or self._is_token_expired():
+            self._refresh_authorization_token()
+
+        return self.token_info['access_token']
+
+    def _refresh_authorization_token(self, cache_token=True) -> None:
+        """ POST https://accounts.spotify.com/api/token
+
+        POST data: grant_type=client_credentials
+        Headers: Base 64 encoded string that contains the client ID and client secret key.
+
+        Return: access_token, token_type=“bearer”, expires_in
+        """
+
+        logger.info('Get client credentials token')
+        headers = self._make_authorization_headers(self._client_id, self._client_secret)
+
+        resp = self._session.post(url=self.AUTH_TOKEN_URL, headers=headers, data={'grant_type': 'client_credentials'})
+        if resp.status_code != 200:
+            result = resp.json()
+            logger.error('Getting responce token error')
+            raise AuthFlowRequestError(error=result['error'], error_descr=result.get('error_description'),
+                                       code=resp.status_code)
+        self.token_info = resp.json()
+        self.token_info['expires_at'] = int(self._clock()) + self.token_info["expires_in"]
+        if cache_token:
+            self._cache_token()
\ No newline at end of file
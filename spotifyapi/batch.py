@@ -0,0 +1,64 @@
+""" Lookups of many IDs through the "Get Several ..." endpoints
+
+IDs are de-duplicated and split into chunks of the maximum size the endpoint accepts,
+so resolving N IDs takes N / max_ids requests instead of N.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from spotifyapi.exceptions import SpotifyError
+
+
+__all__ = [
+    "get_several",
+    "get_several_async"
+]
+
+
+def _id_list(ids) -> list:
+    # a string would be split into one-character IDs
+    if isinstance(ids, str):
+        raise SpotifyError(f'Pass a list of IDs, not the string "{ids}"')
+    return list(ids)
+
+def _split(build, ids, args, kwargs) -> tuple:
+    unique_ids = list(dict.fromkeys(ids))
+    size = build.max_ids
+    chunks = [unique_ids[i:i + size] for i in range(0, len(unique_ids), size)]
+    return chunks, [build(chunk, *args, **kwargs) for chunk in chunks]
+
+def _merge(ids, chunks, api_calls, bodies, model) -> list:
+    found = dict()
+    for chunk, api_call, body in zip(chunks, api_calls, bodies):
+        found.update(zip(chunk, body[api_call.result_key]))
+    if model:
+        found = {id: model(item) for id, item in found.items() if item is not None}
+    return [found.get(id) for id in ids]
+
+def get_several(call, build, ids, *args, workers=None, model=None, **kwargs) -> list:
+    """ Look up `ids` with the endpoint `build` (marked with `endpoints.max_ids`)
+
+    call:      function sending an ApiCall and returning the decoded body (`Spotify._call`)
+    ids:       any iterable of Spotify IDs
+    workers:   Optional. Send the chunks with that many concurrent requests.
+    model:     Optional. spotifyapi.models class to wrap every found object into.
+
+    Returns objects in the order of `ids`, None for IDs Spotify has not found.
+    """
+    ids = _id_list(ids)
+    chunks, api_calls = _split(build, ids, args, kwargs)
+
+    if workers and workers > 1 and len(api_calls) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(api_calls))) as executor:
+            bodies = list(executor.map(call, api_calls))
+    else:
+        bodies = map(call, api_calls)
+
+    return _merge(ids, chunks, api_calls, bodies, model)
+
+async def get_several_async(call, build, ids, *args, model=None, **kwargs) -> list:
+    """ `get_several` for `AsyncSpotify`: the chunks are always sent concurrently """
+    ids = _id_list(ids)
+    chunks, api_calls = _split(build, ids, args, kwargs)
+    bodies = await asyncio.gather(*(call(api_call) for api_call in api_calls))
+    return _merge(ids, chunks, api_calls, bodies, model)
@@ -0,0 +1,394 @@
+""" End-to-end benchmarks against the local mock API
+
+Runs the main call patterns of the clients against `spotifyapi.mockserver.MockSpotify` and
+reports calls/s, p50/p99 latency per call, the connections the mock accepted, its TLS handshakes
+and, with --memory, the peak of Python allocations. The tls_* scenarios run against the mock
+over HTTPS, where a new connection costs a handshake.
+The overhead_* scenarios answer from a no-op transport instead: what they measure is the
+client's own cost per request (building, sending through requests, decoding).
+
+    python -m spotifyapi.bench
+    python -m spotifyapi.bench --scenario get_album --calls 2000 --latency 0.005 --json base.json
+    python -m spotifyapi.bench --compare base.json      # exits with 1 on a regression
+    python -m spotifyapi.bench --scenario processes_search --latency 0.01 --threads 1 --threads 2 --threads 4 --threads 8
+
+Results depend on the machine: compare runs made on the same host.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import BaseAdapter
+
+from spotifyapi import endpoints
+from spotifyapi.auth import AuthorizationCode
+from spotifyapi.cache import MemoryCache, ResponseCache
+from spotifyapi.catalog import CatalogStore
+from spotifyapi.common import logger
+from spotifyapi.decoders import DECODERS
+from spotifyapi.metrics import Hooks, Metrics
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.pipeline import Pipeline
+from spotifyapi.processes import ProcessRunner
+from spotifyapi.tokenstore import FileTokenStore
+from spotifyapi.transport import create_session
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import h2
+    import httpx
+except ImportError:
+    h2 = httpx = None
+
+
+__all__ = [
+    "SCENARIOS",
+    "MOCK_KWARGS",
+    "run_scenario",
+    "compare"
+]
+
+
+def _timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+def _get_album(mock, calls, threads):
+    sp = mock.spotify()
+    return [_timed(sp.getAlbum, f'album{n}') for n in range(calls)]
+
+def _get_album_threads(mock, calls, threads):
+    sp = mock.spotify()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda n: _timed(sp.getAlbum, f'album{n}'), range(calls)))
+
+def _get_album_no_keep_alive(mock, calls, threads):
+    sp = mock.spotify(request_session=mock.session(keep_alive=False))
+    return [_timed(sp.getAlbum, f'album{n}') for n in range(calls)]
+
+def _get_album_no_session(mock, calls, threads):
+    # requests.api: a new connection for every call
+    sp = mock.spotify(request_session=False)
+    return [_timed(sp.getAlbum, f'album{n}') for n in range(calls)]
+
+def _get_album_threads_small_pool(mock, calls, threads, pool_block=False):
+    # 2 kept connections for all the threads: the others are opened and closed per call, or wait
+    sp = mock.spotify(request_session=mock.session(pool_maxsize=2, pool_block=pool_block))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda n: _timed(sp.getAlbum, f'album{n}'), range(calls)))
+
+def _get_album_http2(mock, calls, threads):
+    # the threads share one connection, their calls are multiplexed over it
+    sp = mock.spotify(request_session=mock.session(http2=True))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda n: _timed(sp.getAlbum, f'album{n}'), range(calls)))
+
+def _get_album_cached(mock, calls, threads):
+    sp = mock.spotify(cache=ResponseCache(MemoryCache()))
+    return [_timed(sp.getAlbum, f'album{n % 10}') for n in range(calls)]
+
+def _get_album_catalog(mock, calls, threads):
+    sp = mock.spotify(catalog=CatalogStore(':memory:'))
+    return [_timed(sp.getAlbum, f'album{n % 10}') for n in range(calls)]
+
+def _get_album_models(mock, calls, threads):
+    sp = mock.spotify(models=True)
+
+    def call(n):
+        album = sp.getAlbum(f'album{n}')
+        return album.name, album.artists[0].name, album.tracks.items[0].name
+    return [_timed(call, n) for n in range(calls)]
+
+def _hold_album_tracks(mock, calls, threads, models=False):
+    # the tracks stay referenced: run with --memory to compare dicts and models
+    sp = mock.spotify(models=models)
+    tracks = []
+    return [_timed(lambda: tracks.extend(sp.iterAlbumTracks(f'album{n}', limit=50))) for n in range(calls // 3 or 1)]
+
+def _get_albums_batch(mock, calls, threads):
+    sp = mock.spotify()
+    ids = [f'album{n}' for n in range(100)]
+    return [_timed(sp.getAlbums, ids) for _ in range(calls // 5 or 1)]
+
+def _iter_album_tracks(mock, calls, threads):
+    sp = mock.spotify()
+    return [_timed(lambda: list(sp.iterAlbumTracks(f'album{n}', limit=20))) for n in range(calls // 6 or 1)]
+
+def _iter_album_tracks_parallel(mock, calls, threads):
+    sp = mock.spotify()
+    return [_timed(lambda: list(sp.iterAlbumTracks(f'album{n}', limit=20, workers=threads)))
+            for n in range(calls // 6 or 1)]
+
+def _iter_album_tracks_catalog(mock, calls, threads):
+    sp = mock.spotify(catalog=CatalogStore(':memory:'))
+    return [_timed(lambda: list(sp.iterAlbumTracks(f'album{n % 10}', limit=20))) for n in range(calls // 6 or 1)]
+
+def _search(mock, calls, threads):
+    sp = mock.spotify()
+    return [_timed(sp.search, f'query {n}', 'track', limit=50) for n in range(calls)]
+
+def _search_in_worker(client, n):
+    start = time.perf_counter()
+    client.search(f'query {n}', 'track', limit=50)
+    return time.perf_counter() - start
+
+def _decode_search(mock, calls, threads, decoder):
+    # a search page of 50 tracks as the mock answers it, decoded over and over
+    body = mock.spotify().search('query', 'track', limit=50, raw=True)
+    return [_timed(decoder, body) for _ in range(calls)]
+
+def _processes_search(mock, calls, threads):
+    with ProcessRunner(mock.auth_manager(), workers=threads, api_url=mock.api_url) as runner:
+        # worker processes start and connect before the calls are timed
+        list(runner.map_unordered(_search_in_worker, range(threads)))
+        start = time.perf_counter()
+        durations = list(runner.map_unordered(_search_in_worker, range(calls)))
+        # the caller's clock includes the start-up, the throughput of the calls does not
+        return durations, time.perf_counter() - start
+
+class _NoopAdapter(BaseAdapter):
+    """ Transport answering every request with the same body, without a connection """
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+
+    def send(self, request, **kwargs):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = request.url
+        resp.request = request
+        resp._content = self.body
+        return resp
+
+    def close(self):
+        pass
+
+def _overhead(mock, calls, fn, **client_kwargs):
+    # the body the mock answers, then the same calls without the network
+    session = create_session()
+    adapter = _NoopAdapter(fn(mock.spotify(), 0, raw=True))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    sp = mock.spotify(request_session=session, **client_kwargs)
+    fn(sp, 0)
+    start = time.perf_counter()
+    return [_timed(fn, sp, n) for n in range(calls)], time.perf_counter() - start
+
+def _overhead_get_album(mock, calls, threads, **client_kwargs):
+    return _overhead(mock, calls, lambda sp, n, **kwargs: sp.getAlbum(f'album{n}', market='US', **kwargs),
+                     **client_kwargs)
+
+def _overhead_get_album_metrics(mock, calls, threads):
+    # compare with overhead_get_album: the cost of the hooks per request
+    return _overhead_get_album(mock, calls, threads, hooks=Hooks(Metrics()))
+
+def _overhead_get_album_debug_log(mock, calls, threads):
+    # compare with overhead_get_album: the library's records at DEBUG, formatted and written to devnull
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        return _overhead_get_album(mock, calls, threads)
+    finally:
+        logger.setLevel(level)
+        logger.removeHandler(handler)
+        handler.stream.close()
+
+def _get_headers(mock, calls, threads, from_disk=False):
+    # the Authorization header of every call, from a token file: by default it is read once and the token
+    # kept in memory, from_disk reads and validates the file under its lock on every call
+    with tempfile.TemporaryDirectory() as directory:
+        store = FileTokenStore(os.path.join(directory, 'token'))
+        store.save({'access_token': 'token', 'token_type': 'Bearer', 'refresh_token': 'refresh', 'scope': '',
+                    'expires_in': 3600, 'expires_at': int(time.time()) + 3600})
+        auth = AuthorizationCode('id', 'secret', request_session=False, redirect_uri='http://127.0.0.1/',
+                                 token_store=store)
+        sp = mock.spotify(auth_manager=auth)
+
+        def call():
+            if from_disk:
+                auth.token_info = None
+            sp._get_headers()
+
+        start = time.perf_counter()
+        return [_timed(call) for _ in range(calls)], time.perf_counter() - start
+
+def _overhead_search(mock, calls, threads):
+    return _overhead(mock, calls, lambda sp, n, **kwargs: sp.search(f'query {n}', 'track', limit=50, offset=50, **kwargs))
+
+def _async_get_album(mock, calls, threads):
+    async def run():
+        async with mock.async_spotify(max_concurrency=threads) as sp:
+            async def call(n):
+                start = time.perf_counter()
+                await sp.getAlbum(f'album{n}')
+                return time.perf_counter() - start
+            return await asyncio.gather(*(call(n) for n in range(calls)))
+    return asyncio.run(run())
+
+def _album_chain(depth):
+    start = time.perf_counter()
+    for n in range(depth):
+        yield endpoints.getAlbum(f'album{n}')
+    return time.perf_counter() - start
+
+def _pipeline(mock, calls, threads, depth):
+    # seconds per job: about `depth` round trips however many jobs run, while workers suffice
+    results = Pipeline(mock.spotify(), workers=threads).run(_album_chain, [depth] * (calls // depth or 1))
+    return [result.value for result in results]
+
+# name: (function(mock, calls, threads) -> seconds per call, description)
+# a function can return (seconds per call, seconds of the calls) to keep its set-up off the clock
+SCENARIOS = {
+    'get_album': (_get_album, 'getAlbum, one thread'),
+    'get_album_threads': (_get_album_threads, 'getAlbum, a thread pool sharing one client'),
+    'get_album_no_keep_alive': (_get_album_no_keep_alive, 'getAlbum, create_session(keep_alive=False)'),
+    'get_album_no_session': (_get_album_no_session, 'getAlbum, request_session=False'),
+    'get_album_threads_small_pool': (_get_album_threads_small_pool, 'getAlbum, thread pool, pool_maxsize=2'),
+    'get_album_threads_pool_block': (functools.partial(_get_album_threads_small_pool, pool_block=True),
+                                     'getAlbum, thread pool, pool_maxsize=2, pool_block=True'),
+    'get_album_cached': (_get_album_cached, 'getAlbum of 10 IDs with ResponseCache'),
+    'get_album_catalog': (_get_album_catalog, 'getAlbum of 10 IDs with CatalogStore in memory'),
+    'get_album_models': (_get_album_models, 'getAlbum with models=True, nested fields read'),
+    'hold_album_tracks': (_hold_album_tracks, 'tracks of many albums kept in memory as dicts'),
+    'hold_album_tracks_models': (functools.partial(_hold_album_tracks, models=True),
+                                 'tracks of many albums kept in memory as models'),
+    'get_albums_batch': (_get_albums_batch, 'getAlbums of 100 IDs (5 requests per call)'),
+    'iter_album_tracks': (_iter_album_tracks, 'iterAlbumTracks, 6 pages in sequence'),
+    'iter_album_tracks_parallel': (_iter_album_tracks_parallel, 'iterAlbumTracks, pages fetched in parallel'),
+    'iter_album_tracks_catalog': (_iter_album_tracks_catalog, 'iterAlbumTracks of 10 albums with CatalogStore'),
+    'search': (_search, 'search of 50 tracks'),
+    'pipeline_depth_1': (functools.partial(_pipeline, depth=1), 'Pipeline of calls/1 jobs of 1 getAlbum, per job'),
+    'pipeline_depth_4': (functools.partial(_pipeline, depth=4),
+                         'Pipeline of calls/4 jobs of 4 dependent getAlbum, per job'),
+    'processes_search': (_processes_search, 'search of 50 tracks from ProcessRunner worker processes'),
+    'overhead_get_album': (_overhead_get_album, 'getAlbum answered by a no-op transport'),
+    'overhead_get_album_metrics': (_overhead_get_album_metrics, 'getAlbum answered by a no-op transport, Metrics hooks'),
+    'overhead_get_album_debug_log': (_overhead_get_album_debug_log,
+                                     'getAlbum answered by a no-op transport, DEBUG logging on'),
+    'overhead_search': (_overhead_search, 'search answered by a no-op transport'),
+    'overhead_get_headers': (_get_headers, 'Spotify._get_headers, token file read once'),
+    'overhead_get_headers_from_disk': (functools.partial(_get_headers, from_disk=True),
+                                       'Spotify._get_headers, token file read on every call'),
+    'tls_get_album_threads': (_get_album_threads, 'getAlbum over TLS, a thread pool sharing one client'),
+    'tls_get_album_threads_small_pool': (_get_album_threads_small_pool, 'getAlbum over TLS, thread pool, pool_maxsize=2'),
+    'tls_get_album_threads_pool_block': (functools.partial(_get_album_threads_small_pool, pool_block=True),
+                                         'getAlbum over TLS, thread pool, pool_maxsize=2, pool_block=True'),
+    'tls_get_album_no_keep_alive': (_get_album_no_keep_alive, 'getAlbum over TLS, create_session(keep_alive=False)'),
+}
+for _name, _decoder in DECODERS.items():
+    SCENARIOS[f'decode_search_{_name}'] = (functools.partial(_decode_search, decoder=_decoder),
+                                           f'{_name} decoding a search page of 50 tracks')
+if aiohttp is not None:
+    SCENARIOS['async_get_album'] = (_async_get_album, 'AsyncSpotify.getAlbum, concurrent')
+if h2 is not None and httpx is not None:
+    SCENARIOS['tls_get_album_http2'] = (_get_album_http2, 'getAlbum over HTTP/2 (HTTP2Session), thread pool')
+
+# scenario name: MockSpotify keyword arguments
+MOCK_KWARGS = {name: {'http2': True} if name.endswith('_http2') else {'tls': True}
+               for name in SCENARIOS if name.startswith('tls_')}
+
+
+def _percentile(values, q) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run_scenario(name, calls=500, threads=8, latency=0, memory=False) -> dict:
+    """ Run one scenario against a fresh mock. Latencies are in milliseconds, memory in KiB """
+    fn = SCENARIOS[name][0]
+    with MockSpotify(latency=latency, cache_max_age=3600, **MOCK_KWARGS.get(name, {})) as mock:
+        # token and connections are set up before the clock starts
+        mock.spotify().getAlbum('warmup')
+        if memory:
+            tracemalloc.start()
+        connections, handshakes = mock.connections, mock.handshakes
+        start = time.perf_counter()
+        durations = fn(mock, calls, threads)
+        elapsed = time.perf_counter() - start
+        connections, handshakes = mock.connections - connections, mock.handshakes - handshakes
+        if isinstance(durations, tuple):
+            durations, elapsed = durations
+        peak = None
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+    return {'scenario': name, 'threads': threads, 'calls': len(durations), 'seconds': elapsed, 'calls_per_sec': len(durations) / elapsed,
+            'p50_ms': _percentile(durations, 0.5) * 1000, 'p99_ms': _percentile(durations, 0.99) * 1000,
+            'peak_kib': peak, 'connections': connections, 'handshakes': handshakes}
+
+def compare(results, baseline, tolerance=0.2) -> list:
+    """ Regressions of `results` against `baseline` beyond `tolerance`, as messages """
+    baseline = {(result['scenario'], result.get('threads')): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get((result['scenario'], result['threads'])) or baseline.get((result['scenario'], None))
+        if base is None:
+            continue
+        if result['calls_per_sec'] < base['calls_per_sec'] * (1 - tolerance):
+            regressions.append(f'{result["scenario"]}: {result["calls_per_sec"]:.0f} calls/s, '
+                               f'baseline {base["calls_per_sec"]:.0f}')
+        if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f'{result["scenario"]}: p99 {result["p99_ms"]:.2f} ms, baseline {base["p99_ms"]:.2f}')
+        if result['peak_kib'] and base.get('peak_kib') and result['peak_kib'] > base['peak_kib'] * (1 + tolerance):
+            regressions.append(f'{result["scenario"]}: peak {result["peak_kib"]:.0f} KiB, '
+                               f'baseline {base["peak_kib"]:.0f}')
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m spotifyapi.bench', description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, can be repeated. Default: all')
+    parser.add_argument('--calls', type=int, default=500, help='API calls per scenario')
+    parser.add_argument('--threads', type=int, action='append',
+                        help='workers (threads, processes) of the concurrent scenarios, can be repeated. Default: 8')
+    parser.add_argument('--latency', type=float, default=0, help='seconds the mock adds to every response')
+    parser.add_argument('--memory', action='store_true', help='measure peak allocations (slower)')
+    parser.add_argument('--json', metavar='PATH', help='save the results')
+    parser.add_argument('--compare', metavar='PATH', help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown, 0.2 is 20%%')
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f'{"scenario":<34} {"calls":>6} {"calls/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"peak KiB":>9} {"conns":>6} '
+          f'{"hshakes":>7}')
+    threads_list = args.threads or [8]
+    for name, threads in ((name, threads) for name in args.scenario or SCENARIOS for threads in threads_list):
+        result = run_scenario(name, args.calls, threads, args.latency, args.memory)
+        results.append(result)
+        peak = f'{result["peak_kib"]:9.0f}' if result['peak_kib'] is not None else f'{"-":>9}'
+        label = f'{name}@{threads}' if len(threads_list) > 1 else name
+        print(f'{label:<34} {result["calls"]:>6} {result["calls_per_sec"]:>9.0f} {result["p50_ms"]:>8.2f} '
+              f'{result["p99_ms"]:>8.2f} {peak} {result["connections"]:>6} '
+              f'{result["handshakes"]:>7}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+""" HTTP response cache
+
+Catalog data (albums, artists, genres, categories) changes rarely. `ResponseCache` keeps
+GET responses, serves them while `Cache-Control: max-age` says they are fresh and then
+revalidates them with `If-None-Match`, so a 304 costs a round trip but no body.
+
+Responses are stored in a backend:
+
+- MemoryCache: in-process LRU with entry count, size and TTL limits;
+- SQLiteCache: a SQLite file, so the cache survives restarts.
+
+User state (everything under `me/`, e.g. `me/player`) and responses depending on the token's
+user (`market=from_token`) are never cached, so one cache can be shared by many users.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from urllib.parse import urlencode, urlparse
+
+
+__all__ = [
+    "CacheEntry",
+    "MemoryCache",
+    "SQLiteCache",
+    "ResponseCache"
+]
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+    stored_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+
+class MemoryCache():
+    """ In-process LRU cache backend
+
+    max_entries:   Maximum number of responses kept.
+    max_bytes:     Optional. Maximum total size of the kept bodies.
+    ttl:           Optional. Seconds after which a response is dropped even if it could be revalidated.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.time() - entry.stored_at > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self._size > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key) -> None:
+        self._size -= len(self._entries.pop(key).body)
+
+
+class SQLiteCache():
+    """ Persistent cache backend in a SQLite file
+
+    path:          Path to the database file.
+    max_entries:   Optional. Maximum number of responses kept, least recently used go first.
+    ttl:           Optional. Seconds after which a response is dropped even if it could be revalidated.
+    """
+
+    def __init__(self, path='.spotify_cache.sqlite', max_entries=None, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             'key TEXT PRIMARY KEY, body BLOB, etag TEXT, expires_at REAL, stored_at REAL, accessed_at REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+
+    def __del__(self):
+        """Make sure the database gets closed"""
+        self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute('SELECT body, etag, expires_at, stored_at FROM responses WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            entry = CacheEntry(*row)
+            if self.ttl is not None and now - entry.stored_at > self.ttl:
+                self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                return None
+            self._db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            return entry
+
+    def set(self, key, entry) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, entry.body, entry.etag, entry.expires_at, entry.stored_at, time.time()))
+            if self.max_entries is not None:
+                self._db.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses '
+                                 'ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def delete(self, key) -> None:
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM responses')
+
+
+def _parse_cache_control(value) -> tuple:
+    """ Returns (no_store, max_age) """
+    no_store, max_age = False, 0
+    for directive in (value or '').split(','):
+        name, _, arg = directive.strip().partition('=')
+        name = name.lower()
+        if name == 'no-store':
+            no_store = True
+        elif name == 'no-cache':
+            max_age = 0
+            break
+        elif name == 'max-age':
+            try:
+                max_age = max(0, int(arg.strip('"')))
+            except ValueError:
+                pass
+    return no_store, max_age
+
+def _is_user_state(url) -> bool:
+    path = urlparse(url).path.rstrip('/') + '/'
+    return '/me/' in path
+
+
+class ResponseCache():
+    """ Cache of GET responses on the request path of `Spotify` and `AsyncSpotify`
+
+    backend:   MemoryCache (default), SQLiteCache or any object with get/set/delete/clear.
+
+    Counters: `hits` (served without a request), `misses`, `revalidations` (304 answers).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations}
+
+    def key(self, method, url, params=None):
+        """ Cache key of a request, None if the request must not be cached """
+        if method != 'GET' or _is_user_state(url):
+            return None
+        if params and params.get('market') == 'from_token':
+            # the market of the token's user
+            return None
+        if params:
+            return f'{url}?{urlencode(sorted(params.items()))}'
+        return url
+
+    def get(self, key):
+        """ Returns the stored entry (fresh or not) or None """
+        entry = self.backend.get(key)
+        with self._lock:
+            if entry is not None and entry.fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def store(self, key, headers, body) -> None:
+        """ Store a 200 response if its headers allow it """
+        no_store, max_age = _parse_cache_control(headers.get('Cache-Control'))
+        etag = headers.get('ETag')
+        if no_store or (not max_age and not etag):
+            return
+        now = time.time()
+        self.backend.set(key, CacheEntry(body=body, etag=etag, expires_at=now + max_age, stored_at=now))
+
+    def revalidate(self, key, entry, headers) -> CacheEntry:
+        """ Prolong a stored entry after a 304 response. `stored_at` stays: the backends' ttl counts from it """
+        _, max_age = _parse_cache_control(headers.get('Cache-Control'))
+        entry = entry._replace(etag=headers.get('ETag') or entry.etag, expires_at=time.time() + max_age)
+        self.backend.set(key, entry)
+        with self._lock:
+            self.revalidations += 1
+        return entry
+
+    def clear(self) -> None:
+        self.backend.clear()
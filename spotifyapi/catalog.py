@@ -0,0 +1,421 @@
+""" Local catalog index
+
+`CatalogStore` keeps the artists, albums and tracks the client receives in a SQLite file,
+indexed by ID, artist -> albums, album -> tracks and artist -> related artists. A client
+created with `catalog=CatalogStore(...)` writes every catalog response through to it and
+answers these calls locally while the stored entries are fresh:
+
+- getAlbum, getArtist, getAlbums, getArtists, getTracks (all the IDs have to be stored);
+- getAlbumTracks, getArtistAlbums, getRelatedArtists (the items of the requested page have
+  to be stored, e.g. by an earlier iterAlbumTracks).
+
+Calls with a market or a country are always sent. `search()` looks names up locally
+(SQLite full-text search, prefix search when FTS5 is missing) before the remote search.
+
+    catalog = CatalogStore('catalog.sqlite', max_age={'artist': 24 * 3600}, max_entities=500000)
+    sp = Spotify(auth_manager=ClientCredentials(...), catalog=catalog)
+    sp.getAlbum('4aawyAB9vmqN3uQ7FjRGTy')     # sent once, then read from catalog.sqlite
+"""
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from spotifyapi import endpoints, models
+from spotifyapi.common import logger
+from spotifyapi.decoders import default_decoder
+from spotifyapi.exceptions import SpotifyCircuitOpen, SpotifyRequestError
+from spotifyapi.retry import TRANSPORT_ERRORS
+
+
+__all__ = [
+    "MAX_AGE",
+    "CatalogStore",
+    "search"
+]
+
+
+DAY = 24 * 3600
+
+# seconds an entry is served without asking Spotify, by entity kind and by list
+MAX_AGE = {
+    'artist': 7 * DAY,          # popularity and followers drift
+    'album': 30 * DAY,
+    'track': 30 * DAY,
+    'album_tracks': 30 * DAY,
+    'artist_albums': DAY,       # new releases
+    'related': 7 * DAY,
+}
+
+# list template: (relation, kind of the owner, kind of the items, body column of the items)
+_LISTS = {
+    'albums/{id}/tracks': ('album_tracks', 'album', 'track', 'simple'),
+    'artists/{id}/albums': ('artist_albums', 'artist', 'album', 'simple'),
+    'artists/{id}/related-artists': ('related', 'artist', 'artist', 'full'),
+}
+_RELATIONS = {relation: (kind, column) for relation, _, kind, column in _LISTS.values()}
+_ENTITIES = {'albums/{id}': 'album', 'artists/{id}': 'artist'}
+_SEVERAL = {'albums': 'album', 'artists': 'artist', 'tracks': 'track'}
+_SEARCH_KINDS = {'artist': 'full', 'album': 'simple', 'track': 'full'}
+
+_EVICT_EVERY = 1000     # entity writes between two checks of max_entities
+
+
+def _encode(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def _parse(api_call) -> tuple:
+    """ (id, params) of a call, `next` URLs of paging objects included """
+    url_path, params = api_call.url_path, api_call.params or {}
+    if '?' in url_path:
+        url_path, query = url_path.split('?', 1)
+        params = dict(parse_qsl(query))
+    segments = urlsplit(url_path).path.strip('/').split('/')
+    template = api_call.template.split('/')
+    id = segments[len(segments) - len(template) + template.index('{id}')] if '{id}' in template else None
+    return id, params
+
+def _is_outage(err) -> bool:
+    """ Failures after which stale entries are better than nothing """
+    if isinstance(err, SpotifyRequestError):
+        return err.status == 429 or (err.status or 0) >= 500
+    return isinstance(err, (SpotifyCircuitOpen,) + TRANSPORT_ERRORS)
+
+
+class CatalogStore():
+    """ SQLite index of catalog entities, written through by the clients
+
+    path:           Database file. ':memory:' keeps the index in the process.
+    max_age:        Seconds entries are fresh: one number, or a dict updating MAX_AGE by kind/list.
+    max_entities:   Optional. The entities fetched the longest ago are dropped above it.
+    stale_if_error: Answer with stale entries when Spotify is unreachable, failing (5xx) or throttling.
+
+    Counters: `hits`, `misses`, `stale_hits` (served after an error), `writes` (entities written).
+    """
+
+    def __init__(self, path='.spotify_catalog.sqlite', max_age=None, max_entities=None, stale_if_error=True):
+        self.path = path
+        if isinstance(max_age, (int, float)):
+            self.max_age = dict.fromkeys(MAX_AGE, max_age)
+        else:
+            self.max_age = dict(MAX_AGE, **(max_age or {}))
+        self.max_entities = max_entities
+        self.stale_if_error = stale_if_error
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.writes = 0
+        self._unchecked = 0
+        self._clock = time.time
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._fts = self._create_tables()
+
+    def __del__(self):
+        """Make sure the database gets closed"""
+        self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+
+    @property
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits, 'writes': self.writes}
+
+    def _create_tables(self) -> bool:
+        """ Returns whether the full-text index is available """
+        db = self._db
+        with db:
+            if self.path != ':memory:':
+                db.execute('PRAGMA journal_mode=WAL')
+            columns = [row[1] for row in db.execute('PRAGMA table_info(entities)')]
+            if columns and 'num' not in columns:
+                # an index made before `num`: its full-text rows were keyed on the implicit rowid, which
+                # VACUUM may renumber. It is only a cache, it is started over
+                logger.info('Rebuilding the catalog index %s', self.path)
+                for table in ('entities', 'members', 'lists', 'names'):
+                    db.execute(f'DROP TABLE IF EXISTS {table}')
+            # `num` keys the full-text rows of `names`: an INTEGER PRIMARY KEY is kept by VACUUM
+            db.execute('CREATE TABLE IF NOT EXISTS entities (num INTEGER PRIMARY KEY, kind TEXT NOT NULL, '
+                       'id TEXT NOT NULL, name TEXT, full TEXT, full_at REAL, simple TEXT, simple_at REAL, '
+                       'fetched_at REAL NOT NULL, UNIQUE (kind, id))')
+            db.execute('CREATE INDEX IF NOT EXISTS entities_fetched_at ON entities (fetched_at)')
+            db.execute('CREATE INDEX IF NOT EXISTS entities_name ON entities (kind, name COLLATE NOCASE)')
+            # members of the lists: artist -> albums, album -> tracks, artist -> related artists
+            db.execute('CREATE TABLE IF NOT EXISTS members (relation TEXT, owner TEXT, variant TEXT, '
+                       'position INTEGER, member TEXT, PRIMARY KEY (relation, owner, variant, position)) '
+                       'WITHOUT ROWID')
+            db.execute('CREATE TABLE IF NOT EXISTS lists (relation TEXT, owner TEXT, variant TEXT, total INTEGER, '
+                       'href TEXT, fetched_at REAL, PRIMARY KEY (relation, owner, variant)) WITHOUT ROWID')
+            try:
+                db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS names USING '
+                           'fts5(name, tokenize="unicode61 remove_diacritics 2", prefix="2 3")')
+            except sqlite3.OperationalError:
+                return False
+        return True
+
+    ## Reads
+
+    def _fresh(self, fetched_at, kind, now) -> bool:
+        return now - fetched_at <= self.max_age[kind]
+
+    def _entity(self, kind, id, column, now):
+        row = self._db.execute(f'SELECT {column}, {column}_at FROM entities WHERE kind = ? AND id = ?',
+                               (kind, id)).fetchone()
+        if row is None or row[0] is None or (now is not None and not self._fresh(row[1], kind, now)):
+            return None
+        return default_decoder(row[0])
+
+    def _list(self, relation, kind, column, owner, variant, offset, limit, now):
+        """ (items, total, href) of a stored list, None unless all the items from offset to offset + limit are there """
+        row = self._db.execute('SELECT total, href, fetched_at FROM lists WHERE relation = ? AND owner = ? '
+                               'AND variant = ?', (relation, owner, variant)).fetchone()
+        if row is None or (now is not None and not self._fresh(row[2], relation, now)):
+            return None
+        total, href, _ = row
+        end = total if limit is None else min(total, offset + limit)
+        items = self._db.execute(f'SELECT e.{column} FROM members m LEFT JOIN entities e ON e.kind = ? '
+                                 f'AND e.id = m.member WHERE m.relation = ? AND m.owner = ? AND m.variant = ? '
+                                 f'AND m.position >= ? AND m.position < ? ORDER BY m.position',
+                                 (kind, relation, owner, variant, offset, end)).fetchall()
+        if len(items) != max(0, end - offset) or any(item is None for item, in items):
+            # a page is missing or an item was evicted
+            return None
+        return [default_decoder(item) for item, in items], total, href
+
+    def get(self, kind, id, stale=False):
+        """ Stored 'artist', 'album' or 'track' (full object), None when missing or not fresh """
+        with self._lock:
+            return self._entity(kind, id, 'full', None if stale else self._clock())
+
+    def members(self, relation, owner, variant='', stale=False) -> list:
+        """ Items of a stored list ('album_tracks', 'artist_albums' with include_groups as variant, 'related') """
+        kind, column = _RELATIONS[relation]
+        with self._lock:
+            found = self._list(relation, kind, column, owner, variant, 0, None, None if stale else self._clock())
+        return found[0] if found else None
+
+    def lookup(self, api_call, stale=False):
+        """ Body of `api_call` built from the index, None when it has to be sent """
+        template = api_call.template
+        if api_call.method != 'GET' or not api_call.decode or template not in _LOOKUPS:
+            return None
+        id, params = _parse(api_call)
+        if 'market' in params or 'country' in params:
+            return None
+        with self._lock:
+            body = _LOOKUPS[template](self, template, id, params, None if stale else self._clock())
+            if not stale:
+                if body is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return body
+
+    def fallback(self, api_call, err):
+        """ Stale body to answer with after `err`, None to raise it """
+        if not self.stale_if_error or not _is_outage(err):
+            return None
+        body = self.lookup(api_call, stale=True)
+        if body is not None:
+            with self._lock:
+                self.stale_hits += 1
+        return body
+
+    def _lookup_entity(self, template, id, params, now):
+        return self._entity(_ENTITIES[template], id, 'full', now)
+
+    def _lookup_several(self, template, id, params, now):
+        kind = _SEVERAL[template]
+        items = [self._entity(kind, id, 'full', now) for id in params.get('ids', '').split(',') if id]
+        if not items or any(item is None for item in items):
+            return None
+        return {template: items}
+
+    def _lookup_list(self, template, id, params, now):
+        relation, _, kind, column = _LISTS[template]
+        if relation == 'related':
+            found = self._list(relation, kind, column, id, '', 0, None, now)
+            return {'artists': found[0]} if found else None
+        offset, limit = int(params.get('offset', 0)), int(params.get('limit', 20))
+        found = self._list(relation, kind, column, id, params.get('include_groups', ''), offset, limit, now)
+        if found is None:
+            return None
+        items, total, href = found
+        query = f'include_groups={params["include_groups"]}&' if params.get('include_groups') else ''
+        page = f'{href}?{query}offset=%d&limit={limit}'
+        return {'href': page % offset, 'items': items, 'limit': limit, 'offset': offset, 'total': total,
+                'next': page % (offset + limit) if offset + limit < total else None,
+                'previous': page % max(0, offset - limit) if offset else None}
+
+    ## Writes
+
+    def store(self, api_call, body) -> None:
+        """ Write the entities of a response through to the index """
+        template = api_call.template
+        if api_call.method != 'GET' or template not in _WRITERS or not body:
+            return
+        id, params = _parse(api_call)
+        if 'market' in params or 'country' in params:
+            return
+        now = self._clock()
+        with self._lock, self._db:
+            _WRITERS[template](self, template, id, params, body, now)
+        if self.max_entities is not None and self._unchecked >= _EVICT_EVERY:
+            self.evict()
+
+    def _put(self, kind, obj, column, now) -> None:
+        if not obj or not obj.get('id'):
+            return
+        db = self._db
+        name = obj.get('name')
+        db.execute(f'INSERT INTO entities (kind, id, name, {column}, {column}_at, fetched_at) '
+                   f'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (kind, id) DO UPDATE SET name = excluded.name, '
+                   f'{column} = excluded.{column}, {column}_at = excluded.fetched_at, fetched_at = excluded.fetched_at',
+                   (kind, obj['id'], name, _encode(obj), now, now))
+        if self._fts and name:
+            num = db.execute('SELECT num FROM entities WHERE kind = ? AND id = ?', (kind, obj['id'])).fetchone()[0]
+            db.execute('INSERT OR REPLACE INTO names (rowid, name) VALUES (?, ?)', (num, name))
+        self.writes += 1
+        self._unchecked += 1
+
+    def _put_page(self, relation, owner, variant, kind, column, page, now) -> None:
+        """ Store the items of a paging object at their positions in the owner's list """
+        db = self._db
+        total, offset = page.get('total'), page.get('offset') or 0
+        if total is None:
+            return
+        row = db.execute('SELECT total, fetched_at FROM lists WHERE relation = ? AND owner = ? AND variant = ?',
+                         (relation, owner, variant)).fetchone()
+        if row is None or row[0] != total or not self._fresh(row[1], relation, now):
+            # a new list: the positions of the old one do not hold anymore
+            db.execute('DELETE FROM members WHERE relation = ? AND owner = ? AND variant = ?',
+                       (relation, owner, variant))
+            href = (page.get('href') or '').split('?')[0]
+            db.execute('INSERT OR REPLACE INTO lists VALUES (?, ?, ?, ?, ?, ?)',
+                       (relation, owner, variant, total, href, now))
+        for position, item in enumerate(page.get('items') or (), offset):
+            if item and item.get('id'):
+                self._put(kind, item, column, now)
+                db.execute('INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?)',
+                           (relation, owner, variant, position, item['id']))
+
+    def _write_album(self, template, id, params, body, now) -> None:
+        self._put('album', body, 'full', now)
+        for artist in body.get('artists') or ():
+            self._put('artist', artist, 'simple', now)
+        if body.get('tracks'):
+            self._put_page('album_tracks', body['id'], '', 'track', 'simple', body['tracks'], now)
+
+    def _write_artist(self, template, id, params, body, now) -> None:
+        self._put('artist', body, 'full', now)
+
+    def _write_several(self, template, id, params, body, now) -> None:
+        write = getattr(self, f'_write_{_SEVERAL[template]}')
+        for item in body.get(template) or ():
+            if item:
+                write(template, item['id'], params, item, now)
+
+    def _write_track(self, template, id, params, body, now) -> None:
+        self._put('track', body, 'full', now)
+        if body.get('album'):
+            self._put('album', body['album'], 'simple', now)
+
+    def _write_list(self, template, id, params, body, now) -> None:
+        relation, _, kind, column = _LISTS[template]
+        if relation == 'related':
+            page = {'total': len(body.get('artists') or ()), 'items': body.get('artists'), 'offset': 0}
+            self._put_page(relation, id, '', kind, column, page, now)
+        else:
+            self._put_page(relation, id, params.get('include_groups', ''), kind, column, body, now)
+
+    def _write_search(self, template, id, params, body, now) -> None:
+        for kind, column in _SEARCH_KINDS.items():
+            for item in (body.get(f'{kind}s') or {}).get('items') or ():
+                self._put(kind, item, column, now)
+
+    ## Size limit
+
+    def evict(self) -> int:
+        """ Drop the entities fetched the longest ago above `max_entities` (and 10% more). Returns the count """
+        if self.max_entities is None:
+            return 0
+        with self._lock, self._db:
+            db = self._db
+            self._unchecked = 0
+            excess = db.execute('SELECT COUNT(*) FROM entities').fetchone()[0] - self.max_entities
+            if excess <= 0:
+                return 0
+            excess += self.max_entities // 10
+            db.execute('CREATE TEMP TABLE IF NOT EXISTS evicted (num INTEGER PRIMARY KEY, kind TEXT, id TEXT)')
+            db.execute('DELETE FROM evicted')
+            db.execute('INSERT INTO evicted SELECT num, kind, id FROM entities ORDER BY fetched_at LIMIT ?',
+                       (excess,))
+            if self._fts:
+                db.execute('DELETE FROM names WHERE rowid IN (SELECT num FROM evicted)')
+            # lists owned by evicted entities go too, the lists they are members of are incomplete now
+            for relation, owner_kind, _, _ in _LISTS.values():
+                for table in ('members', 'lists'):
+                    db.execute(f'DELETE FROM {table} WHERE relation = ? AND owner IN '
+                               f'(SELECT id FROM evicted WHERE kind = ?)', (relation, owner_kind))
+            db.execute('DELETE FROM entities WHERE num IN (SELECT num FROM evicted)')
+            return excess
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            for table in ('entities', 'members', 'lists') + (('names',) if self._fts else ()):
+                self._db.execute(f'DELETE FROM {table}')
+
+    ## Local search
+
+    def search(self, q, q_type='artist', limit=20, stale=True) -> list:
+        """ Stored artists, albums or tracks whose name matches `q`: every word, as a word prefix
+
+        Without FTS5 in SQLite the whole name has to start with `q`. Stale entries are included by default.
+        """
+        words = q.split()
+        if not words or q_type not in _SEARCH_KINDS:
+            return []
+        column = 'full' if q_type != 'album' else 'COALESCE(full, simple)'
+        with self._lock:
+            if self._fts:
+                match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+                rows = self._db.execute(f'SELECT {column}, fetched_at FROM names JOIN entities e '
+                                        f'ON e.num = names.rowid WHERE names MATCH ? AND e.kind = ? '
+                                        f'ORDER BY rank LIMIT ?', (match, q_type, limit * 2)).fetchall()
+            else:
+                pattern = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                rows = self._db.execute(f"SELECT {column}, fetched_at FROM entities WHERE kind = ? "
+                                        f"AND name LIKE ? ESCAPE '\\' LIMIT ?",
+                                        (q_type, pattern, limit * 2)).fetchall()
+            now = self._clock()
+        found = [default_decoder(body) for body, fetched_at in rows
+                 if body is not None and (stale or self._fresh(fetched_at, q_type, now))]
+        return found[:limit]
+
+
+_LOOKUPS = dict(dict.fromkeys(_ENTITIES, CatalogStore._lookup_entity),
+                **dict.fromkeys(_SEVERAL, CatalogStore._lookup_several),
+                **dict.fromkeys(_LISTS, CatalogStore._lookup_list))
+_WRITERS = dict({'albums/{id}': CatalogStore._write_album, 'artists/{id}': CatalogStore._write_artist,
+                 'search': CatalogStore._write_search},
+                **dict.fromkeys(_SEVERAL, CatalogStore._write_several),
+                **dict.fromkeys(_LISTS, CatalogStore._write_list))
+
+
+def search(client, q, q_type='artist', limit=20, min_results=1):
+    """ Search the client's catalog first, send `search` when it has fewer than `min_results` matches
+
+    client:   `Spotify` client, its `catalog` is searched.
+    Returns what `client.search(q, q_type, limit=limit)` returns, {'artists': {'items': [...], ...}} for 'artist'.
+    """
+    catalog = client.catalog
+    if catalog is not None and q_type in _SEARCH_KINDS:
+        items = catalog.search(q, q_type, limit)
+        if len(items) >= min_results:
+            body = {f'{q_type}s': {'href': None, 'items': items, 'limit': limit, 'next': None, 'offset': 0,
+                                   'previous': None, 'total': len(items)}}
+            return models.wrap(endpoints.search(q, q_type, limit=limit), body) if client.models else body
+    return client.search(q, q_type, limit=limit)
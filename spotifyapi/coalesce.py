@@ -0,0 +1,93 @@
+""" Coalescing of concurrent identical GET requests
+
+When several threads (or coroutines) ask for the same resource at the same moment, only
+the first one sends the request, the others wait for it and get the same parsed result.
+The result object is shared, so callers should not modify it.
+
+Requests are identical when method, URL path, parameters and the access token are the same:
+the requests of different users (tokens) are never merged, even through one `Coalescer`.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+__all__ = [
+    "Coalescer"
+]
+
+
+def request_key(api_call, scope=None, authorization=None) -> tuple:
+    """ Coalescing key. authorization: the Authorization header the request is sent with """
+    params = tuple(sorted(api_call.params.items())) if api_call.params else None
+    return (api_call.method, api_call.url_path, params, api_call.decode, frozenset(scope.scope) if scope else None,
+            authorization)
+
+
+class Coalescer():
+    """ In-flight de-duplication for `Spotify` and `AsyncSpotify`
+
+    Counters: `calls` (requests actually sent), `coalesced` (callers served by another caller's request).
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight = dict()
+        self._in_flight_async = dict()
+
+    @property
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced}
+
+    def do(self, key, fn):
+        """ Return fn() or the result of the same call already in flight """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    async def do_async(self, key, fn):
+        """ `do()` for coroutine functions, all the callers must run in one event loop """
+        future = self._in_flight_async.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._in_flight_async[key] = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            # mark the exception as retrieved when nobody was waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight_async[key]
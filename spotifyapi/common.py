@@ -1,14 +1,20 @@
 import requests
 import logging
 
-def createLogger(name, lvl=logging.DEBUG):
+def createLogger(name='spotifyapi', lvl=logging.DEBUG):
+    """ Print the library's log records to stderr, for scripts and debugging
+
+    The library itself only has a NullHandler: applications configure logging as they like.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(lvl)
-    ch = logging.StreamHandler()
-    ch.setLevel(lvl)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    if not any(type(h) is logging.StreamHandler for h in logger.handlers):
+        ch = logging.StreamHandler()
+        ch.setLevel(lvl)
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch.setFormatter(formatter)
+        logger.addHandler(ch)
     return logger
 
-logger = createLogger(__name__)
+logger = logging.getLogger('spotifyapi')
+logger.addHandler(logging.NullHandler())
@@ -0,0 +1,275 @@
+""" Catalog crawler
+
+`Crawler` walks the artist graph breadth-first from seed artists: related artists, their
+albums and the albums' tracks. Requests run on a pool of worker threads through one
+`Spotify` client, so they share its rate limiter, retry policy and connection pool.
+Every artist and album is written once to a sink (`JSONLSink`: artists.jsonl, related.jsonl,
+albums.jsonl, tracks.jsonl), tracks once per album. With a `spotifyapi.processes.ProcessRunner` the requests and
+the decoding run in its worker processes instead.
+
+The frontier and the visited artists and albums are checkpointed to a JSON file. A crawl
+started with the same checkpoint path resumes where the previous one stopped, retries the
+failed tasks and crawls the seeds that are new. Entities written after the last checkpoint
+may be written again on resume.
+
+    crawler = Crawler(Spotify(auth_manager=ClientCredentials(...)), JSONLSink('catalog'),
+                      checkpoint_path='catalog/checkpoint.json', max_depth=2, workers=8)
+    stats = crawler.run(['4Z8W4fKeB5YxbusRsdQVPb'])
+"""
+import contextlib
+import functools
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from spotifyapi import endpoints, paging
+from spotifyapi.batch import get_several
+from spotifyapi.common import logger
+
+
+__all__ = [
+    "JSONLSink",
+    "Crawler"
+]
+
+
+ARTISTS = 'artists'
+RELATED = 'related'
+ALBUMS = 'albums'
+TRACKS = 'tracks'
+
+
+def _fetch(client, task, include_groups, market):
+    """ Items of a crawl task. Runs on a worker thread or process: requests only, no shared state """
+    kind, id, _ = task
+    call = client._call
+    if kind == RELATED:
+        return call(endpoints.getRelatedArtists(id))['artists']
+    if kind == ALBUMS:
+        api_call = endpoints.getArtistAlbums(id, include_groups=include_groups, country=market, limit=50)
+        return list(paging.iter_items(call, api_call))
+    if kind == TRACKS:
+        return list(paging.iter_items(call, endpoints.getAlbumTracks(id, market=market, limit=50)))
+    raise ValueError(f'Unknown crawl task {kind}')
+
+
+class JSONLSink():
+    """ One JSON object per line, a file per kind of entity in `directory`. Files are appended to """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = dict()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, kind, obj) -> None:
+        f = self._files.get(kind)
+        if f is None:
+            f = self._files[kind] = open(os.path.join(self.directory, f'{kind}.jsonl'), 'a', encoding='utf-8')
+        f.write(json.dumps(obj, ensure_ascii=False))
+        f.write('\n')
+
+    def flush(self) -> None:
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+class Crawler():
+    """ Breadth-first crawl of artists, albums and tracks
+
+    client:             Spotify client shared by the worker threads. Not used with `runner`.
+    sink:               Object with write(kind, obj), flush() and close(), e.g. JSONLSink.
+    checkpoint_path:    Optional. JSON file with the crawl state, written every `checkpoint_interval` seconds.
+    max_depth:          Hops from the seed artists over related artists. 0 crawls the seeds only.
+    max_artists:        Optional. Stop discovering artists after that many.
+    albums, tracks:     Crawl the artists' albums / the albums' tracks.
+    include_groups:     Album groups to crawl, see `getArtistAlbums`.
+    workers:            Concurrent requests.
+    report_interval:    Seconds between progress log records.
+    runner:             Optional. spotifyapi.processes.ProcessRunner sending the requests from its worker
+                        processes instead of `workers` threads.
+    """
+
+    def __init__(self, client, sink, checkpoint_path=None, max_depth=1, max_artists=None, albums=True, tracks=True,
+                 include_groups='album,single', market=None, workers=4, checkpoint_interval=30, report_interval=10,
+                 runner=None):
+        self.client = client
+        self.runner = runner
+        self.sink = sink
+        self.checkpoint_path = checkpoint_path
+        self.max_depth = max_depth
+        self.max_artists = max_artists
+        self.albums = albums
+        self.tracks = tracks
+        self.include_groups = include_groups
+        self.market = market
+        self.workers = workers
+        self.checkpoint_interval = checkpoint_interval
+        self.report_interval = report_interval
+
+        self.frontier = deque()     # tasks: [kind, id, depth]
+        # tracks are not kept: an album's tracks are crawled once, with the album
+        self.visited = {ARTISTS: set(), ALBUMS: set()}
+        self.failed = []
+        self.counts = {ARTISTS: 0, RELATED: 0, ALBUMS: 0, TRACKS: 0}
+        self._clock = time.monotonic
+        self._started = None
+        self._start_entities = 0
+
+    @property
+    def stats(self) -> dict:
+        elapsed = self._clock() - self._started if self._started is not None else 0.0
+        # the rate of this run, counts include the runs before a resume
+        entities = self._entities() - self._start_entities
+        return dict(self.counts, elapsed=elapsed, entities_per_sec=entities / elapsed if elapsed else 0.0,
+                    frontier=len(self.frontier), failed=len(self.failed))
+
+    def _entities(self) -> int:
+        return self.counts[ARTISTS] + self.counts[ALBUMS] + self.counts[TRACKS]
+
+    ## Bookkeeping done on the calling thread
+
+    def _add_artist(self, artist, depth) -> None:
+        id = artist['id']
+        if id in self.visited[ARTISTS]:
+            return
+        if self.max_artists is not None and len(self.visited[ARTISTS]) >= self.max_artists:
+            return
+        self.visited[ARTISTS].add(id)
+        self.sink.write(ARTISTS, artist)
+        self.counts[ARTISTS] += 1
+        if depth < self.max_depth:
+            self.frontier.append([RELATED, id, depth])
+        if self.albums:
+            self.frontier.append([ALBUMS, id, depth])
+
+    def _handle(self, task, result) -> None:
+        kind, id, depth = task
+        if kind == RELATED:
+            self.sink.write(RELATED, {'artist_id': id, 'related_ids': [artist['id'] for artist in result]})
+            self.counts[RELATED] += 1
+            for artist in result:
+                self._add_artist(artist, depth + 1)
+        elif kind == ALBUMS:
+            for album in result:
+                if album['id'] in self.visited[ALBUMS]:
+                    continue
+                self.visited[ALBUMS].add(album['id'])
+                self.sink.write(ALBUMS, album)
+                self.counts[ALBUMS] += 1
+                if self.tracks:
+                    self.frontier.append([TRACKS, album['id'], depth])
+        elif kind == TRACKS:
+            for track in result:
+                self.sink.write(TRACKS, dict(track, album_id=id))
+                self.counts[TRACKS] += 1
+
+    ## Checkpoints
+
+    def load_checkpoint(self) -> bool:
+        """ Restore the crawl state from `checkpoint_path`, failed tasks go back to the frontier.
+        False when there is no checkpoint
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path, 'r') as f:
+            state = json.load(f)
+        self.frontier = deque(state['frontier'] + state['failed'])
+        self.visited = {kind: set(state['visited'].get(kind, ())) for kind in (ARTISTS, ALBUMS)}
+        self.failed = []
+        self.counts = state['counts']
+        logger.info('Resuming crawl from %s: %d tasks in the frontier, %d of them failed before',
+                    self.checkpoint_path, len(self.frontier), len(state['failed']))
+        return True
+
+    def save_checkpoint(self, in_flight=()) -> None:
+        """ Write the crawl state, tasks still running are saved as not done """
+        if not self.checkpoint_path:
+            return
+        # entities have to be on disk before the checkpoint says they are visited
+        self.sink.flush()
+        state = {'frontier': list(in_flight) + list(self.frontier),
+                 'visited': {kind: list(ids) for kind, ids in self.visited.items()},
+                 'failed': self.failed, 'counts': self.counts}
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-spotify-crawl-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.checkpoint_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    ## Crawl
+
+    def _seed(self, artist_ids) -> None:
+        new_ids = [id for id in artist_ids if id not in self.visited[ARTISTS]]
+        if not new_ids:
+            return
+        if self.runner is not None:
+            artists = self.runner.get_several(endpoints.getArtists, new_ids)
+        else:
+            artists = get_several(self.client._call, endpoints.getArtists, new_ids, workers=self.workers)
+        for artist in artists:
+            if artist is not None:
+                self._add_artist(artist, 0)
+
+    def run(self, seed_artist_ids=()) -> dict:
+        """ Crawl from the seed artists, resuming from the checkpoint if there is one. Returns `stats` """
+        self._started = self._clock()
+        self.load_checkpoint()
+        # seeds visited before are skipped
+        self._seed(seed_artist_ids)
+        self._start_entities = self._entities()
+
+        in_flight = dict()
+        last_checkpoint = last_report = self._clock()
+        if self.runner is not None:
+            executor = contextlib.nullcontext()
+            submit = functools.partial(self.runner.submit, _fetch)
+            max_in_flight = self.runner.workers * 2
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='spotify-crawler')
+            submit = functools.partial(executor.submit, _fetch, self.client)
+            max_in_flight = self.workers * 2
+        with executor:
+            try:
+                while self.frontier or in_flight:
+                    while self.frontier and len(in_flight) < max_in_flight:
+                        task = self.frontier.popleft()
+                        in_flight[submit(task, self.include_groups, self.market)] = task
+                    done, _ = wait(in_flight, timeout=self.report_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = in_flight.pop(future)
+                        try:
+                            self._handle(task, future.result())
+                        except Exception as err:
+                            logger.warning('Crawl task %s %s failed: %s', task[0], task[1], err)
+                            self.failed.append(task)
+
+                    now = self._clock()
+                    if now - last_checkpoint >= self.checkpoint_interval:
+                        self.save_checkpoint(in_flight.values())
+                        last_checkpoint = now
+                    if now - last_report >= self.report_interval:
+                        stats = self.stats
+                        logger.info('Crawled %d artists, %d albums, %d tracks (%.1f entities/s), %d tasks left',
+                                    stats[ARTISTS], stats[ALBUMS], stats[TRACKS], stats['entities_per_sec'],
+                                    stats['frontier'] + len(in_flight))
+                        last_report = now
+            finally:
+                # on errors and KeyboardInterrupt the running tasks go back to the frontier
+                for future in in_flight:
+                    future.cancel()
+                self.save_checkpoint(in_flight.values())
+                self.sink.flush()
+        return self.stats
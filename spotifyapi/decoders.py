@@ -0,0 +1,50 @@
+""" JSON decoders
+
+Decoding large pages (search, album tracks) is a visible share of the client's CPU time.
+The clients decode response bodies with the fastest decoder installed: orjson, then
+msgspec, then the standard library. A decoder is any function taking bytes.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+__all__ = [
+    "DECODERS",
+    "get_decoder",
+    "default_decoder"
+]
+
+
+def _stdlib_decode(data):
+    return json.loads(data)
+
+DECODERS = {'json': _stdlib_decode}
+if msgspec is not None:
+    DECODERS['msgspec'] = msgspec.json.decode
+if orjson is not None:
+    DECODERS['orjson'] = orjson.loads
+
+
+def get_decoder(decoder=None):
+    """ decoder: a function, a name from DECODERS or None for the fastest installed one """
+    if callable(decoder):
+        return decoder
+    if decoder is None:
+        for name in ('orjson', 'msgspec', 'json'):
+            if name in DECODERS:
+                return DECODERS[name]
+    try:
+        return DECODERS[decoder]
+    except KeyError:
+        raise ValueError(f'Unknown or not installed JSON decoder "{decoder}". Available: {", ".join(DECODERS)}')
+
+default_decoder = get_decoder()
@@ -0,0 +1,253 @@
+""" Spotify Web API endpoints
+
+Every function here describes one endpoint: it checks the arguments and returns an `ApiCall`
+with the method, path and parameters of the request. `Spotify` and `AsyncSpotify` build their
+methods from these functions, so both clients always send the same requests.
+
+The endpoints are declared with `endpoint()`: the path template, the parameters (from the
+signature) and their checks are compiled once into a function building the `ApiCall` directly.
+"""
+import functools
+import inspect
+import json
+import string
+from typing import NamedTuple
+
+from spotifyapi import models
+from spotifyapi.exceptions import SpotifyError
+
+
+class ApiCall(NamedTuple):
+    method: str
+    url_path: str
+    params: dict = None
+    data: str = None
+    decode: bool = True         # return decoded JSON body instead of the response
+    no_content: bool = False    # raise SpotifyRequestNoContent on 204
+    result_key: str = None      # key of the paging object or the item list in the body, None when it is the body
+    model: type = None          # spotifyapi.models class of the body
+    template: str = None        # path template (albums/{id}) naming the endpoint in metrics
+    idempotent: bool = None     # may be retried after a failure, None: decided by the method
+
+
+SEARCH_TYPES = ('album', 'artist', 'playlist', 'track', 'show', 'episode')
+
+
+def _fields(template) -> set:
+    return {field for _, field, _, _ in string.Formatter().parse(template or '') if field is not None}
+
+def endpoint(method, path, result_key=None, model=None, body=(), rename=None, convert=None, choices=None,
+             decode=True, no_content=False, idempotent=None):
+    """ Declare an endpoint by the signature and the docstring of the decorated function
+
+    The function is compiled once into one returning the `ApiCall`, its own body is never run.
+    Its arguments go to the path when `path` names them, to the JSON body when listed in `body`
+    and to the query otherwise: always when they have no default value, when they are true if
+    they have one.
+
+    path:        Path template, e.g. 'albums/{id}'. Also names the endpoint in metrics.
+    result_key:  Optional. Key of the result in the body, a template like `path` ('{q_type}s').
+    body:        Optional. Arguments sent in the JSON body.
+    rename:      Optional. {argument: parameter} for parameters named differently.
+    convert:     Optional. {argument: function} making the parameter value (','.join for IDs).
+    choices:     Optional. {argument: allowed values}, other values raise SpotifyError.
+    """
+    rename = rename or {}
+    convert = convert or {}
+    choices = choices or {}
+
+    def decorator(declaration):
+        name = declaration.__name__
+        arguments = list(inspect.signature(declaration).parameters.values())
+        names = [argument.name for argument in arguments]
+        if any(argument.kind is not inspect.Parameter.POSITIONAL_OR_KEYWORD for argument in arguments):
+            raise TypeError(f'{name}: endpoint arguments must be positional or keyword arguments')
+        path_fields = _fields(path)
+        unknown = (path_fields | _fields(result_key) | set(body) | set(rename) | set(convert) | set(choices)) - set(names)
+        if unknown:
+            raise TypeError(f'{name}: no arguments named {", ".join(sorted(unknown))}')
+
+        # the source of getAlbum, for example:
+        #     def getAlbum(id, market):
+        #         _params = {}
+        #         if market:
+        #             _params['market'] = market
+        #         return _ApiCall('GET', f'albums/{id}', _params, None, True, False, None, _model, 'albums/{id}', None)
+        namespace = {'_ApiCall': ApiCall, '_SpotifyError': SpotifyError, '_dumps': json.dumps, '_model': model}
+        lines = [f'def {name}({", ".join(names)}):']
+        for argument, values in choices.items():
+            namespace[f'_{argument}_choices'] = tuple(values)
+            namespace[f'_{argument}_error'] = f'"{argument}" must be {", ".join(values)}'
+            lines.extend([f'    if {argument} not in _{argument}_choices:',
+                          f'        raise _SpotifyError(_{argument}_error)'])
+
+        def fill(target, group):
+            def value(argument):
+                if argument in convert:
+                    namespace[f'_{argument}_convert'] = convert[argument]
+                    return f'_{argument}_convert({argument})'
+                return argument
+            required = ', '.join(f'{rename.get(argument.name, argument.name)!r}: {value(argument.name)}'
+                                 for argument in group if argument.default is argument.empty)
+            lines.append(f'    {target} = {{{required}}}')
+            for argument in group:
+                if argument.default is not argument.empty:
+                    lines.extend([f'    if {argument.name}:',
+                                  f'        {target}[{rename.get(argument.name, argument.name)!r}] = {value(argument.name)}'])
+
+        query = [argument for argument in arguments if argument.name not in path_fields and argument.name not in body]
+        if query:
+            fill('_params', query)
+        if body:
+            fill('_body', [argument for argument in arguments if argument.name in body])
+        lines.append(f'    return _ApiCall({method!r}, f{path!r}, {"_params" if query else None}, '
+                     f'{"_dumps(_body)" if body else None}, {decode!r}, {no_content!r}, '
+                     f'{f"f{result_key!r}" if result_key else None}, _model, {path!r}, {idempotent!r})')
+
+        exec(compile('\n'.join(lines), f'<endpoint {name}>', 'exec'), namespace)
+        build = functools.update_wrapper(namespace[name], declaration)
+        build.__defaults__ = declaration.__defaults__
+        return build
+    return decorator
+
+
+def max_ids(count):
+    """ Mark an endpoint taking a list of IDs. `count` is the maximum number of IDs Spotify accepts per request """
+    def decorator(build):
+        build.max_ids = count
+        return build
+    return decorator
+
+
+## Album
+
+@endpoint('GET', 'albums/{id}', model=models.Album)
+def getAlbum(id, market=None) -> ApiCall:
+    """ Get an Album
+    id: The Spotify ID for the album.
+    market: Optional. An ISO 3166-1 alpha-2 country code or the string from_token.
+    """
+
+@endpoint('GET', 'albums/{id}/tracks', model=models.TrackPage)
+def getAlbumTracks(id, market=None, limit=None, offset=None) -> ApiCall:
+    """ Get an Album
+    id: The Spotify ID for the album.
+    limit: Optional. The maximum number of tracks to return. Default: 20. Minimum: 1. Maximum: 50.
+    offset: Optional. The index of the first track to return. Default: 0 (the first object). Use with limit to get the next set of tracks.
+    market: Optional. An ISO 3166-1 alpha-2 country code or the string from_token.
+    """
+
+@max_ids(20)
+@endpoint('GET', 'albums', result_key='albums', model=models.Albums, convert={'ids': ','.join})
+def getAlbums(ids, market=None) -> ApiCall:
+    """ Get Several Albums
+    ids: The Spotify IDs for the albums. Maximum: 20 IDs.
+    market: Optional. An ISO 3166-1 alpha-2 country code or the string from_token.
+    """
+
+## Artist
+
+@endpoint('GET', 'artists/{id}', model=models.Artist)
+def getArtist(id) -> ApiCall:
+    """ Get an Artist """
+
+@endpoint('GET', 'artists/{id}/albums', model=models.AlbumPage)
+def getArtistAlbums(id, include_groups=None, country=None, limit=None, offset=None) -> ApiCall:
+    """ Get an Artist's Albums """
+
+@endpoint('GET', 'artists/{id}/related-artists', model=models.Artists)
+def getRelatedArtists(id) -> ApiCall:
+    """ Get an Artist's Related Artists """
+
+@max_ids(50)
+@endpoint('GET', 'artists', result_key='artists', model=models.Artists, convert={'ids': ','.join})
+def getArtists(ids) -> ApiCall:
+    """ Get Several Artists
+    ids: The Spotify IDs for the artists. Maximum: 50 IDs.
+    """
+
+## Track
+
+@max_ids(50)
+@endpoint('GET', 'tracks', result_key='tracks', model=models.Tracks, convert={'ids': ','.join})
+def getTracks(ids, market=None) -> ApiCall:
+    """ Get Several Tracks
+    ids: The Spotify IDs for the tracks. Maximum: 50 IDs.
+    market: Optional. An ISO 3166-1 alpha-2 country code or the string from_token.
+    """
+
+@max_ids(100)
+@endpoint('GET', 'audio-features', result_key='audio_features', model=models.AudioFeaturesList,
+          convert={'ids': ','.join})
+def getAudioFeatures(ids) -> ApiCall:
+    """ Get Audio Features for Several Tracks
+    ids: The Spotify IDs for the tracks. Maximum: 100 IDs.
+    """
+
+## Misc
+
+@endpoint('GET', 'search', result_key='{q_type}s', model=models.SearchResult, rename={'raw_q': 'q', 'q_type': 'type'},
+          choices={'q_type': SEARCH_TYPES})
+def search(raw_q, q_type, market=None, limit=None, offset=None, include_external=False) -> ApiCall:
+
+    """ Search for an Item
+
+    raw_q:   String with operators and flters:
+             q='album:arrival artist:abba'
+             q="doom metal"
+
+    q_type:  String with one of many types
+             Example: q_type=album, q_type=album,track
+
+    include_external:  Optional. "audio" to include externally hosted audio content in the results.
+
+    Returns:
+    For each type provided in the type parameter, the response body contains an array of artist objects / simplified album objects / track objects / simplified show objects / simplified episode objects wrapped in a paging object in JSON.
+    """
+
+@endpoint('GET', 'browse/categories', result_key='categories', model=models.Categories)
+def getCategories(country=None, locale=None, limit=None, offset=None) -> ApiCall:
+    """ Get Several Browse Categories """
+
+@endpoint('GET', 'browse/categories/{category_id}/playlists', result_key='playlists', model=models.CategoryPlaylists)
+def getCategoryPlaylist(category_id, country=None, limit=None, offset=None) -> ApiCall:
+    """ Get a Category's Playlists """
+
+@endpoint('GET', 'recommendations/available-genre-seeds')
+def getAvalGenres() -> ApiCall:
+    """ Get Available Genre Seeds """
+
+## User
+
+@endpoint('GET', 'me/player/devices', model=models.Devices)
+def getUserAvaliableDevices() -> ApiCall:
+    """ Get a User's Available Devices """
+
+@endpoint('GET', 'me/player', no_content=True, model=models.Playback)
+def getUserCurrentPlayback() -> ApiCall:
+    """ Get Information About The User's Current Playback """
+
+@endpoint('GET', 'me/player/currently-playing', no_content=True, model=models.Playback)
+def getUserCurrentTrack(market=None) -> ApiCall:
+    """ Get the object currently being played on the user’s Spotify account."""
+
+@endpoint('PUT', 'me/player/pause', decode=False)
+def pauseUserPlayback(device_id=None) -> ApiCall:
+    """ user-modify-playback-state"""
+
+# playing twice restarts the playback: not retried
+@endpoint('PUT', 'me/player/play', body=('context_uri', 'uris', 'offset', 'position_ms'), decode=False, idempotent=False)
+def startOrResumeUserPlayback(device_id=None, context_uri=None, uris=None, offset=None, position_ms=None) -> ApiCall:
+    """ user-modify-playback-state
+
+    context_uri:    Spotify URI of the context to play (albums, artists, playlists).
+                    Example: {"context_uri": "spotify:album:1Je1IMUlBXcx1Fz0WE7oPT"}
+    uris:    Spotify track URIs to play.
+             Example: {"uris": ["spotify:track:4iV5W9uYEdYUVa79Axb7Rh", "spotify:track:1301WleyT98MSxVHPZCA6M"]}
+    offset:    Indicates from where in the context playback should start.
+               Avaliable when `context_uri` corresponds to an album or playlist object, or when the `uris` parameter is used.
+               Example: "offset": {"position": 5}
+               “uri” is a string representing the uri of the item to start at.
+               Example: "offset": {"uri": "spotify:track:1301WleyT98MSxVHPZCA6M"}
+    position_ms:    Passing in a position that is greater than the length of the track will cause the player to start playing the next song.
+    """
@@ -0,0 +1,40 @@
+from spotifyapi.decoders import default_decoder
+
+
+__all__ = [
+    "SpotifyError",
+    "SpotifyRequestError",
+    "SpotifyRequestNoContent",
+    "SpotifyCircuitOpen",
+]
+
+
+class SpotifyError(Exception):
+    pass
+
+class SpotifyRequestError(SpotifyError):
+    def __init__(self, body, status=None):
+        try:
+            self.body = default_decoder(body)
+            error = self.body["error"]
+        except Exception:
+            # gateways answer 5xx with HTML or an empty body
+            self.body = {"error": {"status": status, "message": body.decode("utf-8", "replace") if body else ""}}
+            error = self.body["error"]
+        self.status = error["status"]
+        self.message = error["message"]
+        self.reason = error.get("reason")
+    def __str__(self):
+        return f'{self.body}'
+
+class SpotifyRequestNoContent(SpotifyError):
+    def __init__(self):
+        self.reason = 'NO CONTENT'
+    def __str__(self):
+        return f'{self.reason}'
+
+class SpotifyCircuitOpen(SpotifyError):
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+    def __str__(self):
+        return f'Circuit open after repeated failures, requests are refused for up to {self.retry_in}s'
@@ -0,0 +1,316 @@
+""" Streaming export to files
+
+`export()` writes the items of any iterator (`iterArtistAlbums`, `iterCategoryPlaylist`, a
+generator chaining them...) to a file as they arrive: paging keeps one page in memory, the
+writers keep one row (NDJSON, CSV) or one batch of rows (Parquet, Arrow), so memory stays
+flat however large the export grows.
+
+`fields` projects every item to the columns you need, with dotted paths into the objects:
+
+    rows = (dict(playlist, category_id=category['id'])
+            for category in sp.iterCategories(limit=50)
+            for playlist in sp.iterCategoryPlaylist(category['id'], limit=50))
+    stats = export(rows, 'playlists.parquet', fields=['category_id', 'id', 'name', 'owner.id', 'tracks.total'])
+    print(stats['rows_per_sec'])
+
+The format is taken from the extension: .ndjson/.jsonl, .csv, .parquet or .arrow. Parquet and
+Arrow need pyarrow: pip install spotifyapi[parquet]. `ExportSink` writes the entities of a
+`spotifyapi.crawler.Crawler` in any of these formats.
+"""
+import csv
+import json
+import os
+import time
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from spotifyapi.common import logger
+from spotifyapi.exceptions import SpotifyError
+from spotifyapi.models import SpotifyObject
+
+
+__all__ = [
+    "Projection",
+    "NDJSONWriter",
+    "CSVWriter",
+    "ParquetWriter",
+    "ArrowWriter",
+    "WRITERS",
+    "open_writer",
+    "export",
+    "ExportSink"
+]
+
+
+def _compile_path(path) -> tuple:
+    return tuple(int(key) if key.isdigit() else key for key in path.split('.'))
+
+class Projection():
+    """ Select fields of the items, compiled once
+
+    fields:   List of dotted paths ('id', 'artists.0.name', 'tracks.total'), the paths name the
+              columns; or a dict {column: path}. Missing values are None.
+    """
+
+    def __init__(self, fields):
+        if not isinstance(fields, dict):
+            fields = {field: field for field in fields}
+        self.columns = list(fields)
+        self._paths = [(column, _compile_path(path)) for column, path in fields.items()]
+
+    def __call__(self, item) -> dict:
+        if isinstance(item, SpotifyObject):
+            item = item.raw
+        row = dict()
+        for column, path in self._paths:
+            value = item
+            for key in path:
+                try:
+                    value = value[key]
+                except (KeyError, IndexError, TypeError):
+                    value = None
+                    break
+            row[column] = value
+        return row
+
+
+class NDJSONWriter():
+    """ One JSON object per line
+
+    append:   Add the rows to an existing file instead of writing it anew.
+    """
+    extension = 'ndjson'
+    appendable = True
+
+    def __init__(self, path, columns=None, append=False):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, row) -> None:
+        self._file.write(json.dumps(row.raw if isinstance(row, SpotifyObject) else row, ensure_ascii=False))
+        self._file.write('\n')
+        self.rows += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CSVWriter(NDJSONWriter):
+    """ CSV with a header. Nested values (lists, objects) are written as JSON
+
+    columns:  Column names. Default: the keys of the first row, later rows must not add any.
+    append:   Add the rows to an existing file, under its header, instead of writing it anew.
+    """
+    extension = 'csv'
+
+    def __init__(self, path, columns=None, append=False):
+        self.path = path
+        self.rows = 0
+        self.columns = columns
+        self._writer = None
+        if append and os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                header = next(csv.reader(f))
+            self.columns = self.columns or header
+            self._file = open(path, 'a', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+
+    def write(self, row) -> None:
+        if isinstance(row, SpotifyObject):
+            row = row.raw
+        if self._writer is None:
+            self.columns = self.columns or list(row)
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+        self._writer.writerow([json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                               for value in map(row.get, self.columns)])
+        self.rows += 1
+
+
+def _without_nulls(type):
+    """ `type` inferred from a batch with strings for the values the batch had no example of """
+    if pyarrow.types.is_null(type):
+        return pyarrow.string()
+    if pyarrow.types.is_list(type):
+        return pyarrow.list_(_without_nulls(type.value_type))
+    if pyarrow.types.is_large_list(type):
+        return pyarrow.large_list(_without_nulls(type.value_type))
+    if pyarrow.types.is_struct(type):
+        return pyarrow.struct([field.with_type(_without_nulls(field.type)) for field in type])
+    return type
+
+class ParquetWriter():
+    """ Parquet file written a row group per `batch_rows` rows. Needs pyarrow
+
+    columns:  Column names. Default: the keys of the first row.
+    schema:   Optional. pyarrow.Schema, inferred from the first batch otherwise (values
+              without any example in it, nested ones too, are strings).
+    """
+    extension = 'parquet'
+    appendable = False
+
+    def __init__(self, path, columns=None, batch_rows=10000, schema=None):
+        if pyarrow is None:
+            raise SpotifyError(f'{self.__class__.__name__} needs pyarrow. '
+                               f'Install it with "pip install spotifyapi[parquet]"')
+        self.path = path
+        self.rows = 0
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self.schema = schema
+        self._batch = []
+        self._writer = None
+
+    def _open(self, schema):
+        return pyarrow.parquet.ParquetWriter(self.path, schema)
+
+    def write(self, row) -> None:
+        self._batch.append(row.raw if isinstance(row, SpotifyObject) else row)
+        self.rows += 1
+        if len(self._batch) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        if self.columns is None:
+            self.columns = list(self._batch[0])
+        columns = {column: [row.get(column) for row in self._batch] for column in self.columns}
+        self._batch = []
+        if self.schema is None:
+            table = pyarrow.table(columns)
+            self.schema = pyarrow.schema(field.with_type(_without_nulls(field.type)) for field in table.schema)
+        if self._writer is None:
+            self._writer = self._open(self.schema)
+        self._writer.write_table(pyarrow.table(columns, schema=self.schema))
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is None and self.columns:
+            # no rows: an empty file with the columns
+            self.schema = self.schema or pyarrow.schema([(column, pyarrow.string()) for column in self.columns])
+            self._writer = self._open(self.schema)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArrowWriter(ParquetWriter):
+    """ Arrow IPC file (Feather v2) written a record batch per `batch_rows` rows. Needs pyarrow """
+    extension = 'arrow'
+
+    def _open(self, schema):
+        return pyarrow.ipc.new_file(self.path, schema)
+
+
+WRITERS = {'ndjson': NDJSONWriter, 'jsonl': NDJSONWriter, 'csv': CSVWriter, 'parquet': ParquetWriter,
+           'arrow': ArrowWriter, 'feather': ArrowWriter}
+
+
+def open_writer(path, format=None, columns=None, **kwargs):
+    """ Writer for `path`, the format is taken from its extension when not given """
+    format = format or os.path.splitext(path)[1].lstrip('.').lower()
+    try:
+        writer = WRITERS[format]
+    except KeyError:
+        raise SpotifyError(f'Unknown export format "{format}", use one of {", ".join(WRITERS)}') from None
+    return writer(path, columns=columns, **kwargs)
+
+
+def export(items, path, fields=None, format=None, report_interval=10, **kwargs) -> dict:
+    """ Write the items to `path` one at a time. Returns {'rows', 'seconds', 'rows_per_sec'}
+
+    items:            Any iterable of dicts or spotifyapi.models objects.
+    fields:           Optional. Columns to keep, see `Projection`. Default: whole items.
+    format:           Optional. A key of WRITERS. Default: from the extension of `path`.
+    report_interval:  Seconds between progress log records.
+    kwargs:           Passed to the writer (batch_rows, schema).
+    """
+    projection = Projection(fields) if fields else None
+    start = last_report = time.monotonic()
+    with open_writer(path, format, projection.columns if projection else None, **kwargs) as writer:
+        for item in items:
+            writer.write(projection(item) if projection else item)
+            if not writer.rows % 1000:
+                now = time.monotonic()
+                if now - last_report >= report_interval:
+                    logger.info('Exported %d rows to %s (%.0f rows/s)', writer.rows, path,
+                                writer.rows / (now - start))
+                    last_report = now
+    seconds = time.monotonic() - start
+    return {'rows': writer.rows, 'seconds': seconds, 'rows_per_sec': writer.rows / seconds if seconds else 0.0}
+
+
+class ExportSink():
+    """ Crawler sink writing a file per kind of entity in `directory`
+
+    The files are appended to, like JSONLSink's, so a crawl resumed from a checkpoint adds to them.
+    Parquet and Arrow files can not be appended to: a run adds a file (`tracks.1.parquet`, ...)
+    next to the ones of the runs before, read them together as one dataset. They are complete only
+    after close().
+
+    format:   A key of WRITERS.
+    fields:   Optional. Fields for every kind ({kind: fields}) or for all of them (list), see `Projection`.
+    """
+
+    def __init__(self, directory, format='ndjson', fields=None, **kwargs):
+        self.directory = directory
+        self.format = format
+        self.kwargs = kwargs
+        self._fields = fields
+        self._writers = dict()
+        self._projections = dict()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, kind, obj) -> None:
+        writer = self._writers.get(kind)
+        if writer is None:
+            fields = self._fields.get(kind) if isinstance(self._fields, dict) else self._fields
+            self._projections[kind] = Projection(fields) if fields else None
+            writer = self._writers[kind] = self._open(kind, fields and self._projections[kind].columns)
+        projection = self._projections[kind]
+        writer.write(projection(obj) if projection else obj)
+
+    def _open(self, kind, columns):
+        writer = WRITERS[self.format]
+        path = os.path.join(self.directory, f'{kind}.{writer.extension}')
+        if writer.appendable:
+            return writer(path, columns=columns, append=True, **self.kwargs)
+        part = 0
+        while os.path.exists(path):
+            part += 1
+            path = os.path.join(self.directory, f'{kind}.{part}.{writer.extension}')
+        return writer(path, columns=columns, **self.kwargs)
+
+    def flush(self) -> None:
+        for writer in self._writers.values():
+            writer.flush()
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
@@ -0,0 +1,231 @@
+""" Request and token instrumentation
+
+Register hooks to get an event for every HTTP attempt and every token request:
+
+    metrics = Metrics()
+    sp = Spotify(auth_manager=..., hooks=Hooks(metrics, print))
+    ...
+    metrics.snapshot()['albums/{id}']
+
+A hook is a function taking `RequestEvent`s, or an object with `on_request(event)` and/or
+`on_token(event)` methods (`Metrics`, `PrometheusExporter`). Endpoints are named by their
+path template, so all the albums share 'albums/{id}' instead of one name per album ID.
+Without hooks the clients do not even read the clock.
+"""
+import bisect
+import threading
+from typing import NamedTuple
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+from spotifyapi.common import logger
+from spotifyapi.exceptions import SpotifyError
+
+
+__all__ = [
+    "RequestEvent",
+    "TokenEvent",
+    "Hooks",
+    "Metrics",
+    "PrometheusExporter"
+]
+
+
+class RequestEvent(NamedTuple):
+    endpoint: str       # path template, e.g. albums/{id}
+    method: str
+    status: int         # None when the request failed without a response
+    duration: float     # seconds, 0 for cache hits
+    attempt: int        # 1 for the first try, higher for retries (429, 5xx, transport errors)
+    size: int           # response body in bytes
+    cache_hit: bool     # served from the response cache without a request
+    error: str = None   # exception class name when the request failed without a response
+
+
+class TokenEvent(NamedTuple):
+    flow: str           # auth manager class, e.g. ClientCredentials
+    action: str         # get (first token or an expired one) or refresh
+    duration: float
+    error: str = None
+
+
+class Hooks():
+    """ Registry of request and token hooks shared by clients and auth managers
+
+    Exceptions raised by hooks are logged and do not break the API call.
+    """
+
+    def __init__(self, *hooks):
+        self.request_hooks = []
+        self.token_hooks = []
+        for hook in hooks:
+            self.register(hook)
+
+    def register(self, hook) -> None:
+        on_request = getattr(hook, 'on_request', None)
+        on_token = getattr(hook, 'on_token', None)
+        if on_request is None and on_token is None:
+            on_request = hook
+        if on_request is not None:
+            self.request_hooks.append(on_request)
+        if on_token is not None:
+            self.token_hooks.append(on_token)
+
+    def __bool__(self):
+        return bool(self.request_hooks or self.token_hooks)
+
+    def request(self, event) -> None:
+        self._emit(self.request_hooks, event)
+
+    def token(self, event) -> None:
+        self._emit(self.token_hooks, event)
+
+    @staticmethod
+    def _emit(hooks, event) -> None:
+        for hook in hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception('Metrics hook %r failed', hook)
+
+
+class Histogram():
+    """ Latency histogram with fixed bucket upper bounds in seconds """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q) -> float:
+        """ Upper bound of the bucket holding the q-quantile, inf when it is above the last bucket """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'buckets': dict(zip(self.buckets + (float('inf'),), self.counts))}
+
+
+class EndpointStats():
+    __slots__ = ('latency', 'statuses', 'bytes', 'retries', 'cache_hits', 'errors')
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statuses = dict()
+        self.bytes = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        return {'latency': self.latency.to_dict(), 'statuses': dict(self.statuses), 'bytes': self.bytes,
+                'retries': self.retries, 'cache_hits': self.cache_hits, 'errors': self.errors}
+
+
+class Metrics():
+    """ In-process metrics: latency histogram, status codes, bytes, retries and cache hits per endpoint
+
+    Cache hits are counted but kept out of the latency histogram.
+    """
+
+    def __init__(self, buckets=Histogram.BUCKETS):
+        self.buckets = buckets
+        self.endpoints = dict()
+        self.tokens = dict()
+        self._lock = threading.Lock()
+
+    def on_request(self, event) -> None:
+        with self._lock:
+            stats = self.endpoints.get(event.endpoint)
+            if stats is None:
+                stats = self.endpoints[event.endpoint] = EndpointStats(self.buckets)
+            if event.cache_hit:
+                stats.cache_hits += 1
+                return
+            stats.latency.observe(event.duration)
+            stats.bytes += event.size
+            if event.attempt > 1:
+                stats.retries += 1
+            if event.status is None:
+                stats.errors += 1
+            else:
+                stats.statuses[event.status] = stats.statuses.get(event.status, 0) + 1
+
+    def on_token(self, event) -> None:
+        key = f'{event.flow}.{event.action}'
+        with self._lock:
+            histogram = self.tokens.get(key)
+            if histogram is None:
+                histogram = self.tokens[key] = Histogram(self.buckets)
+            histogram.observe(event.duration)
+
+    def snapshot(self) -> dict:
+        """ {endpoint: stats} for all the endpoints, token requests under 'token:<flow>.<action>' """
+        with self._lock:
+            snapshot = {endpoint: stats.to_dict() for endpoint, stats in self.endpoints.items()}
+            snapshot.update((f'token:{key}', histogram.to_dict()) for key, histogram in self.tokens.items())
+        return snapshot
+
+    def reset(self) -> None:
+        with self._lock:
+            self.endpoints.clear()
+            self.tokens.clear()
+
+
+class PrometheusExporter():
+    """ Export the events as Prometheus metrics. Needs prometheus_client: pip install spotifyapi[metrics]
+
+    Serve them with `prometheus_client.start_http_server(port)` or your app's metrics endpoint.
+    """
+
+    def __init__(self, registry=None, namespace='spotifyapi'):
+        if prometheus_client is None:
+            raise SpotifyError('PrometheusExporter needs prometheus_client. '
+                               'Install it with "pip install spotifyapi[metrics]"')
+        registry = registry or prometheus_client.REGISTRY
+        self.requests = prometheus_client.Histogram(
+            'request_duration_seconds', 'Spotify Web API request latency', ['endpoint', 'method', 'status'],
+            namespace=namespace, registry=registry)
+        self.response_bytes = prometheus_client.Counter(
+            'response_bytes', 'Spotify Web API response body size', ['endpoint'],
+            namespace=namespace, registry=registry)
+        self.retries = prometheus_client.Counter(
+            'retries', 'Spotify Web API requests repeated after 429, 5xx or transport errors', ['endpoint'],
+            namespace=namespace, registry=registry)
+        self.cache_hits = prometheus_client.Counter(
+            'cache_hits', 'Spotify Web API responses served from the cache', ['endpoint'],
+            namespace=namespace, registry=registry)
+        self.tokens = prometheus_client.Histogram(
+            'token_duration_seconds', 'Spotify access token requests', ['flow', 'action', 'error'],
+            namespace=namespace, registry=registry)
+
+    def on_request(self, event) -> None:
+        if event.cache_hit:
+            self.cache_hits.labels(event.endpoint).inc()
+            return
+        status = str(event.status) if event.status is not None else event.error
+        self.requests.labels(event.endpoint, event.method, status).observe(event.duration)
+        self.response_bytes.labels(event.endpoint).inc(event.size)
+        if event.attempt > 1:
+            self.retries.labels(event.endpoint).inc()
+
+    def on_token(self, event) -> None:
+        self.tokens.labels(event.flow, event.action, event.error or '').observe(event.duration)
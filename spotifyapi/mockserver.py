@@ -0,0 +1,568 @@
+""" Local mock of the Spotify Web API and accounts service
+
+For trying the clients offline, testing apps built on them and benchmarking (`spotifyapi.bench`).
+The catalog is generated from the requested IDs, so any ID exists; `fixtures` replace the
+answers of chosen paths. Latency, 5xx errors and 429s can be injected.
+
+    with MockSpotify(latency=0.02, error_rate=0.01) as mock:
+        sp = mock.spotify()
+        sp.getAlbum('abc')
+
+Served endpoints: albums, artists, tracks, audio-features, search, browse/categories,
+recommendations/available-genre-seeds, me/player* and the accounts service's api/token.
+"""
+import hashlib
+import json
+import os
+import queue
+import random
+import select
+import socket
+import ssl
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+from spotifyapi.exceptions import SpotifyError
+
+
+__all__ = [
+    "MockSpotify"
+]
+
+
+PAGE_TOTAL = 120    # items in every generated paging object
+# available_markets of the catalog objects: the real ones list about as many
+MARKETS = [first + second for first in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' for second in 'ABCDEFG'][:180]
+
+def _image(id):
+    return [{'height': 640, 'width': 640, 'url': f'https://i.scdn.co/image/{id}'}]
+
+def _artist(id):
+    return {'id': id, 'name': f'Artist {id}', 'type': 'artist', 'uri': f'spotify:artist:{id}',
+            'href': f'https://api.spotify.com/v1/artists/{id}', 'genres': ['mock'], 'popularity': len(id) * 7 % 100,
+            'followers': {'href': None, 'total': 1000}, 'images': _image(id), 'external_urls': {}}
+
+def _simple_album(id):
+    return {'id': id, 'name': f'Album {id}', 'type': 'album', 'uri': f'spotify:album:{id}', 'album_type': 'album',
+            'href': f'https://api.spotify.com/v1/albums/{id}', 'release_date': '2020-01-01',
+            'release_date_precision': 'day', 'total_tracks': PAGE_TOTAL, 'images': _image(id),
+            'artists': [_simple_artist(f'{id}a')], 'available_markets': MARKETS,
+            'external_urls': {'spotify': f'https://open.spotify.com/album/{id}'}}
+
+def _simple_artist(id):
+    return {'id': id, 'name': f'Artist {id}', 'type': 'artist', 'uri': f'spotify:artist:{id}'}
+
+def _simple_track(id, number=1):
+    return {'id': id, 'name': f'Track {id}', 'type': 'track', 'uri': f'spotify:track:{id}', 'duration_ms': 200000,
+            'track_number': number, 'disc_number': 1, 'explicit': False, 'artists': [_simple_artist(f'{id}a')],
+            'available_markets': MARKETS, 'external_urls': {'spotify': f'https://open.spotify.com/track/{id}'}}
+
+def _track(id):
+    return dict(_simple_track(id), album=_simple_album(f'{id}al'), popularity=50)
+
+def _album(id, url):
+    return dict(_simple_album(id), label='Mock', popularity=50, copyrights=[], genres=[],
+                tracks=_page(f'{url}albums/{id}/tracks', [_simple_track(f'{id}t{n}', n + 1) for n in range(20)],
+                             0, 20, PAGE_TOTAL))
+
+def _audio_features(id):
+    return {'id': id, 'type': 'audio_features', 'uri': f'spotify:track:{id}', 'danceability': 0.5, 'energy': 0.5,
+            'tempo': 120.0, 'key': 5, 'mode': 1, 'duration_ms': 200000, 'time_signature': 4}
+
+def _page(href, items, offset, limit, total, query=''):
+    """ Paging object, `query` keeps the other parameters (search's q and type) in next and previous """
+    href = f'{href}?{query}&' if query else f'{href}?'
+    next = f'{href}offset={offset + limit}&limit={limit}' if offset + limit < total else None
+    previous = f'{href}offset={max(0, offset - limit)}&limit={limit}' if offset else None
+    return {'href': f'{href}offset={offset}&limit={limit}', 'items': items, 'limit': limit, 'next': next,
+            'offset': offset, 'previous': previous, 'total': total}
+
+
+# self-signed certificate of MockSpotify(tls=True), for 127.0.0.1 and localhost
+CERT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mockserver.crt')
+KEY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mockserver.key')
+
+# injected failure: the connection is closed without an answer
+_DROP = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes: without it keep-alive clients wait for delayed ACKs
+    disable_nagle_algorithm = True
+    mock = None
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.mock._lock:
+            self.mock.connections += 1
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        response = self.mock._respond(method, self.path, body, self.headers)
+        if response is None:
+            # the request was read, the client gets no answer
+            self.close_connection = True
+            return
+        status, headers, data = response
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _H2Connection():
+    """ HTTP/2 connection: its streams are answered concurrently, the socket is used by this thread only """
+
+    def __init__(self, mock, sock):
+        self.mock = mock
+        self.sock = sock
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.requests = dict()      # stream id: (headers, body chunks)
+        self.answers = queue.SimpleQueue()
+        self.pending = dict()       # stream id: data waiting for the flow control window
+        self._wake_r, self._wake_w = socket.socketpair()
+
+    def serve(self) -> None:
+        with self.mock._lock:
+            self.mock.connections += 1
+        self.conn.initiate_connection()
+        try:
+            self.sock.sendall(self.conn.data_to_send())
+            while True:
+                readable = [self.sock] if self.sock.pending() else \
+                    select.select([self.sock, self._wake_r], [], [])[0]
+                if self._wake_r in readable:
+                    self._wake_r.recv(4096)
+                if self.sock in readable:
+                    data = self.sock.recv(65536)
+                    if not data:
+                        return
+                    for event in self.conn.receive_data(data):
+                        if isinstance(event, h2.events.ConnectionTerminated):
+                            return
+                        self._event(event)
+                self._send_answers()
+                self.sock.sendall(self.conn.data_to_send())
+        finally:
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _event(self, event) -> None:
+        if isinstance(event, h2.events.RequestReceived):
+            self.requests[event.stream_id] = (CaseInsensitiveDict(event.headers), [])
+        elif isinstance(event, h2.events.DataReceived):
+            self.requests[event.stream_id][1].append(event.data)
+            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded):
+            headers, chunks = self.requests.pop(event.stream_id)
+            threading.Thread(target=self._answer, args=(event.stream_id, headers, b''.join(chunks)),
+                             daemon=True).start()
+        elif isinstance(event, h2.events.StreamReset):
+            self.pending.pop(event.stream_id, None)
+
+    def _answer(self, stream_id, headers, body) -> None:
+        self.answers.put((stream_id, self.mock._respond(headers[':method'], headers[':path'], body, headers)))
+        self._wake_w.send(b'\0')
+
+    def _send_answers(self) -> None:
+        conn = self.conn
+        while not self.answers.empty():
+            stream_id, response = self.answers.get()
+            if response is None:
+                conn.reset_stream(stream_id)
+                continue
+            status, headers, data = response
+            conn.send_headers(stream_id, [(':status', str(status))] + [(name.lower(), value)
+                                                                      for name, value in headers.items()],
+                              end_stream=not data)
+            if data:
+                self.pending[stream_id] = data
+        for stream_id, data in list(self.pending.items()):
+            try:
+                while data:
+                    size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(data))
+                    if size <= 0:
+                        break
+                    conn.send_data(stream_id, data[:size], end_stream=size == len(data))
+                    data = data[size:]
+            except h2.exceptions.StreamClosedError:
+                data = None
+            if data:
+                self.pending[stream_id] = data
+            else:
+                del self.pending[stream_id]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    mock = None
+    ssl_context = None
+
+    def handle_error(self, request, client_address):
+        # clients going away before their answer (timeouts, closed sessions) are not errors of the mock
+        if isinstance(sys.exc_info()[1], (ConnectionError, ssl.SSLError)):
+            return
+        super().handle_error(request, client_address)
+
+    def finish_request(self, request, client_address):
+        if self.ssl_context is None:
+            return super().finish_request(request, client_address)
+        # the handshake runs on the connection's thread, not on the accepting one
+        tls = self.ssl_context.wrap_socket(request, server_side=True)
+        try:
+            with self.mock._lock:
+                self.mock.handshakes += 1
+            if tls.selected_alpn_protocol() == 'h2':
+                _H2Connection(self.mock, tls).serve()
+            else:
+                super().finish_request(tls, client_address)
+        finally:
+            tls.close()
+
+
+class MockSpotify():
+    """ Spotify Web API and accounts service on a local port
+
+    latency:          Seconds added to every response, or (min, max) for a random delay.
+    error_rate:       Share of API requests answered with 500.
+    throttle_rate:    Share of API requests answered with 429.
+    retry_after:      Retry-After of the injected 429s, in seconds.
+    fixtures:         {'albums/<id>': body, ...} answers returned instead of the generated ones.
+    token_expires_in: Lifetime of the issued access tokens.
+    cache_max_age:    Optional. Send ETag and Cache-Control: max-age with catalog responses and answer
+                      If-None-Match with 304.
+    seed:             Seed of the random error injection.
+
+    tls:              Serve HTTPS with a self-signed certificate, `cert_path` is the CA bundle of the clients.
+                      `session()` and the clients made by the mock trust it.
+    http2:            Serve HTTP/2 too (TLS with ALPN), for `HTTP2Session`. Needs h2.
+
+    `fail_next(status, count)` answers the next `count` API requests with `status`.
+    `drop_next(count)` closes the connection of the next `count` API requests without an answer.
+    Counters: `requests` ({path template: count}), `tokens_issued`, `connections` (accepted), `handshakes` (TLS),
+    `dropped` (requests left without an answer).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0, throttle_rate=0, retry_after=1,
+                 fixtures=None, token_expires_in=3600, cache_max_age=None, seed=None, tls=False, http2=False):
+        if http2 and h2 is None:
+            raise SpotifyError('MockSpotify(http2=True) needs h2. Install it with "pip install spotifyapi[http2]"')
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.fixtures = dict(fixtures or {})
+        self.token_expires_in = token_expires_in
+        self.cache_max_age = cache_max_age
+        # playback of the user: None answers 204
+        self.player = {'is_playing': True, 'progress_ms': 1000, 'shuffle_state': False, 'repeat_state': 'off',
+                       'timestamp': 0, 'context': None, 'currently_playing_type': 'track', 'item': _track('mock'),
+                       'device': {'id': 'mockdevice', 'name': 'Mock', 'type': 'Computer', 'is_active': True,
+                                  'is_private_session': False, 'is_restricted': False, 'volume_percent': 50}}
+
+        self.requests = dict()
+        self.tokens_issued = 0
+        self.connections = 0
+        self.handshakes = 0
+        self.tls = tls or http2
+        self.dropped = 0
+        self._failures = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self._server = _Server((host, port), handler)
+        self._server.mock = self
+        if self.tls:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(CERT_PATH, KEY_PATH)
+            context.set_alpn_protocols(['h2', 'http/1.1'] if http2 else ['http/1.1'])
+            self._server.ssl_context = context
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'{"https" if self.tls else "http"}://{host}:{port}/'
+
+    @property
+    def api_url(self) -> str:
+        """ SPOTIFY_API_URL of the clients """
+        return f'{self.url}v1/'
+
+    @property
+    def token_url(self) -> str:
+        """ AUTH_TOKEN_URL of the auth managers """
+        return f'{self.url}api/token'
+
+    def start(self) -> 'MockSpotify':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='spotify-mock', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def fail_next(self, status, count=1) -> None:
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def drop_next(self, count=1) -> None:
+        with self._lock:
+            self._failures.extend([_DROP] * count)
+
+    @property
+    def cert_path(self) -> str:
+        """ CA bundle trusting the mock's certificate """
+        return CERT_PATH
+
+    def session(self, http2=False, **kwargs):
+        """ create_session(**kwargs), or HTTP2Session(**kwargs), trusting the mock's certificate """
+        from spotifyapi.transport import HTTP2Session, create_session
+        if http2:
+            return HTTP2Session(verify=CERT_PATH, **kwargs)
+        session = create_session(**kwargs)
+        if self.tls:
+            session.verify = CERT_PATH
+        return session
+
+    def auth_manager(self, **kwargs):
+        """ ClientCredentials getting its tokens from the mock """
+        from spotifyapi.auth import ClientCredentials
+        if self.tls:
+            kwargs.setdefault('request_session', self.session())
+        auth = ClientCredentials(kwargs.pop('client_id', 'mock'), kwargs.pop('client_secret', 'mock'), **kwargs)
+        auth.AUTH_TOKEN_URL = self.token_url
+        return auth
+
+    def spotify(self, auth_manager=None, **kwargs):
+        """ Spotify client sending its requests to the mock """
+        from spotifyapi.spotify import Spotify
+        if self.tls:
+            kwargs.setdefault('request_session', self.session())
+        sp = Spotify(auth_manager=auth_manager or self.auth_manager(), **kwargs)
+        sp.SPOTIFY_API_URL = self.api_url
+        return sp
+
+    def async_spotify(self, auth_manager=None, **kwargs):
+        """ AsyncSpotify client sending its requests to the mock """
+        from spotifyapi.aio import AsyncSpotify
+        sp = AsyncSpotify(auth_manager=auth_manager or self.auth_manager(), **kwargs)
+        sp.SPOTIFY_API_URL = self.api_url
+        return sp
+
+    ## Answers
+
+    def _respond(self, method, target, body, request_headers):
+        """ (status, headers, body) of a request, None to leave it without an answer """
+        url = urlparse(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, answer, headers = self._answer(method, url.path, query, body, request_headers)
+        if status == _DROP:
+            return None
+        headers = dict(headers or {})
+        if status >= 400 and answer is None:
+            answer = {'error': {'status': status, 'message': BaseHTTPRequestHandler.responses.get(status, ('Error',))[0]}}
+        data = json.dumps(answer).encode() if answer is not None else b''
+        if status == 200 and method == 'GET' and self.cache_max_age and url.path.startswith('/v1/') \
+                and not url.path.startswith('/v1/me/'):
+            # catalog responses are cacheable, like the real ones
+            etag = f'"{hashlib.sha1(data).hexdigest()[:16]}"'
+            headers.update({'ETag': etag, 'Cache-Control': f'public, max-age={self.cache_max_age}'})
+            if request_headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+        if data:
+            headers['Content-Type'] = 'application/json'
+        headers['Content-Length'] = str(len(data))
+        return status, headers, data
+
+    def _count(self, template) -> None:
+        with self._lock:
+            self.requests[template] = self.requests.get(template, 0) + 1
+
+    def _delay(self) -> None:
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def _injected(self):
+        """ Status of an injected failure, None to answer normally """
+        with self._lock:
+            if self._failures:
+                return self._failures.pop(0)
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def _answer(self, method, path, query, body, headers) -> tuple:
+        self._delay()
+        if path == '/api/token':
+            self._count('api/token')
+            return self._token(body)
+
+        if not path.startswith('/v1/'):
+            return 404, None, None
+        if not (headers.get('Authorization') or '').startswith('Bearer '):
+            return 401, {'error': {'status': 401, 'message': 'No token provided'}}, None
+        status = self._injected()
+        if status == _DROP:
+            with self._lock:
+                self.dropped += 1
+            return _DROP, None, None
+        if status == 429:
+            return 429, None, {'Retry-After': str(self.retry_after)}
+        if status is not None:
+            return status, None, None
+
+        parts = path[len('/v1/'):].strip('/').split('/')
+        if '/'.join(parts) in self.fixtures:
+            self._count('/'.join(parts))
+            return 200, self.fixtures['/'.join(parts)], None
+        template, status, answer = self._route(method, parts, query, body)
+        self._count(template)
+        return status, answer, None
+
+    def _token(self, body) -> tuple:
+        form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        grant_type = form.get('grant_type')
+        if grant_type not in ('client_credentials', 'authorization_code', 'refresh_token'):
+            return 400, {'error': 'unsupported_grant_type', 'error_description': f'grant_type {grant_type}'}, None
+        with self._lock:
+            self.tokens_issued += 1
+            number = self.tokens_issued
+        token = {'access_token': f'mock-token-{number}', 'token_type': 'Bearer', 'expires_in': self.token_expires_in}
+        if grant_type != 'client_credentials':
+            token['scope'] = form.get('scope', '')
+            if grant_type == 'authorization_code':
+                token['refresh_token'] = 'mock-refresh-token'
+        return 200, token, None
+
+    def _route(self, method, parts, query, body) -> tuple:
+        """ (path template, status, body) of an API request """
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 20))
+        ids = query['ids'].split(',') if 'ids' in query else None
+        url = self.api_url
+        head, rest = parts[0], parts[1:]
+
+        if head == 'albums':
+            if not rest:
+                return 'albums', 200, {'albums': [_album(id, url) for id in ids or ()]}
+            if rest[1:] == ['tracks']:
+                items = [_simple_track(f'{rest[0]}t{n}', n + 1) for n in range(offset, min(offset + limit, PAGE_TOTAL))]
+                return 'albums/{id}/tracks', 200, _page(f'{url}albums/{rest[0]}/tracks', items, offset, limit,
+                                                        PAGE_TOTAL)
+            return 'albums/{id}', 200, _album(rest[0], url)
+
+        if head == 'artists':
+            if not rest:
+                return 'artists', 200, {'artists': [_artist(id) for id in ids or ()]}
+            if rest[1:] == ['albums']:
+                items = [_simple_album(f'{rest[0]}al{n}') for n in range(offset, min(offset + limit, PAGE_TOTAL))]
+                groups = urlencode({'include_groups': query['include_groups']}) if 'include_groups' in query else ''
+                return 'artists/{id}/albums', 200, _page(f'{url}artists/{rest[0]}/albums', items, offset, limit,
+                                                         PAGE_TOTAL, groups)
+            if rest[1:] == ['related-artists']:
+                return 'artists/{id}/related-artists', 200, {'artists': [_artist(f'{rest[0]}r{n}') for n in range(20)]}
+            return 'artists/{id}', 200, _artist(rest[0])
+
+        if head == 'tracks':
+            return 'tracks', 200, {'tracks': [_track(id) for id in ids or ()]}
+
+        if head == 'audio-features':
+            return 'audio-features', 200, {'audio_features': [_audio_features(id) for id in ids or ()]}
+
+        if head == 'search':
+            answer = dict()
+            end = min(offset + limit, PAGE_TOTAL)
+            make = {'album': _simple_album, 'artist': _artist, 'track': _track}
+            search_query = urlencode({'q': query.get('q', ''), 'type': query.get('type', 'track')})
+            for q_type in query.get('type', 'track').split(','):
+                items = [make.get(q_type, _artist)(f'{q_type}{n}') for n in range(offset, end)]
+                answer[f'{q_type}s'] = _page(f'{url}search', items, offset, limit, PAGE_TOTAL, search_query)
+            return 'search', 200, answer
+
+        if head == 'browse' and rest[:1] == ['categories']:
+            if rest[2:] == ['playlists']:
+                items = [{'id': f'{rest[1]}pl{n}', 'name': f'Playlist {n}', 'type': 'playlist', 'images': [],
+                          'owner': {'id': 'spotify'}, 'tracks': {'total': 50}}
+                         for n in range(offset, min(offset + limit, PAGE_TOTAL))]
+                return 'browse/categories/{category_id}/playlists', 200, {
+                    'message': 'Mock', 'playlists': _page(f'{url}browse/categories/{rest[1]}/playlists', items,
+                                                          offset, limit, PAGE_TOTAL)}
+            items = [{'id': f'category{n}', 'name': f'Category {n}', 'href': None, 'icons': []}
+                     for n in range(offset, min(offset + limit, PAGE_TOTAL))]
+            return 'browse/categories', 200, {'categories': _page(f'{url}browse/categories', items, offset, limit,
+                                                                  PAGE_TOTAL)}
+
+        if head == 'recommendations' and rest == ['available-genre-seeds']:
+            return 'recommendations/available-genre-seeds', 200, {'genres': ['mock', 'rock', 'jazz']}
+
+        if head == 'me' and rest[:1] == ['player']:
+            return self._player(method, rest[1:], body)
+
+        return '/'.join(parts), 404, None
+
+    def _player(self, method, rest, body) -> tuple:
+        player = self.player
+        if rest == ['devices']:
+            return 'me/player/devices', 200, {'devices': [player['device']] if player else []}
+        if method == 'PUT' and rest == ['pause']:
+            if player:
+                player['is_playing'] = False
+            return 'me/player/pause', 204, None
+        if method == 'PUT' and rest == ['play']:
+            request = json.loads(body) if body else {}
+            if player:
+                player['is_playing'] = True
+                if request.get('uris'):
+                    player['item'] = _track(request['uris'][0].rsplit(':', 1)[-1])
+                    player['progress_ms'] = request.get('position_ms', 0)
+            return 'me/player/play', 204, None
+        template = 'me/player/currently-playing' if rest == ['currently-playing'] else 'me/player'
+        if not player:
+            return template, 204, None
+        return template, 200, player
@@ -0,0 +1,467 @@
+""" Typed Spotify objects
+
+Optional wrappers around the decoded JSON returned by the Web API (see SpotifyObjects.md).
+A model does not keep the decoded dict: its declared fields are kept in one list, nested
+objects (artists, album, paging items, ...) as models too. The bulky parts most programs
+never read (images, available_markets, external_urls, external_ids, copyrights, restrictions)
+and the fields that are not declared are kept as compact JSON bytes, decoded only when they
+are read. Models use `__slots__`, so there is no instance dict either.
+
+`.raw` builds the decoded dict again on every access, it is the escape hatch for the fields
+without an attribute. Models compare equal when their `.raw` are equal and hash by `id`.
+
+    sp = Spotify(auth_manager=..., models=True)
+    album = sp.getAlbum('4aawyAB9vmqN3uQ7FjRGTy')
+    album.name, album.images[0].url, album.raw['label']
+"""
+import json
+
+
+__all__ = [
+    "SpotifyObject",
+    "Paging",
+    "Image",
+    "User",
+    "Artist",
+    "Album",
+    "Track",
+    "AudioFeatures",
+    "Playlist",
+    "Category",
+    "Device",
+    "Playback",
+    "wrap",
+    "result_model"
+]
+
+
+class _Missing():
+    """ Value of a field absent from the object, unlike a null one """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_MISSING'
+
+_MISSING = _Missing()
+
+def _pack(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class Field():
+    """ Model attribute for `raw[name]`
+
+    model:  Optional. Class (or its name) the value is wrapped into, with `many` every item of a list.
+    lazy:   Keep the value as JSON bytes and decode it when it is read first.
+    """
+
+    def __init__(self, model=None, many=False, lazy=False):
+        self._model = model
+        self.many = many
+        self.lazy = lazy
+        self.name = None
+        self.index = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    @property
+    def model(self):
+        # names let models refer to the classes defined below them
+        if isinstance(self._model, str):
+            self._model = globals()[self._model]
+        return self._model
+
+    def model_of(self, owner):
+        return self.model
+
+    def pack(self, value, owner):
+        """ Value kept by an object of the `owner` class """
+        if value is None or value is _MISSING:
+            return value
+        if self.lazy:
+            return _pack(value)
+        return self.wrap(value, owner)
+
+    def wrap(self, value, owner):
+        model = self.model_of(owner)
+        if model is None:
+            return value
+        if self.many:
+            return [model(item) if item is not None else None for item in value]
+        return model(value)
+
+    def unpack(self, value):
+        """ Decoded value, as in `.raw` """
+        if value.__class__ is bytes:
+            return json.loads(value)
+        if self._model is None:
+            return value
+        if self.many:
+            return [item.raw if item is not None else None for item in value]
+        return value.raw
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj._values[self.index]
+        if value is _MISSING:
+            return None
+        if value.__class__ is bytes:
+            value = obj._values[self.index] = self.wrap(json.loads(value), owner)
+        return value
+
+
+class _Items(Field):
+    """ `items` of a paging object, wrapped into the `item_model` of its class """
+
+    def __init__(self):
+        super().__init__(many=True)
+
+    def model_of(self, owner):
+        return owner.item_model
+
+    def unpack(self, value):
+        return [item.raw if isinstance(item, SpotifyObject) else item for item in value]
+
+
+class SpotifyObject():
+    __slots__ = ('_values', '_extra')
+    _fields = ()
+    _index = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = list(cls._fields)
+        index = dict(cls._index)
+        for field in vars(cls).values():
+            if isinstance(field, Field):
+                field.index = index.setdefault(field.name, len(fields))
+                if field.index == len(fields):
+                    fields.append(field)
+                else:
+                    fields[field.index] = field
+        cls._fields = tuple(fields)
+        cls._index = index
+
+    def __init__(self, raw):
+        cls = self.__class__
+        self._values = [field.pack(raw.get(field.name, _MISSING), cls) for field in cls._fields]
+        index = cls._index
+        extra = {key: value for key, value in raw.items() if key not in index}
+        self._extra = _pack(extra) if extra else None
+
+    @property
+    def raw(self) -> dict:
+        raw = {field.name: field.unpack(value) if value is not None else None
+               for field, value in zip(self._fields, self._values) if value is not _MISSING}
+        if self._extra is not None:
+            raw.update(json.loads(self._extra))
+        return raw
+
+    def _get(self, name):
+        """ Value of a field, declared or not. None when missing """
+        index = self._index.get(name)
+        if index is not None:
+            return self._fields[index].__get__(self, self.__class__)
+        return json.loads(self._extra).get(name) if self._extra is not None else None
+
+    def __repr__(self):
+        fields = ', '.join(f'{key}={self._get(key)!r}' for key in ('id', 'name') if self._get(key) is not None)
+        return f'{self.__class__.__name__}({fields})'
+
+    def __eq__(self, other):
+        return isinstance(other, SpotifyObject) and self.raw == other.raw
+
+    def __hash__(self):
+        return hash(self._get('id'))
+
+
+class Paging(SpotifyObject):
+    __slots__ = ()
+    item_model = None
+
+    href = Field()
+    items = _Items()
+    limit = Field()
+    next = Field()
+    offset = Field()
+    previous = Field()
+    total = Field()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(offset={self.offset}, total={self.total}, items={len(self)})'
+
+
+class Image(SpotifyObject):
+    __slots__ = ()
+
+    height = Field()
+    width = Field()
+    url = Field()
+
+    def __repr__(self):
+        return f'Image({self.width}x{self.height}, {self.url!r})'
+
+
+class User(SpotifyObject):
+    __slots__ = ()
+
+    id = Field()
+    display_name = Field()
+    external_urls = Field(lazy=True)
+    followers = Field()
+    href = Field()
+    images = Field(Image, many=True, lazy=True)
+    type = Field()
+    uri = Field()
+
+
+class Artist(SpotifyObject):
+    """ artist object (full or simplified) """
+    __slots__ = ()
+
+    id = Field()
+    name = Field()
+    external_urls = Field(lazy=True)
+    followers = Field()
+    genres = Field()
+    href = Field()
+    images = Field(Image, many=True, lazy=True)
+    popularity = Field()
+    type = Field()
+    uri = Field()
+
+
+class Album(SpotifyObject):
+    """ album object (full or simplified) """
+    __slots__ = ()
+
+    id = Field()
+    name = Field()
+    album_group = Field()
+    album_type = Field()
+    artists = Field(Artist, many=True)
+    available_markets = Field(lazy=True)
+    copyrights = Field(lazy=True)
+    external_ids = Field(lazy=True)
+    external_urls = Field(lazy=True)
+    genres = Field()
+    href = Field()
+    images = Field(Image, many=True, lazy=True)
+    label = Field()
+    popularity = Field()
+    release_date = Field()
+    release_date_precision = Field()
+    restrictions = Field(lazy=True)
+    total_tracks = Field()
+    tracks = Field('TrackPage')
+    type = Field()
+    uri = Field()
+
+
+class Track(SpotifyObject):
+    """ track object (full or simplified) """
+    __slots__ = ()
+
+    id = Field()
+    name = Field()
+    album = Field(Album)
+    artists = Field(Artist, many=True)
+    available_markets = Field(lazy=True)
+    disc_number = Field()
+    duration_ms = Field()
+    explicit = Field()
+    external_ids = Field(lazy=True)
+    external_urls = Field(lazy=True)
+    href = Field()
+    is_local = Field()
+    is_playable = Field()
+    linked_from = Field('Track')
+    popularity = Field()
+    preview_url = Field()
+    restrictions = Field(lazy=True)
+    track_number = Field()
+    type = Field()
+    uri = Field()
+
+
+class AudioFeatures(SpotifyObject):
+    __slots__ = ()
+
+    id = Field()
+    acousticness = Field()
+    analysis_url = Field()
+    danceability = Field()
+    duration_ms = Field()
+    energy = Field()
+    instrumentalness = Field()
+    key = Field()
+    liveness = Field()
+    loudness = Field()
+    mode = Field()
+    speechiness = Field()
+    tempo = Field()
+    time_signature = Field()
+    track_href = Field()
+    type = Field()
+    uri = Field()
+    valence = Field()
+
+
+class Playlist(SpotifyObject):
+    """ playlist object (simplified) """
+    __slots__ = ()
+
+    id = Field()
+    name = Field()
+    collaborative = Field()
+    description = Field()
+    external_urls = Field(lazy=True)
+    href = Field()
+    images = Field(Image, many=True, lazy=True)
+    owner = Field(User)
+    public = Field()
+    snapshot_id = Field()
+    tracks = Field()
+    type = Field()
+    uri = Field()
+
+
+class Category(SpotifyObject):
+    __slots__ = ()
+
+    id = Field()
+    name = Field()
+    href = Field()
+    icons = Field(Image, many=True, lazy=True)
+
+
+class Device(SpotifyObject):
+    __slots__ = ()
+
+    id = Field()
+    name = Field()
+    is_active = Field()
+    is_private_session = Field()
+    is_restricted = Field()
+    type = Field()
+    volume_percent = Field()
+
+
+class Playback(SpotifyObject):
+    """ current playback / currently playing object """
+    __slots__ = ()
+
+    device = Field(Device)
+    shuffle_state = Field()
+    repeat_state = Field()
+    timestamp = Field()
+    context = Field()
+    progress_ms = Field()
+    item = Field(Track)
+    currently_playing_type = Field()
+    actions = Field()
+    is_playing = Field()
+
+    def __repr__(self):
+        return f'Playback(is_playing={self.is_playing}, item={self.item!r})'
+
+
+## Paging objects
+
+class AlbumPage(Paging):
+    __slots__ = ()
+    item_model = Album
+
+class ArtistPage(Paging):
+    __slots__ = ()
+    item_model = Artist
+
+class TrackPage(Paging):
+    __slots__ = ()
+    item_model = Track
+
+class PlaylistPage(Paging):
+    __slots__ = ()
+    item_model = Playlist
+
+class CategoryPage(Paging):
+    __slots__ = ()
+    item_model = Category
+
+
+## Response bodies wrapping other objects
+
+class _Response(SpotifyObject):
+    __slots__ = ()
+
+    def __repr__(self):
+        names = [field.name for field, value in zip(self._fields, self._values) if value is not _MISSING]
+        return f'{self.__class__.__name__}({", ".join(names)})'
+
+class SearchResult(_Response):
+    __slots__ = ()
+
+    albums = Field(AlbumPage)
+    artists = Field(ArtistPage)
+    playlists = Field(PlaylistPage)
+    tracks = Field(TrackPage)
+    shows = Field(Paging)
+    episodes = Field(Paging)
+
+class Categories(_Response):
+    __slots__ = ()
+
+    categories = Field(CategoryPage)
+
+class CategoryPlaylists(_Response):
+    __slots__ = ()
+
+    message = Field()
+    playlists = Field(PlaylistPage)
+
+class Albums(_Response):
+    __slots__ = ()
+
+    albums = Field(Album, many=True)
+
+class Artists(_Response):
+    __slots__ = ()
+
+    artists = Field(Artist, many=True)
+
+class Tracks(_Response):
+    __slots__ = ()
+
+    tracks = Field(Track, many=True)
+
+class AudioFeaturesList(_Response):
+    __slots__ = ()
+
+    audio_features = Field(AudioFeatures, many=True)
+
+class Devices(_Response):
+    __slots__ = ()
+
+    devices = Field(Device, many=True)
+
+
+def wrap(api_call, body):
+    """ Wrap a decoded response body into the model of the endpoint """
+    if body is None or api_call.model is None:
+        return body
+    return api_call.model(body)
+
+def result_model(api_call):
+    """ Model of the object under `result_key`: a Paging subclass for paged endpoints, the item model for lists """
+    model = api_call.model
+    if model is not None and api_call.result_key:
+        model = getattr(model, api_call.result_key).model
+    return model
@@ -0,0 +1,160 @@
+""" Lazy iteration over Spotify paging objects
+
+Pages are fetched only when the caller gets to them, so at most a few pages are held in
+memory however large the collection is.
+
+- sequential (default): follow `next` after the current page is consumed;
+- prefetch: fetch page N+1 while the caller is still consuming page N;
+- parallel (workers > 1): once `total` is known from the first page, fetch the remaining
+  offsets concurrently, keeping no more than `workers` pages in flight. Pages are
+  still yielded in order. The offsets stay within what the endpoint serves (search: 1000
+  results) and the iteration stops at the first page without `next`.
+
+`iter_pages_async` and `iter_items_async` are the async generators of `AsyncSpotify`.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from spotifyapi.endpoints import ApiCall
+
+
+__all__ = [
+    "iter_pages",
+    "iter_items",
+    "iter_pages_async",
+    "iter_items_async",
+    "iter_name"
+]
+
+
+def _get_page(body, api_call) -> dict:
+    return body[api_call.result_key] if api_call.result_key else body
+
+def _next_call(page, api_call) -> ApiCall:
+    # `next` is a full URL with the query, the client sends it as is
+    return api_call._replace(url_path=page['next'], params=None)
+
+# results an endpoint serves at most, offset + limit included, whatever `total` says
+MAX_RESULTS = {
+    'search': 1000,
+}
+
+def _offsets(api_call, page):
+    """ Offsets of the pages after `page` """
+    limit = page['limit']
+    end = page['total']
+    max_results = MAX_RESULTS.get(api_call.template)
+    if max_results is not None:
+        end = min(end, max_results - limit + 1)
+    return iter(range(page['offset'] + limit, end, limit))
+
+def _offset_call(api_call, offset, limit) -> ApiCall:
+    params = dict(api_call.params or {})
+    params.update({'offset': offset, 'limit': limit})
+    return api_call._replace(params=params)
+
+def iter_pages(call, api_call, prefetch=False, workers=None):
+    """ Yield paging objects for `api_call`
+
+    call:       function sending an ApiCall and returning the decoded body (`Spotify._call`)
+    prefetch:   fetch the next page in the background while the current one is consumed
+    workers:    fetch the remaining pages with that many concurrent requests
+    """
+    page = _get_page(call(api_call), api_call)
+
+    if workers and workers > 1 and page.get('total') is not None and page['next']:
+        yield from _iter_parallel(call, api_call, page, workers)
+    elif prefetch:
+        yield from _iter_prefetch(call, api_call, page)
+    else:
+        yield page
+        while page['next']:
+            page = _get_page(call(_next_call(page, api_call)), api_call)
+            yield page
+
+def _iter_prefetch(call, api_call, page):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            future = executor.submit(call, _next_call(page, api_call)) if page['next'] else None
+            yield page
+            if future is None:
+                return
+            page = _get_page(future.result(), api_call)
+
+def _iter_parallel(call, api_call, page, workers):
+    limit = page['limit']
+    offsets = _offsets(api_call, page)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        window = deque(executor.submit(call, _offset_call(api_call, offset, limit))
+                       for offset in islice(offsets, workers))
+        try:
+            yield page
+            while window:
+                page = _get_page(window.popleft().result(), api_call)
+                if not page['next']:
+                    # the collection is shorter than `total` said
+                    yield page
+                    return
+                offset = next(offsets, None)
+                if offset is not None:
+                    window.append(executor.submit(call, _offset_call(api_call, offset, limit)))
+                yield page
+        finally:
+            for future in window:
+                future.cancel()
+
+def iter_items(call, api_call, prefetch=False, workers=None, item_model=None):
+    """ Yield items of all the pages one at a time, see `iter_pages`
+
+    item_model:   Optional. spotifyapi.models class to wrap every item into.
+    """
+    for page in iter_pages(call, api_call, prefetch=prefetch, workers=workers):
+        if item_model:
+            yield from map(item_model, page['items'])
+        else:
+            yield from page['items']
+
+
+async def iter_pages_async(call, api_call, workers=None):
+    """ `iter_pages` for a coroutine `call` (`AsyncSpotify._call`), without prefetch """
+    page = _get_page(await call(api_call), api_call)
+
+    if workers and workers > 1 and page.get('total') is not None and page['next']:
+        limit = page['limit']
+        offsets = _offsets(api_call, page)
+        window = deque(asyncio.ensure_future(call(_offset_call(api_call, offset, limit)))
+                       for offset in islice(offsets, workers))
+        try:
+            yield page
+            while window:
+                page = _get_page(await window.popleft(), api_call)
+                if not page['next']:
+                    yield page
+                    return
+                offset = next(offsets, None)
+                if offset is not None:
+                    window.append(asyncio.ensure_future(call(_offset_call(api_call, offset, limit))))
+                yield page
+        finally:
+            # the caller stopped early, or the last page came before `total`
+            for task in window:
+                task.cancel()
+        return
+
+    yield page
+    while page['next']:
+        page = _get_page(await call(_next_call(page, api_call)), api_call)
+        yield page
+
+async def iter_items_async(call, api_call, workers=None, item_model=None):
+    """ Yield items of all the pages one at a time, see `iter_pages_async` """
+    async for page in iter_pages_async(call, api_call, workers=workers):
+        for item in page['items']:
+            yield item_model(item) if item_model else item
+
+def iter_name(build) -> str:
+    """ Name of the iterating client method of an endpoint: iterAlbumTracks for getAlbumTracks, iterSearch for search """
+    name = build.__name__
+    return f'iter{name[3:]}' if name.startswith('get') else f'iter{name[:1].upper()}{name[1:]}'
@@ -0,0 +1,212 @@
+""" Pipelines of dependent API calls
+
+A job is a generator function describing the calls for one input. It yields an `ApiCall`
+(from `spotifyapi.endpoints`) and gets back the response body, so the output of one call
+feeds the parameters of the next. Yielding a list runs its calls and sub-jobs concurrently
+and gets back the list of their results; `Paged(api_call)` gets all the items of a paged
+endpoint. The value the job returns is its result.
+
+    def artist_tracks(name):
+        found = yield endpoints.search(name, 'artist', limit=1)
+        artist = found['artists']['items'][0]
+        albums = yield Paged(endpoints.getArtistAlbums(artist['id'], limit=50))
+        tracks = yield [Paged(endpoints.getAlbumTracks(album['id'], limit=50)) for album in albums]
+        return artist['name'], [track['name'] for album in tracks for track in album]
+
+    for result in Pipeline(sp, workers=16).run(artist_tracks, names):
+        print(result.input, result.value or result.error)
+
+`Pipeline` keeps up to `max_jobs` jobs going and up to `workers` requests in flight, and
+sends the calls of older jobs first, so a job takes about its depth in round trips however
+many inputs there are. Results are yielded as jobs finish, in no particular order. New
+jobs start only while the caller keeps consuming results.
+"""
+import heapq
+import inspect
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, NamedTuple
+
+from spotifyapi import models, paging
+from spotifyapi.endpoints import ApiCall
+
+
+__all__ = [
+    "Paged",
+    "Result",
+    "Pipeline"
+]
+
+
+class Paged(NamedTuple):
+    """ All the items of a paged endpoint, fetched page by page """
+    api_call: ApiCall
+
+
+class Result(NamedTuple):
+    input: Any
+    value: Any = None
+    error: BaseException = None     # exception the job did not handle, `value` is None then
+
+
+_REQUESTS = (ApiCall, Paged)
+
+
+class _Job():
+    """ A running generator. A sub-job fills slot `slot` of the list its parent waits for """
+    __slots__ = ('generator', 'input', 'order', 'parent', 'parent_wait', 'slot', 'wait', 'results', 'pending')
+
+    def __init__(self, generator, input, order, parent=None, slot=None):
+        self.generator = generator
+        self.input = input
+        self.order = order
+        self.parent = parent
+        self.parent_wait = parent.wait if parent is not None else None
+        self.slot = slot
+        self.wait = 0           # bumped on every yield, results of earlier waits are dropped
+        self.results = None
+        self.pending = 0
+
+    def alive(self) -> bool:
+        """ False when an ancestor does not wait for this branch anymore (a sibling failed) """
+        job = self
+        while job.parent is not None:
+            if job.parent.wait != job.parent_wait:
+                return False
+            job = job.parent
+        return True
+
+
+class Pipeline():
+    """ Runs generator jobs over one `Spotify` client
+
+    client:     Spotify client sending the calls.
+    workers:    Requests in flight at once.
+    max_jobs:   Jobs (inputs) in progress at once. Default: 4 * workers.
+    """
+
+    def __init__(self, client, workers=8, max_jobs=None):
+        self.client = client
+        self.workers = workers
+        self.max_jobs = max_jobs or 4 * workers
+
+    def _fetch(self, request):
+        """ Send one call, on a worker thread """
+        client = self.client
+        if isinstance(request, Paged):
+            api_call = request.api_call
+            item_model = models.result_model(api_call).item_model if client.models else None
+            return list(paging.iter_items(client._call, api_call, item_model=item_model))
+        body = client._call(request)
+        return models.wrap(request, body) if client.models else body
+
+    def run(self, job, inputs):
+        """ Run `job(input)` for every input, yield a `Result` for each as it finishes """
+        inputs = iter(inputs)
+        sequence = itertools.count()
+        ready = []          # heap of (order, seq, job, wait, slot, request): calls waiting for a worker
+        in_flight = dict()  # future: (job, wait, slot)
+        finished = []
+        roots = 0
+
+        def advance(current, value=None, error=None):
+            """ Resume `current` until it waits for calls or finishes """
+            while True:
+                try:
+                    if error is not None:
+                        request = current.generator.throw(error)
+                    else:
+                        request = current.generator.send(value)
+                except StopIteration as stop:
+                    return finish(current, stop.value, None)
+                except Exception as err:
+                    return finish(current, None, err)
+                if schedule(current, request):
+                    return
+                # an empty list was yielded
+                value, error = [], None
+
+        def finish(current, value, error):
+            if current.parent is None:
+                finished.append(Result(current.input, value, error))
+            else:
+                deliver(current.parent, current.parent_wait, current.slot, value, error)
+
+        def schedule(current, request) -> bool:
+            """ Queue what `current` yielded. False when there is nothing to wait for """
+            if isinstance(request, _REQUESTS):
+                current.wait += 1
+                heapq.heappush(ready, (current.order, next(sequence), current, current.wait, None, request))
+                return True
+            if isinstance(request, (list, tuple)) and all(isinstance(item, _REQUESTS) or inspect.isgenerator(item)
+                                                          for item in request):
+                if not request:
+                    return False
+                current.wait += 1
+                waiting = current.wait
+                current.results, current.pending = [None] * len(request), len(request)
+                for slot, item in enumerate(request):
+                    if current.wait != waiting:
+                        # a sub-job has failed right away, `current` has moved on
+                        break
+                    if inspect.isgenerator(item):
+                        advance(_Job(item, current.input, current.order, current, slot))
+                    else:
+                        heapq.heappush(ready, (current.order, next(sequence), current, waiting, slot, item))
+                return True
+            raise TypeError(f'A pipeline job can yield ApiCall, Paged or a list of them and of generators, '
+                            f'not {request!r:.100}')
+
+        def deliver(current, waiting, slot, value, error):
+            if waiting != current.wait:
+                # a sibling has failed already
+                return
+            if slot is None:
+                advance(current, value, error)
+            elif error is not None:
+                # the first failed branch fails the list, the results of the others are dropped
+                current.wait += 1
+                advance(current, None, error)
+            else:
+                current.results[slot] = value
+                current.pending -= 1
+                if not current.pending:
+                    advance(current, current.results)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='spotify-pipeline') as executor:
+            exhausted = False
+            while True:
+                # new jobs only while the caller is consuming results
+                while not exhausted and not finished and roots < self.max_jobs:
+                    try:
+                        input = next(inputs)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    generator = job(input)
+                    if not inspect.isgenerator(generator):
+                        raise TypeError(f'A pipeline job has to be a generator function, {job!r} returned '
+                                        f'{generator!r:.100}')
+                    roots += 1
+                    advance(_Job(generator, input, next(sequence)))
+
+                while ready and len(in_flight) < self.workers:
+                    _, _, current, waiting, slot, request = heapq.heappop(ready)
+                    if waiting == current.wait and current.alive():
+                        in_flight[executor.submit(self._fetch, request)] = (current, waiting, slot)
+
+                if finished:
+                    roots -= len(finished)
+                    results, finished[:] = list(finished), []
+                    yield from results
+                    continue
+                if not in_flight:
+                    if exhausted and not ready:
+                        return
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    current, waiting, slot = in_flight.pop(future)
+                    error = future.exception()
+                    deliver(current, waiting, slot, None if error else future.result(), error)
@@ -0,0 +1,158 @@
+""" Spotify clients for many users
+
+`SpotifyPool` hands out a `Spotify` client per user. All the clients share one HTTP session
+(connection pool), one rate limiter and one retry policy, and keep their tokens in one token
+store under the user's key. A user context is a client and an auth manager without their
+own sessions, files or threads; the least recently used ones are dropped above `max_users`
+and rebuilt from the token store on the next call.
+
+    pool = SpotifyPool(client_id, client_secret, redirect_uri, token_store=SQLiteTokenStore('tokens.sqlite'))
+    pool.add_user('alice', token_info)      # token from your web app's authorization callback
+    pool['alice'].pauseUserPlayback()
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from spotifyapi.auth import AuthFlowError, AuthorizationCode, Scope
+from spotifyapi.ratelimit import RateLimiter
+from spotifyapi.retry import RetryPolicy
+from spotifyapi.spotify import Spotify
+from spotifyapi.tokenstore import SQLiteTokenStore
+from spotifyapi.transport import create_session
+
+
+__all__ = [
+    "UserAuth",
+    "SpotifyPool"
+]
+
+
+class UserAuth(AuthorizationCode):
+    """ Authorization Code auth manager of one pool user
+
+    It never asks for authorization interactively: the user's token (with a refresh token)
+    has to be in the token store already, see `SpotifyPool.add_user()`.
+    """
+
+    def __init__(self, user, client_id, client_secret, redirect_uri, scope, request_session, token_store):
+        super(UserAuth, self).__init__(client_id, client_secret, request_session, scope, redirect_uri,
+                                       token_store=token_store)
+        self.user = user
+        if not scope:
+            # any stored token is fine
+            self.scope = None
+
+    def _get_token(self) -> str:
+        self.token_info = self._get_cached_token()
+        if not self.token_info:
+            raise AuthFlowError(f'No token for user {self.user}. Add it with SpotifyPool.add_user()')
+        if self.scope is not None and not self._is_compatible(self.token_info):
+            raise AuthFlowError(f'Token of user {self.user} has scopes "{self.token_info.get("scope")}", '
+                                f'"{self.scope}" are needed')
+        if self._is_token_expired():
+            self._refresh_authorization_token()
+        return self.token_info['access_token']
+
+    def _get_authorization_token(self, cache_token=True) -> None:
+        raise AuthFlowError(f'User {self.user} has to authorize the app again')
+
+
+class SpotifyPool():
+    """ Per-user `Spotify` clients over one shared transport
+
+    client_id, client_secret, redirect_uri, scope:  The app's Authorization Code settings.
+    token_store:    Store keeping the tokens of all the users (`for_user(key)`). Default: SQLiteTokenStore().
+    max_users:      User contexts kept in memory. The least recently used are dropped above it.
+    request_session, rate_limiter, retry_policy:  Shared by all the clients, created when not passed.
+    client_kwargs:  Other `Spotify` arguments (cache, coalescer, hooks, models, timeout, ...). The objects
+                    passed are shared by all the users: the coalescer keys requests by token and the
+                    cache skips user state. Objects keeping per-user data must not be passed here.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, redirect_uri=None, scope=None, token_store=None,
+                 max_users=1024, request_session=None, rate_limiter=None, retry_policy=None, **client_kwargs):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.scope = scope
+        self.token_store = token_store or SQLiteTokenStore()
+        self.max_users = max_users
+        self.session = request_session or create_session(pool_maxsize=32)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.client_kwargs = client_kwargs
+
+        self.created = 0
+        self.evicted = 0
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        return {'users': len(self._clients), 'created': self.created, 'evicted': self.evicted}
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __contains__(self, user):
+        return user in self._clients
+
+    def __getitem__(self, user) -> Spotify:
+        return self.client(user)
+
+    def _create_client(self, user) -> Spotify:
+        auth = UserAuth(user, self.client_id, self.client_secret, self.redirect_uri, self.scope, self.session,
+                        self.token_store.for_user(user))
+        return Spotify(auth_manager=auth, request_session=self.session, rate_limiter=self.rate_limiter,
+                       retry_policy=self.retry_policy, **self.client_kwargs)
+
+    def client(self, user) -> Spotify:
+        """ Client of the user, created from the token store when it is not in memory """
+        with self._lock:
+            client = self._clients.get(user)
+            if client is not None:
+                self._clients.move_to_end(user)
+                return client
+        # building a client touches no I/O, but keep the lock short anyway
+        client = self._create_client(user)
+        with self._lock:
+            existing = self._clients.get(user)
+            if existing is not None:
+                self._clients.move_to_end(user)
+                return existing
+            self._clients[user] = client
+            self.created += 1
+            while len(self._clients) > self.max_users:
+                self._clients.popitem(last=False)
+                self.evicted += 1
+        return client
+
+    def add_user(self, user, token_info) -> Spotify:
+        """ Save the user's token (from the authorization callback of your app) and return its client
+
+        `token_info` is the token endpoint response. `expires_at` is added when missing.
+        """
+        token_info = dict(token_info)
+        if 'expires_at' not in token_info:
+            token_info['expires_at'] = int(time.time()) + token_info['expires_in']
+        if self.scope and 'scope' not in token_info:
+            token_info['scope'] = str(Scope(self.scope))
+        self.token_store.for_user(user).save(token_info)
+        self.evict(user)
+        return self.client(user)
+
+    def remove_user(self, user) -> None:
+        """ Forget the user's token and client """
+        self.evict(user)
+        self.token_store.for_user(user).clear()
+
+    def evict(self, user) -> None:
+        """ Drop the user's client from memory, the token stays in the store """
+        with self._lock:
+            self._clients.pop(user, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._clients.clear()
+        self.session.close()
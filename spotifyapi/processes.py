@@ -0,0 +1,320 @@
+""" Work spread over processes
+
+Decoding large pages keeps one core busy, so big crawls and lookups can run in worker
+processes. `ProcessRunner` starts a process pool in which every worker has its own
+`Spotify` client, but all of them:
+
+- use the access token of one auth manager living in the parent (`TokenCoordinator`):
+  workers ask for a new token when theirs expires and only the parent talks to the
+  accounts service or the token store;
+- take their requests from one budget (`SharedRateLimiter`): a Retry-After answered to any
+  worker pauses all of them.
+
+Results come back to the parent through the pool's result queue.
+
+    def album_names(client, ids):
+        return [album['name'] for album in client.getAlbums(ids)]
+
+    with ProcessRunner(ClientCredentials(...), workers=4) as runner:
+        for names in runner.map_unordered(album_names, chunked(album_ids, 20)):
+            ...
+
+Functions sent to the workers get the worker's client first and have to be picklable
+(defined at module level). `spotifyapi.crawler.Crawler(..., runner=runner)` crawls with them.
+"""
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from spotifyapi import batch
+from spotifyapi.auth import AuthFlowError
+from spotifyapi.common import logger
+from spotifyapi.ratelimit import RateLimiter
+from spotifyapi.spotify import Spotify
+
+
+__all__ = [
+    "SharedRateLimiter",
+    "TokenCoordinator",
+    "ProcessRunner",
+    "chunked"
+]
+
+
+def chunked(items, size):
+    """ Lists of up to `size` items """
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
+
+
+class SharedRateLimiter(RateLimiter):
+    """ `RateLimiter` whose budget, pauses and counters live in shared memory
+
+    Pass it to processes when they are created (ProcessRunner does). time.monotonic() is
+    the same clock in all the processes of a host.
+
+    context:  Optional. multiprocessing context the processes are started with.
+    """
+    _TOKENS, _UPDATED, _PAUSED_UNTIL, _THROTTLED_TIME, _RETRIES = range(5)
+
+    def __init__(self, rate=None, burst=None, max_retries=5, default_retry_after=1, context=None):
+        self.context = context or multiprocessing.get_context()
+        super().__init__(rate, burst, max_retries, default_retry_after)
+
+    def _init_state(self) -> None:
+        self._lock = self.context.Lock()
+        self._state = self.context.RawArray('d', 5)
+        self._state[self._TOKENS] = self.burst or 0
+        self._state[self._UPDATED] = self._clock()
+
+    @property
+    def throttled_time(self) -> float:
+        return self._state[self._THROTTLED_TIME]
+
+    @property
+    def retries(self) -> int:
+        return int(self._state[self._RETRIES])
+
+    def _reserve(self) -> float:
+        state = self._state
+        with self._lock:
+            now = self._clock()
+            wait = state[self._PAUSED_UNTIL] - now
+            if wait <= 0:
+                if not self.rate:
+                    return 0
+                tokens = min(self.burst, state[self._TOKENS] + (now - state[self._UPDATED]) * self.rate)
+                state[self._UPDATED] = now
+                if tokens >= 1:
+                    state[self._TOKENS] = tokens - 1
+                    return 0
+                state[self._TOKENS] = tokens
+                wait = (1 - tokens) / self.rate
+            state[self._THROTTLED_TIME] += wait
+            return wait
+
+    def pause(self, retry_after=None) -> float:
+        delay = self._retry_after(retry_after)
+        state = self._state
+        with self._lock:
+            state[self._RETRIES] += 1
+            state[self._PAUSED_UNTIL] = max(state[self._PAUSED_UNTIL], self._clock() + delay)
+        return delay
+
+
+class _SharedToken():
+    """ The access token in shared memory, the part of `TokenCoordinator` the workers get """
+    _SIZE = 4096
+
+    def __init__(self, context):
+        self._token = context.RawArray('c', self._SIZE)
+        self._expires_at = context.RawValue('d', 0.0)
+        self._changed = context.Condition()
+        self._wanted = context.Event()
+
+    def publish(self, token, expires_at) -> None:
+        data = token.encode()
+        if len(data) >= self._SIZE:
+            raise AuthFlowError(f'Access token of {len(data)} bytes does not fit the shared buffer')
+        with self._changed:
+            self._token.raw = data + b'\0'
+            self._expires_at.value = expires_at
+            self._changed.notify_all()
+
+
+class _WorkerAuth():
+    """ Auth manager of the worker clients: the token comes from the parent """
+    hooks = None
+    scope = None
+
+    def __init__(self, shared, margin, timeout):
+        self.shared = shared
+        self.margin = margin
+        self.timeout = timeout
+        self._token = None
+        self._expires_at = 0.0
+
+    def get_token(self) -> str:
+        if self._token and self._expires_at - time.time() > self.margin:
+            return self._token
+        shared = self.shared
+        deadline = time.monotonic() + self.timeout
+        with shared._changed:
+            while True:
+                token, expires_at = shared._token.value.decode(), shared._expires_at.value
+                if token and expires_at - time.time() > self.margin:
+                    self._token, self._expires_at = token, expires_at
+                    return token
+                shared._wanted.set()
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise AuthFlowError('No access token from the parent process')
+                shared._changed.wait(min(left, 1))
+
+
+class TokenCoordinator():
+    """ Keeps the token of `auth_manager` published for the worker processes
+
+    A thread of the parent renews it when a worker asks (its copy is within `margin`
+    seconds of expiring) and ahead of time, like `AuthFlowBase.refresh()`.
+
+    timeout:  Seconds a worker waits for a token before AuthFlowError.
+    """
+
+    def __init__(self, auth_manager, margin=60, timeout=60, context=None):
+        self.auth_manager = auth_manager
+        self.margin = margin
+        self.timeout = timeout
+        self.shared = _SharedToken(context or multiprocessing.get_context())
+        self.published = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def worker_auth(self) -> _WorkerAuth:
+        """ Auth manager to create in the workers, picklable at process start """
+        return _WorkerAuth(self.shared, self.margin, self.timeout)
+
+    def publish(self) -> None:
+        """ Get a valid token from the auth manager and hand it to the workers """
+        auth_manager = self.auth_manager
+        # a token the workers can use for a while, not one about to be refreshed
+        token = auth_manager.refresh(self.margin * 2)
+        self.shared.publish(token, auth_manager.token_info['expires_at'])
+        self.published += 1
+
+    def start(self) -> None:
+        self.publish()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='spotify-token-coordinator', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.shared._wanted.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        shared = self.shared
+        while not self._stop_event.is_set():
+            expires_in = shared._expires_at.value - time.time()
+            asked = shared._wanted.wait(max(1, expires_in - self.margin * 2))
+            if self._stop_event.is_set():
+                return
+            shared._wanted.clear()
+            if asked or shared._expires_at.value - time.time() <= self.margin * 2:
+                try:
+                    self.publish()
+                except Exception as err:
+                    # the workers keep asking, try again
+                    logger.warning('Can not get a token for the worker processes: %s', err)
+                    self._stop_event.wait(1)
+
+
+_client = None
+
+def _init_worker(auth, rate_limiter, api_url, client_kwargs) -> None:
+    global _client
+    _client = Spotify(auth_manager=auth, rate_limiter=rate_limiter, **client_kwargs)
+    if api_url:
+        _client.SPOTIFY_API_URL = api_url
+
+def _run_in_worker(fn, args, kwargs):
+    return fn(_client, *args, **kwargs)
+
+def _get_several_in_worker(client, build, ids, args, kwargs):
+    return batch.get_several(client._call, build, ids, *args, **kwargs)
+
+
+class ProcessRunner():
+    """ Pool of worker processes with a `Spotify` client each
+
+    auth_manager:   Auth manager of the parent. Its token is shared with the workers.
+    workers:        Worker processes.
+    rate_limiter:   Optional. SharedRateLimiter of all the workers. Default: SharedRateLimiter().
+    api_url:        Optional. SPOTIFY_API_URL of the worker clients (e.g. MockSpotify.api_url).
+    context:        Optional. multiprocessing context, e.g. multiprocessing.get_context('spawn').
+    client_kwargs:  Other `Spotify` arguments of the worker clients (models, decoder, timeout,
+                    retry_policy, ...), they have to be picklable.
+    """
+
+    def __init__(self, auth_manager, workers=4, rate_limiter=None, api_url=None, context=None, **client_kwargs):
+        self.context = context or multiprocessing.get_context()
+        self.workers = workers
+        self.rate_limiter = rate_limiter or SharedRateLimiter(context=self.context)
+        self.coordinator = TokenCoordinator(auth_manager, context=self.context)
+        self.api_url = api_url
+        self.client_kwargs = client_kwargs
+        self.tasks = 0
+        self._executor = None
+
+    @property
+    def stats(self) -> dict:
+        return dict(self.rate_limiter.stats, tasks=self.tasks, tokens_published=self.coordinator.published)
+
+    def start(self) -> 'ProcessRunner':
+        if self._executor is None:
+            self.coordinator.start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=self.context, initializer=_init_worker,
+                initargs=(self.coordinator.worker_auth(), self.rate_limiter, self.api_url, self.client_kwargs))
+        return self
+
+    def shutdown(self, wait=True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+            self.coordinator.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn, *args, **kwargs):
+        """ Run `fn(client, *args, **kwargs)` in a worker. Returns a concurrent.futures.Future """
+        self.start()
+        self.tasks += 1
+        return self._executor.submit(_run_in_worker, fn, args, kwargs)
+
+    def map_unordered(self, fn, items, window=None):
+        """ Yield `fn(client, item)` for every item as the workers finish them
+
+        No more than `window` items (default: 2 * workers) are submitted ahead, so `items`
+        can be a long lazy iterable. A failed item raises its exception here.
+        """
+        window = window or 2 * self.workers
+        items = iter(items)
+        in_flight = set(self.submit(fn, item) for item in islice(items, window))
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                for item in islice(items, 1):
+                    in_flight.add(self.submit(fn, item))
+                yield future.result()
+
+    def get_several(self, build, ids, *args, **kwargs):
+        """ Like `spotifyapi.batch.get_several`: the objects of `ids` in order, looked up by the workers
+
+        build:  Endpoint function with max_ids (endpoints.getAlbums, getArtists, getTracks, ...).
+        """
+        size = build.max_ids
+        ids = batch._id_list(ids)
+        window = deque()
+        chunks = chunked(ids, size)
+        for chunk in islice(chunks, 2 * self.workers):
+            window.append(self.submit(_get_several_in_worker, build, chunk, args, kwargs))
+        while window:
+            items = window.popleft().result()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                window.append(self.submit(_get_several_in_worker, build, chunk, args, kwargs))
+            yield from items
@@ -0,0 +1,94 @@
+""" Client-side rate limiting
+
+Spotify answers 429 with a Retry-After header when an app makes too many requests.
+`RateLimiter` keeps every request of the clients sharing it under an optional
+token-bucket budget and pauses all of them, not only the one that got the 429.
+"""
+import asyncio
+import threading
+import time
+
+
+__all__ = [
+    "RateLimiter"
+]
+
+
+class RateLimiter():
+    """ Token bucket plus a shared Retry-After pause
+
+    rate:          Optional. Requests per second allowed on average. None means no budget,
+                   only Retry-After is honored.
+    burst:         Optional. How many requests may go at once after an idle period. Default: `rate`.
+    max_retries:   How many times a request answered with 429 is retried before
+                   SpotifyRequestError is raised.
+    default_retry_after:   Pause in seconds when a 429 has no usable Retry-After header.
+
+    Counters: `throttled_time` (seconds requests spent waiting), `retries` (requests retried after 429).
+    """
+
+    def __init__(self, rate=None, burst=None, max_retries=5, default_retry_after=1):
+        self.rate = rate
+        self.burst = burst or (max(1, rate) if rate else None)
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self._clock = time.monotonic
+        self._init_state()
+
+    def _init_state(self) -> None:
+        """ Budget, pause and counters. SharedRateLimiter keeps them in shared memory """
+        self.throttled_time = 0.0
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = self._clock()
+        self._paused_until = 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {'throttled_time': self.throttled_time, 'retries': self.retries}
+
+    def _reserve(self) -> float:
+        """ Take a slot for a request. Returns 0 on success or seconds to wait before trying again """
+        with self._lock:
+            now = self._clock()
+            wait = self._paused_until - now
+            if wait <= 0:
+                if not self.rate:
+                    return 0
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return 0
+                wait = (1 - self._tokens) / self.rate
+            self.throttled_time += wait
+            return wait
+
+    def acquire(self) -> None:
+        """ Block until the request may be sent """
+        wait = self._reserve()
+        while wait:
+            time.sleep(wait)
+            wait = self._reserve()
+
+    async def acquire_async(self) -> None:
+        """ Like `acquire()`, but sleeps without blocking the event loop """
+        wait = self._reserve()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._reserve()
+
+    def _retry_after(self, retry_after) -> float:
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.default_retry_after
+
+    def pause(self, retry_after=None) -> float:
+        """ Stop all requests for Retry-After seconds. Returns the pause length """
+        delay = self._retry_after(retry_after)
+        with self._lock:
+            self.retries += 1
+            self._paused_until = max(self._paused_until, self._clock() + delay)
+        return delay
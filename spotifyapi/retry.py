@@ -0,0 +1,204 @@
+""" Retries of failed requests
+
+`RetryPolicy` repeats requests failed with a 5xx status or a connection error, waiting an
+exponentially growing random delay (full jitter) between attempts. Only idempotent requests
+are repeated: a request that may have been executed is not sent twice. 429 is handled by
+`spotifyapi.ratelimit.RateLimiter` and counts only against the deadline.
+
+`CircuitBreaker` stops sending requests for a while after many failures in a row, so the
+clients sharing it fail fast instead of waiting for timeouts and retries of a broken API.
+
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    sp = Spotify(auth_manager=..., retry_policy=RetryPolicy(deadline=10, circuit_breaker=breaker))
+"""
+import random
+import threading
+import time
+
+import requests
+
+from spotifyapi.exceptions import SpotifyCircuitOpen
+
+
+__all__ = [
+    "RetryPolicy",
+    "CircuitBreaker"
+]
+
+
+# errors of the sync transports meaning the request got no response (HTTP2Session raises them too),
+# AsyncSpotify has its own
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class CircuitBreaker():
+    """ Fail fast after `failure_threshold` failed requests in a row
+
+    The circuit opens for `reset_timeout` seconds: requests raise SpotifyCircuitOpen without
+    being sent. Then one trial request is let through, its result closes or reopens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_at = None
+        self._clock = time.monotonic
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = self._clock()
+            if self.state == self.OPEN:
+                if now < self._opened_at + self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            # half-open: one trial at a time, a lost trial is replaced after reset_timeout
+            if self._trial_at is not None and now < self._trial_at + self.reset_timeout:
+                return False
+            self._trial_at = now
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_at = None
+
+    def neutral(self) -> None:
+        """ A response saying nothing about the service's health (429): the state and the failures stay,
+        a half-open circuit lets another trial through """
+        with self._lock:
+            self._trial_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_at = None
+
+
+class RetryPolicy():
+    """ When and how long to wait before repeating a failed request
+
+    max_retries:         Retries of one call after 5xx responses and connection errors.
+    backoff:             Base delay in seconds. Retry n waits random(0, min(max_backoff, backoff * 2**n)).
+    max_backoff:         Delay cap in seconds.
+    deadline:            Optional. Seconds a call may take with all its retries and waits, 429 pauses included.
+    statuses:            Response statuses worth a retry.
+    idempotent_methods:  Methods repeated by default. Endpoints override it with `ApiCall.idempotent`.
+    circuit_breaker:     Optional. CircuitBreaker, can be shared by several policies.
+
+    Counters: `retries`, `gave_up` (calls failed after retrying), `deadline_exceeded`,
+    `rejected` (calls refused by the open circuit).
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30, deadline=None, statuses=(500, 502, 503, 504),
+                 idempotent_methods=('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'), circuit_breaker=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.statuses = frozenset(statuses)
+        self.idempotent_methods = frozenset(idempotent_methods)
+        self.circuit_breaker = circuit_breaker
+
+        self.retries = 0
+        self.gave_up = 0
+        self.deadline_exceeded = 0
+        self.rejected = 0
+
+        self._clock = time.monotonic
+        self._random = random.uniform
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        stats = {'retries': self.retries, 'gave_up': self.gave_up, 'deadline_exceeded': self.deadline_exceeded,
+                 'rejected': self.rejected}
+        if self.circuit_breaker:
+            stats['circuit'] = self.circuit_breaker.state
+        return stats
+
+    def _count(self, name) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def start(self, method, idempotent=None) -> 'RetryState':
+        """ Retry state of one call """
+        if idempotent is None:
+            idempotent = method in self.idempotent_methods
+        deadline = self._clock() + self.deadline if self.deadline is not None else None
+        return RetryState(self, idempotent, deadline)
+
+
+class RetryState():
+    """ Retries of one call, see `RetryPolicy` """
+    __slots__ = ('policy', 'idempotent', 'deadline', 'retries')
+
+    def __init__(self, policy, idempotent, deadline):
+        self.policy = policy
+        self.idempotent = idempotent
+        self.deadline = deadline
+        self.retries = 0
+
+    def before_request(self) -> None:
+        """ Raise SpotifyCircuitOpen when the circuit breaker refuses the request """
+        breaker = self.policy.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            self.policy._count('rejected')
+            raise SpotifyCircuitOpen(breaker.reset_timeout)
+
+    def response(self, status) -> bool:
+        """ Record a response. True when it is a failure worth a retry """
+        policy = self.policy
+        failed = status in policy.statuses
+        breaker = policy.circuit_breaker
+        if breaker is not None:
+            if failed:
+                breaker.failure()
+            elif status == 429:
+                # throttling is our budget, not an outage: it neither opens nor closes the circuit
+                breaker.neutral()
+            else:
+                breaker.success()
+        return failed
+
+    def error(self, err, transport_errors=TRANSPORT_ERRORS) -> bool:
+        """ Record a request failed with an exception. True when it is a transport error worth a retry """
+        if not isinstance(err, transport_errors):
+            return False
+        if self.policy.circuit_breaker is not None:
+            self.policy.circuit_breaker.failure()
+        return True
+
+    def fits_deadline(self, delay) -> bool:
+        """ False when waiting `delay` seconds would run over the deadline """
+        if self.deadline is None or self.policy._clock() + delay <= self.deadline:
+            return True
+        self.policy._count('deadline_exceeded')
+        return False
+
+    def next_delay(self) -> float:
+        """ Delay before the next retry of a failed request, None to give up """
+        policy = self.policy
+        if not self.idempotent:
+            return None
+        if self.retries >= policy.max_retries:
+            policy._count('gave_up')
+            return None
+        delay = policy._random(0, min(policy.max_backoff, policy.backoff * 2 ** self.retries))
+        if not self.fits_deadline(delay):
+            return None
+        self.retries += 1
+        policy._count('retries')
+        return delay
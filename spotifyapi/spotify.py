@@ -1,9 +1,16 @@
-import json
+import functools
+import time
 import requests
-from requests.adapters import HTTPAdapter
-from urllib.parse import urljoin, quote
 
+from spotifyapi import batch, endpoints, models, paging
+from spotifyapi.coalesce import request_key
+from spotifyapi.decoders import get_decoder
 from spotifyapi.common import logger
+from spotifyapi.exceptions import SpotifyError, SpotifyRequestError, SpotifyRequestNoContent
+from spotifyapi.metrics import RequestEvent
+from spotifyapi.ratelimit import RateLimiter
+from spotifyapi.retry import RetryPolicy
+from spotifyapi.transport import create_session
 
 
 __all__ = [
@@ -14,32 +21,79 @@ __all__ = [
 ]
 
 
-class SpotifyError(Exception):
-    pass
+def _endpoint(build):
+    """ Make a `Spotify` method from an endpoint definition """
+    @functools.wraps(build)
+    def method(self, *args, raw=False, **kwargs):
+        api_call = build(*args, **kwargs)
+        if raw:
+            # undecoded body for callers that just forward it
+            return self._call(api_call._replace(decode=False))
+        body = self._call(api_call)
+        if not api_call.decode:
+            # pauseUserPlayback, startOrResumeUserPlayback: None for 204, as in AsyncSpotify
+            return body or None
+        return models.wrap(api_call, body) if self.models else body
+    return method
+
+def _paged_endpoint(build):
+    """ Make a `Spotify` method lazily iterating over the items of a paged endpoint """
+    @functools.wraps(build)
+    def method(self, *args, prefetch=False, workers=None, **kwargs):
+        api_call = build(*args, **kwargs)
+        item_model = models.result_model(api_call).item_model if self.models else None
+        return paging.iter_items(self._call, api_call, prefetch=prefetch, workers=workers, item_model=item_model)
+    method.__name__ = method.__qualname__ = paging.iter_name(build)
+    method.__doc__ = f""" Iterate over the items of all `{build.__name__}` pages
+
+        Takes the arguments of `{build.__name__}` plus `prefetch` and `workers`, see `spotifyapi.paging`.
+        """
+    return method
 
-class SpotifyRequestError(SpotifyError):
-    def __init__(self, body):
-        self.body = json.loads(body)
-        self.status = self.body["error"]["status"]
-        self.message = self.body["error"]["message"]
-        self.reason = self.body["error"].get("reason")
-    def __str__(self):
-        return f'{self.body}'
+def _batch_endpoint(build):
+    """ Make a `Spotify` method looking up any number of IDs with a "Get Several ..." endpoint """
+    @functools.wraps(build)
+    def method(self, ids, *args, workers=None, **kwargs):
+        model = models.result_model(build([], *args, **kwargs)) if self.models else None
+        return batch.get_several(self._call, build, ids, *args, workers=workers, model=model, **kwargs)
+    return method
 
-class SpotifyRequestNoContent(SpotifyError):
-    def __init__(self):
-        self.reason = 'NO CONTENT'
-    def __str__(self):
-        return f'{self.reason}'
 
 class Spotify:
     SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
 
-    def __init__(self, auth_manager=None, token=None, request_session=True):
+    def __init__(self, auth_manager=None, token=None, request_session=True, rate_limiter=None, cache=None,
+                 coalescer=None, models=False, decoder=None, timeout=None, hooks=None, retry_policy=None,
+                 catalog=None):
         self.auth_manager = auth_manager
         self.__token = token
-
-        if isinstance(request_session, requests.Session):
+        self.__headers = None
+        # pass one RateLimiter to several clients to make them share the budget and the 429 pauses
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # retries of 5xx and connection errors, see spotifyapi.retry
+        self.retry_policy = retry_policy or RetryPolicy()
+        # spotifyapi.cache.ResponseCache, off by default
+        self.cache = cache
+        # spotifyapi.coalesce.Coalescer, off by default
+        self.coalescer = coalescer
+        # spotifyapi.catalog.CatalogStore answering catalog lookups locally, off by default
+        self.catalog = catalog
+        # return spotifyapi.models objects instead of dicts
+        self.models = models
+        # JSON decoder: function or name from spotifyapi.decoders, the fastest installed by default
+        self.decoder = get_decoder(decoder)
+
+        # request timeout in seconds, None waits forever
+        self.timeout = timeout
+
+        # spotifyapi.metrics.Hooks, also used by the auth manager unless it has its own
+        self.hooks = hooks
+        if hooks and auth_manager is not None and getattr(auth_manager, 'hooks', None) is None:
+            auth_manager.hooks = hooks
+
+        # a session from spotifyapi.transport (or any requests.Session) can be shared with the auth manager
+        self._own_session = isinstance(request_session, bool)
+        if not self._own_session:
             self._session = request_session
         else:
             if request_session:
@@ -49,243 +103,185 @@ class Spotify:
 
     def __del__(self):
         """Make sure the connection (pool) gets closed"""
-        if isinstance(self._session, requests.Session):
+        if self._own_session and isinstance(self._session, requests.Session):
             self._session.close()
 
     def _create_session(self) -> requests.Session:
-        adapter = HTTPAdapter(max_retries=3)
-        session = requests.Session()
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-        return session
+        return create_session()
 
     def _get_headers(self) -> dict:
         if not self.auth_manager:
             return {}
-        self.__token = self.auth_manager.get_token()
-        return {'Authorization': f'Bearer {self.__token}'}
+        token = self.auth_manager.get_token()
+        if token != self.__token or self.__headers is None:
+            self.__token = token
+            self.__headers = {'Authorization': f'Bearer {token}'}
+        return self.__headers
+
+    def __api_request(self, method, url_path, headers=None, params=None, data=None, endpoint=None, idempotent=None):
+        # endpoint paths are relative to SPOTIFY_API_URL (ending with /), `next` URLs of pages are absolute
+        url = url_path if url_path.startswith(('https://', 'http://')) else self.SPOTIFY_API_URL + url_path
+        rate_limiter = self.rate_limiter
+        hooks = self.hooks
+        attempt = 0
+        throttled = 0
+
+        cache = self.cache
+        cache_key = cache.key(method, url, params) if cache else None
+        cache_entry = cache.get(cache_key) if cache_key else None
+        if cache_entry:
+            if cache_entry.fresh:
+                if hooks:
+                    hooks.request(RequestEvent(endpoint or url_path, method, 200, 0.0, 0, len(cache_entry.body), True))
+                return self._cached_response(cache_entry, url)
+            if cache_entry.etag:
+                headers = dict(headers or {}, **{'If-None-Match': cache_entry.etag})
+
+        retry = self.retry_policy.start(method, idempotent)
+        while True:
+            retry.before_request()
+            rate_limiter.acquire()
+            request_headers = self._get_headers()
+            if headers:
+                request_headers = dict(request_headers, **headers)
+            attempt += 1
+            try:
+                if not hooks:
+                    resp = self._session.request(method=method, url=url, headers=request_headers, params=params,
+                                                 data=data, timeout=self.timeout)
+                else:
+                    resp = self._instrumented_request(hooks, endpoint or url_path, attempt, method=method, url=url,
+                                                      headers=request_headers, params=params, data=data)
+            except Exception as err:
+                delay = retry.next_delay() if retry.error(err) else None
+                if delay is None:
+                    raise
+                logger.warning('%s on %s %s, retry %d in %.2fs', err.__class__.__name__, method, url_path,
+                               retry.retries, delay)
+                time.sleep(delay)
+                continue
+
+            status = resp.status_code
+            failed = retry.response(status)
+            if status == 429:
+                if throttled >= rate_limiter.max_retries:
+                    break
+                throttled += 1
+                delay = rate_limiter.pause(resp.headers.get('Retry-After'))
+                if not retry.fits_deadline(delay):
+                    break
+                logger.warning('Rate limited on %s %s, retry %d in %ss', method, url_path, throttled, delay)
+                continue
+            if failed:
+                delay = retry.next_delay()
+                if delay is not None:
+                    logger.warning('%s on %s %s, retry %d in %.2fs', status, method, url_path, retry.retries, delay)
+                    time.sleep(delay)
+                    continue
+            break
+
+        if resp.status_code >= 400:
+            logger.error('%s Error for url: %s', resp.status_code, resp.url)
+            raise SpotifyRequestError(resp.content, resp.status_code)
+
+        if cache_key:
+            if resp.status_code == 304 and cache_entry:
+                return self._cached_response(cache.revalidate(cache_key, cache_entry, resp.headers), url)
+            if resp.status_code == 200:
+                cache.store(cache_key, resp.headers, resp.content)
 
-    def __api_request(self, method, url_path, headers=None, params=None, data=None):
-        headers = self._get_headers()
-        url = urljoin(self.SPOTIFY_API_URL, url_path)
+        return resp
 
+    def _instrumented_request(self, hooks, endpoint, attempt, method, **kwargs):
+        start = time.perf_counter()
         try:
-            resp = self._session.request(method=method, url=url, headers=headers, params=params, data=data)
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            logger.error(err)
-            raise SpotifyRequestError(resp.text)
+            resp = self._session.request(method=method, timeout=self.timeout, **kwargs)
+        except Exception as err:
+            hooks.request(RequestEvent(endpoint, method, None, time.perf_counter() - start, attempt, 0, False,
+                                       err.__class__.__name__))
+            raise
+        hooks.request(RequestEvent(endpoint, method, resp.status_code, time.perf_counter() - start, attempt,
+                                   len(resp.content), False))
+        return resp
 
+    @staticmethod
+    def _cached_response(cache_entry, url) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp.encoding = 'utf-8'
+        resp._content = cache_entry.body
         return resp
 
-    ## Album
+    def _call(self, api_call):
+        catalog = self.catalog
+        if catalog is None:
+            return self._fetch(api_call)
+        body = catalog.lookup(api_call)
+        if body is not None:
+            if self.hooks:
+                self.hooks.request(RequestEvent(api_call.template, api_call.method, 200, 0.0, 0, 0, True))
+            return body
+        try:
+            body = self._fetch(api_call)
+        except Exception as err:
+            body = catalog.fallback(api_call, err)
+            if body is None:
+                raise
+            return body
+        if api_call.decode:
+            catalog.store(api_call, body)
+        return body
+
+    def _fetch(self, api_call):
+        if self.coalescer and api_call.method == 'GET':
+            key = request_key(api_call, getattr(self.auth_manager, 'scope', None),
+                              self._get_headers().get('Authorization'))
+            return self.coalescer.do(key, lambda: self._send(api_call))
+        return self._send(api_call)
+
+    def _send(self, api_call):
+        resp = self.__api_request(method=api_call.method, url_path=api_call.url_path,
+                                  params=api_call.params, data=api_call.data, endpoint=api_call.template,
+                                  idempotent=api_call.idempotent)
+        if api_call.no_content and resp.status_code == 204:
+            raise SpotifyRequestNoContent
+        return self.decoder(resp.content) if api_call.decode else resp.content
 
-    def getAlbum(self, id, market=None) -> dict:
-        """ Get an Album
-        id: The Spotify ID for the album.
-        market: Optional. An ISO 3166-1 alpha-2 country code or the string from_token.
-        """
-        payload = dict()
-        if market:
-            payload.update({'market': market})
-
-        resp = self.__api_request(method='GET', url_path=f'albums/{id}', params=payload)
-        return resp.json()
-
-    def getAlbumTracks(self, id, market=None, limit=None, offset=None) -> dict:
-        """ Get an Album
-        id: The Spotify ID for the album.
-        limit: Optional. The maximum number of tracks to return. Default: 20. Minimum: 1. Maximum: 50.
-        offset: Optional. The index of the first track to return. Default: 0 (the first object). Use with limit to get the next set of tracks.
-        market: Optional. An ISO 3166-1 alpha-2 country code or the string from_token.
-        """
-        payload = dict()
-        if market:
-            payload.update({'market': market})
-        if limit:
-            payload.update({'limit': limit})
-        if offset:
-            payload.update({'offset': offset})
+    ## Album
 
-        resp = self.__api_request(method='GET', url_path=f'albums/{id}/tracks', params=payload)
-        return resp.json()
+    getAlbum = _endpoint(endpoints.getAlbum)
+    getAlbumTracks = _endpoint(endpoints.getAlbumTracks)
+    iterAlbumTracks = _paged_endpoint(endpoints.getAlbumTracks)
+    getAlbums = _batch_endpoint(endpoints.getAlbums)
 
     ## Artist
 
-    def getArtist(self, id) -> dict:
-        return self.__api_request(method='GET', url_path=f'artists/{id}').json()
-
-    def getArtistAlbums(self, id, include_groups=None, country=None, limit=None, offset=None):
-        payload = dict()
-        if country:
-            payload.update({'country': country})
-        if limit:
-            payload.update({'limit': limit})
-        if offset:
-            payload.update({'offset': offset})
+    getArtist = _endpoint(endpoints.getArtist)
+    getArtistAlbums = _endpoint(endpoints.getArtistAlbums)
+    iterArtistAlbums = _paged_endpoint(endpoints.getArtistAlbums)
+    getRelatedArtists = _endpoint(endpoints.getRelatedArtists)
+    getArtists = _batch_endpoint(endpoints.getArtists)
 
-        resp = self.__api_request(method='GET', url_path=f'artists/{id}/albums', params=payload)
-        return resp.json()
+    ## Track
 
-    def getRelatedArtists(self, id):
-        return self.__api_request(method='GET', url_path=f'artists/{id}/related-artists').json()
+    getTracks = _batch_endpoint(endpoints.getTracks)
+    getAudioFeatures = _batch_endpoint(endpoints.getAudioFeatures)
 
     ## Misc
 
-    def search(self, raw_q, q_type, market=None, limit=None, offset=None, include_external=False):
-
-        """ Search for an Item
-
-        raw_q:   String with operators and flters:
-                 q='album:arrival artist:abba'
-                 q="doom metal"
-
-        q_type:  String with one of many types
-                 Example: q_type=album, q_type=album,track
-
-        Returns: 
-        For each type provided in the type parameter, the response body contains an array of artist objects / simplified album objects / track objects / simplified show objects / simplified episode objects wrapped in a paging object in JSON.
-        """
-
-        avaliable_types = ['album', 'artist', 'playlist', 'track', 'show', 'episode']
-
-        if q_type not in avaliable_types:
-            raise SpotifyError(f'"q_type" must be {", ".join([x for x in avaliable_types])}')
-
-        payload = {'q': raw_q, 'type': q_type}
-
-        if market:
-            payload.update({'market': market})
-        if limit:
-            payload.update({'limit': limit})
-        if include_external:
-            payload.update({'locale': include_external})
-        if offset:
-            payload.update({'offset': offset})
-
-        try:
-            resp = self.__api_request(method='GET', url_path='search', params=payload)
-            resp.raise_for_status()
-        except SpotifyRequestError as err:
-            logger.error(err)
-            raise
-        return resp.json()
-
-    def getCategories(self, country=None, locale=None, limit=None, offset=None):
-        payload = dict()
-        if country:
-            payload.update({'country': country})
-        if limit:
-            payload.update({'limit': limit})
-        if locale:
-            payload.update({'locale': locale})
-        if offset:
-            payload.update({'offset': offset})
-
-        # logger.debug(f'Getting categories: {", ".join(f"{x}={payload[x]}" for x in payload)}')
-
-        resp = self.__api_request(method='GET', url_path='browse/categories', params=payload)
-        return resp.json()
-
-    def getCategoryPlaylist(self, category_id, country=None, limit=None, offset=None):
-        payload = dict()
-        if country:
-            payload.update({'country': country})
-        if limit:
-            payload.update({'limit': limit})
-        if offset:
-            payload.update({'offset': offset})
-
-        # logger.debug(f'Getting {category_id} playlists: {", ".join(f"{x}={payload[x]}" for x in payload)}')
-
-        resp = self.__api_request(method='GET', url_path=f'browse/categories/{category_id}/playlists', params=payload)
-        return resp.json()
-
-    def getAvalGenres(self):
-        resp = self.__api_request(method='GET', url_path='recommendations/available-genre-seeds')
-        return resp.json()
+    search = _endpoint(endpoints.search)
+    iterSearch = _paged_endpoint(endpoints.search)
+    getCategories = _endpoint(endpoints.getCategories)
+    iterCategories = _paged_endpoint(endpoints.getCategories)
+    getCategoryPlaylist = _endpoint(endpoints.getCategoryPlaylist)
+    iterCategoryPlaylist = _paged_endpoint(endpoints.getCategoryPlaylist)
+    getAvalGenres = _endpoint(endpoints.getAvalGenres)
 
     ## User
 
-    def getUserAvaliableDevices(self) -> dict:
-        # logger.debug(f'Getting avaliable devices')
-        return self.__api_request(method='GET', url_path=f'me/player/devices').json()
-
-    def getUserCurrentPlayback(self):
-        # logger.debug(f'Getting current playback')
-
-        try:
-            res = self.__api_request(method='GET', url_path='me/player')
-            res.raise_for_status()
-        except SpotifyRequestError as err:
-            logger.error(err)
-            raise
-        if res.status_code == 204:
-            raise SpotifyRequestNoContent
-        return res.json()
-
-    def getUserCurrentTrack(self, market=None):
-        """ Get the object currently being played on the user’s Spotify account."""
-        # logger.debug(f"Get the User's Currently Playing Track")
-
-        query = None
-
-        if market:
-            query = {'market': market}
-
-        try:
-            res = self.__api_request(method='GET', url_path='me/player/currently-playing', params=query)
-        except SpotifyRequestError as err:
-            logger.error(err)
-            raise
-        if res.status_code == 204:
-            raise SpotifyRequestNoContent
-        return res.json()
-
-    def pauseUserPlayback(self, device_id=None) -> None:
-        """ user-modify-playback-state"""
-        # logger.debug(f'Pause user playback')
-
-        params = dict()
-        if device_id:
-            params.update({'device_id': device_id})
-
-        self.__api_request(method='PUT', url_path='me/player/pause', params=params)
-
-    def startOrResumeUserPlayback(self, device_id=None, context_uri=None, uris=None, offset=None, position_ms=None):
-        """ user-modify-playback-state
-
-        context_uri:    Spotify URI of the context to play (albums, artists, playlists).
-                        Example: {"context_uri": "spotify:album:1Je1IMUlBXcx1Fz0WE7oPT"}
-        uris:    Spotify track URIs to play.
-                 Example: {"uris": ["spotify:track:4iV5W9uYEdYUVa79Axb7Rh", "spotify:track:1301WleyT98MSxVHPZCA6M"]}
-        offset:    Indicates from where in the context playback should start.
-                   Avaliable when `context_uri` corresponds to an album or playlist object, or when the `uris` parameter is used.
-                   Example: "offset": {"position": 5}
-                   “uri” is a string representing the uri of the item to start at.
-                   Example: "offset": {"uri": "spotify:track:1301WleyT98MSxVHPZCA6M"}
-        position_ms:    Passing in a position that is greater than the length of the track will cause the player to start playing the next song.
-        """
-        # logger.debug(f"Start/Resume a User's Playback")
-        params = dict()
-        if device_id:
-            params.update({"device_id": device_id})
-        body = dict()
-        if context_uri:
-            body.update({"context_uri": context_uri})
-        if uris:
-            body.update({"uris": uris})
-        if offset:
-            body.update({"offset": offset})
-        if position_ms:
-            body.update({"position_ms": position_ms})
-
-        if not body:
-            body = {}
-
-        try:
-            res = self.__api_request(method='PUT', url_path='me/player/play', params=params, data=json.dumps(body))
-        except SpotifyRequestError as err:
-            logger.error(err)
-            raise
-        return res
+    getUserAvaliableDevices = _endpoint(endpoints.getUserAvaliableDevices)
+    getUserCurrentPlayback = _endpoint(endpoints.getUserCurrentPlayback)
+    getUserCurrentTrack = _endpoint(endpoints.getUserCurrentTrack)
+    pauseUserPlayback = _endpoint(endpoints.pauseUserPlayback)
+    startOrResumeUserPlayback = _endpoint(endpoints.startOrResumeUserPlayback)
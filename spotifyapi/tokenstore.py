@@ -0,0 +1,238 @@
+""" Token stores
+
+Where the auth managers keep the token between runs and share it between processes.
+
+- FileTokenStore: a JSON file (the default, `.cached_spotify_token`). Writes go to a
+  temporary file renamed over the old one, so readers never see a half-written token,
+  and `lock()` takes an exclusive lock on a side `.lock` file;
+- SQLiteTokenStore: a row in a SQLite database, locked per key with a lease row, so the
+  users of one database refresh their tokens in parallel;
+- MemoryTokenStore: a dict in this process, for tests and threads sharing one token.
+
+One SQLite database or dict can keep the tokens of many users: `store.for_user(key)` is
+the store of another token sharing the connection (see `spotifyapi.pool`).
+
+The auth managers hold `lock()` while they get or refresh a token and re-read the store
+inside it, so all the workers on a host share one token and do one refresh.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from spotifyapi.common import logger
+
+
+__all__ = [
+    "FileTokenStore",
+    "SQLiteTokenStore",
+    "MemoryTokenStore"
+]
+
+
+def _lock_file(f) -> None:
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock_file(f) -> None:
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class MemoryTokenStore():
+    def __init__(self, key='default', tokens=None):
+        self.key = key
+        self._tokens = tokens if tokens is not None else dict()
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        return f'memory ({self.key})'
+
+    def for_user(self, key) -> 'MemoryTokenStore':
+        return MemoryTokenStore(key, self._tokens)
+
+    def load(self):
+        token_info = self._tokens.get(self.key)
+        return dict(token_info) if token_info else None
+
+    def save(self, token_info) -> None:
+        self._tokens[self.key] = dict(token_info)
+
+    def clear(self) -> None:
+        self._tokens.pop(self.key, None)
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            yield
+
+
+class FileTokenStore():
+    def __init__(self, path='.cached_spotify_token'):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+
+    def __str__(self):
+        return self.path
+
+    def load(self):
+        token_info = None
+        try:
+            with open(self.path, 'r') as f:
+                token_info = json.load(f)
+                logger.info('Got cached token')
+        except (IOError, json.decoder.JSONDecodeError) as e:
+            logger.warning('Can not get token from %s: %s', self.path, e)
+        return token_info
+
+    def save(self, token_info) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-spotify-token-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(token_info, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self):
+        with self._thread_lock:
+            if self._lock_file is not None:
+                # already locked by this thread
+                yield
+                return
+            with open(self.lock_path, 'a+') as f:
+                _lock_file(f)
+                self._lock_file = f
+                try:
+                    yield
+                finally:
+                    self._lock_file = None
+                    _unlock_file(f)
+
+
+class _SQLiteDatabase():
+    """ Connection and per-key locks shared by the SQLiteTokenStores of one database
+
+    A key is locked between processes with a lease row in `locks`: the database write lock is
+    only held while the row is claimed, not while the token is refreshed.
+    """
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self.thread_lock = threading.RLock()
+        self._key_locks = dict()
+        self.db = self.connect()
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, token_info TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)')
+
+    def __del__(self):
+        """Make sure the database gets closed"""
+        self.db.close()
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+
+    def write(self, query, args) -> None:
+        with self.thread_lock:
+            with self.db:
+                self.db.execute(query, args)
+
+    def key_lock(self, key) -> list:
+        """ [RLock, depth] of the key in this process """
+        with self.thread_lock:
+            return self._key_locks.setdefault(key, [threading.RLock(), 0])
+
+    def acquire_lease(self, key, owner) -> None:
+        """ Wait until no other process holds the key. A lease left by a dead process expires after `timeout` """
+        while True:
+            now = time.time()
+            with self.thread_lock:
+                with self.db:
+                    self.db.execute('DELETE FROM locks WHERE key = ? AND expires_at < ?', (key, now))
+                    claimed = self.db.execute('INSERT OR IGNORE INTO locks VALUES (?, ?, ?)',
+                                              (key, owner, now + self.timeout)).rowcount
+            if claimed:
+                return
+            time.sleep(self.POLL_INTERVAL)
+
+    def release_lease(self, key, owner) -> None:
+        self.write('DELETE FROM locks WHERE key = ? AND owner = ?', (key, owner))
+
+
+class SQLiteTokenStore():
+    """ key: Optional. Name of the token in the database, one database can keep many tokens """
+
+    def __init__(self, path='.spotify_tokens.sqlite', key='default', timeout=60, database=None):
+        self.key = key
+        self._database = database or _SQLiteDatabase(path, timeout)
+
+    @property
+    def path(self):
+        return self._database.path
+
+    def __str__(self):
+        return f'{self.path} ({self.key})'
+
+    def for_user(self, key) -> 'SQLiteTokenStore':
+        return SQLiteTokenStore(key=key, database=self._database)
+
+    def load(self):
+        database = self._database
+        with database.thread_lock:
+            row = database.db.execute('SELECT token_info FROM tokens WHERE key = ?', (self.key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, token_info) -> None:
+        self._database.write('INSERT OR REPLACE INTO tokens VALUES (?, ?)', (self.key, json.dumps(token_info)))
+
+    def clear(self) -> None:
+        self._database.write('DELETE FROM tokens WHERE key = ?', (self.key,))
+
+    @contextmanager
+    def lock(self):
+        key_lock = self._database.key_lock(self.key)
+        with key_lock[0]:
+            if key_lock[1]:
+                # already locked by this thread
+                yield
+                return
+            owner = uuid.uuid4().hex
+            self._database.acquire_lease(self.key, owner)
+            key_lock[1] += 1
+            try:
+                yield
+            finally:
+                key_lock[1] -= 1
+                self._database.release_lease(self.key, owner)
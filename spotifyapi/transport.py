@@ -0,0 +1,117 @@
+""" HTTP transports
+
+Sessions for `Spotify` and the auth managers (`request_session=...`). Passing one session
+to a client and to its auth manager makes them share one connection pool.
+
+- create_session(): requests.Session with a tuned connection pool;
+- HTTP2Session: requests-like session on httpx which multiplexes concurrent calls over one
+  HTTP/2 connection per host. Needs httpx with HTTP/2 support: pip install spotifyapi[http2]
+
+    session = create_session(pool_maxsize=50)
+    sp = Spotify(auth_manager=ClientCredentials(request_session=session), request_session=session)
+"""
+import os
+import ssl
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from spotifyapi.exceptions import SpotifyError
+
+
+__all__ = [
+    "create_session",
+    "HTTP2Session"
+]
+
+
+def create_session(pool_connections=10, pool_maxsize=10, pool_block=False, max_retries=3,
+                   keep_alive=True, trust_env=None) -> requests.Session:
+    """ requests.Session for the Spotify hosts
+
+    pool_connections:   Number of hosts to keep connection pools for.
+    pool_maxsize:       Connections kept per host. Set it to the number of threads sharing the session.
+    pool_block:         Wait for a free connection instead of opening one that is not kept afterwards.
+    max_retries:        Retries of failed connection attempts. Requests that were sent are never repeated here:
+                        the client's retry policy knows which of them are idempotent. 429 is left to the
+                        client's rate limiter.
+    keep_alive:         Reuse connections between requests.
+    trust_env:          Look proxies, the CA bundle and .netrc up in the environment on every request, as
+                        requests does by default. Default: only when a proxy is set in the environment,
+                        otherwise the CA bundle is read once here.
+    """
+    # only connect errors: a read error may follow a request the server executed, and a PUT repeated
+    # here would bypass the retry policy. 429 and Retry-After are handled by the rate limiter for
+    # all the requests, not per connection
+    retries = Retry(total=max_retries, connect=max_retries, read=False, status=0, other=0,
+                    respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          pool_block=pool_block, max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    if trust_env is None:
+        # scanning os.environ costs more than the rest of a request's client side; proxies
+        # keep it, their no_proxy exceptions depend on the host
+        trust_env = bool(requests.utils.getproxies())
+        if not trust_env:
+            session.verify = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE') or True
+    session.trust_env = trust_env
+    return session
+
+
+class HTTP2Session():
+    """ requests-like session on httpx with HTTP/2
+
+    Many concurrent API calls share one TLS connection per host instead of a connection each.
+
+    max_connections:   Maximum number of connections.
+    keepalive_expiry:  Seconds an idle connection is kept.
+    timeout:           Default request timeout in seconds, None for no timeout.
+    verify:            Verify the server certificates: True, False or the path of a CA bundle.
+
+    httpx timeouts and transport errors are raised as requests' Timeout and ConnectionError, like
+    on a requests session.
+    """
+
+    def __init__(self, max_connections=10, keepalive_expiry=30, timeout=None, max_retries=3, verify=True):
+        if httpx is None:
+            raise SpotifyError('HTTP2Session needs httpx. Install it with "pip install spotifyapi[http2]"')
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                              keepalive_expiry=keepalive_expiry)
+        if isinstance(verify, str):
+            verify = ssl.create_default_context(cafile=verify)
+        transport = httpx.HTTPTransport(http2=True, limits=limits, retries=max_retries, verify=verify)
+        self._client = httpx.Client(transport=transport, timeout=timeout)
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        kwargs = dict()
+        if isinstance(data, (str, bytes)):
+            kwargs['content'] = data
+        elif data is not None:
+            kwargs['data'] = data
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        try:
+            return self._client.request(method, url, headers=headers, params=params, **kwargs)
+        except httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(f'{method} {url}: {err}') from err
+        except httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(f'{method} {url}: {err}') from err
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self) -> None:
+        self._client.close()
@@ -0,0 +1,306 @@
+""" Playback change events
+
+`PlaybackWatcher` polls me/player for any number of users and calls subscribers only when
+something changes: another track, pause or resume, another device, a seek. It polls often
+just before the current track ends and rarely while playback is paused or idle, and a 204
+(nothing is playing) is an ordinary state, not an exception.
+
+    watcher = PlaybackWatcher(workers=8)
+    watcher.subscribe(lambda event: print(event.user, event.kind), kinds={'track_changed'})
+    watcher.watch('alice', Spotify(auth_manager=alice_auth))
+    watcher.start()
+
+With `AsyncSpotify` clients run `await watcher.run_async()` in the event loop instead of `start()`.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from spotifyapi import endpoints
+from spotifyapi.common import logger
+from spotifyapi.exceptions import SpotifyError
+
+
+__all__ = [
+    "PlaybackEvent",
+    "PlaybackWatcher",
+    "diff_states"
+]
+
+
+TRACK_CHANGED = 'track_changed'
+PAUSED = 'paused'
+RESUMED = 'resumed'
+DEVICE_CHANGED = 'device_changed'
+SEEK = 'seek'
+STARTED = 'started'     # playback appeared after nothing was playing
+STOPPED = 'stopped'     # no playback anymore (204)
+
+
+class PlaybackEvent(NamedTuple):
+    user: str
+    kind: str
+    previous: dict      # playback object before the change, None for STARTED
+    current: dict       # playback object after the change, None for STOPPED
+
+
+def _item_id(state):
+    item = state.get('item')
+    return item.get('id') or item.get('uri') if item else None
+
+def _device_id(state):
+    device = state.get('device')
+    return device.get('id') if device else None
+
+def diff_states(previous, current, elapsed=0.0, seek_tolerance=3.0) -> list:
+    """ Kinds of changes between two playback objects polled `elapsed` seconds apart """
+    if previous is None:
+        return [STARTED] if current is not None else []
+    if current is None:
+        return [STOPPED]
+
+    kinds = []
+    if _item_id(previous) != _item_id(current):
+        kinds.append(TRACK_CHANGED)
+    if previous.get('is_playing') and not current.get('is_playing'):
+        kinds.append(PAUSED)
+    elif not previous.get('is_playing') and current.get('is_playing'):
+        kinds.append(RESUMED)
+    if _device_id(previous) != _device_id(current):
+        kinds.append(DEVICE_CHANGED)
+    if TRACK_CHANGED not in kinds and previous.get('progress_ms') is not None \
+            and current.get('progress_ms') is not None:
+        expected = previous['progress_ms'] + (elapsed * 1000 if previous.get('is_playing') else 0)
+        if abs(current['progress_ms'] - expected) > seek_tolerance * 1000:
+            kinds.append(SEEK)
+    return kinds
+
+
+class _Watch():
+    __slots__ = ('user', 'client', 'state', 'polled_at', 'active')
+
+    def __init__(self, user, client):
+        self.user = user
+        self.client = client
+        self.state = None
+        self.polled_at = None
+        self.active = True
+
+
+class PlaybackWatcher():
+    """ Adaptive me/player polling for many users with change events
+
+    workers:          Threads polling `Spotify` clients at once (`start()`).
+    min_interval:     Shortest pause between two polls of one user, in seconds.
+    max_interval:     Pause between polls while a track is playing and far from its end.
+    paused_interval:  Pause between polls while playback is paused.
+    idle_interval:    Pause between polls while nothing is playing, and after errors.
+    seek_tolerance:   Seconds the progress may differ from the expected one without a SEEK event.
+    """
+
+    def __init__(self, workers=4, min_interval=1, max_interval=5, paused_interval=15, idle_interval=30,
+                 seek_tolerance=3):
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.paused_interval = paused_interval
+        self.idle_interval = idle_interval
+        self.seek_tolerance = seek_tolerance
+
+        self._subscribers = []
+        self._watches = dict()
+        self._clock = time.monotonic
+        self._lock = threading.Condition()
+        self._queue = []    # heap of (due, seq, watch)
+        self._seq = itertools.count()
+        self._running = False
+        self._thread = None
+        self._executor = None
+        self._tasks = dict()
+        self._loop = None
+        self._stopped = None
+
+    def subscribe(self, callback, kinds=None) -> None:
+        """ Call `callback(event)` on every PlaybackEvent, or only on the `kinds` of events """
+        self._subscribers.append((callback, frozenset(kinds) if kinds else None))
+
+    def watch(self, user, client) -> None:
+        """ Start watching the playback of `client` (Spotify or AsyncSpotify) under the name `user` """
+        watch = _Watch(user, client)
+        with self._lock:
+            old = self._watches.get(user)
+            if old is not None:
+                old.active = False
+            self._watches[user] = watch
+            if self._loop is None:
+                self._schedule(watch, 0)
+        task = self._tasks.pop(user, None)
+        if task is not None:
+            task.cancel()
+        if self._loop is not None:
+            # run_async() is watching: give the user its own task
+            self._tasks[user] = self._loop.create_task(self._watch_async(watch))
+
+    def unwatch(self, user) -> None:
+        with self._lock:
+            watch = self._watches.pop(user, None)
+            if watch is not None:
+                watch.active = False
+        task = self._tasks.pop(user, None)
+        if task is not None:
+            task.cancel()
+
+    def state(self, user) -> dict:
+        """ Last polled playback object of the user, None when nothing is playing """
+        return self._watches[user].state
+
+    def next_interval(self, state) -> float:
+        """ Seconds until the next poll after polling `state` """
+        if state is None:
+            return self.idle_interval
+        if not state.get('is_playing'):
+            return self.paused_interval
+        item = state.get('item')
+        progress = state.get('progress_ms')
+        if not item or progress is None or not item.get('duration_ms'):
+            return self.max_interval
+        # poll right after the track ends
+        remaining = (item['duration_ms'] - progress) / 1000
+        return min(self.max_interval, max(self.min_interval, remaining + self.min_interval / 2))
+
+    ## Polling
+
+    def _emit(self, watch, state, polled_at) -> list:
+        previous = watch.state
+        elapsed = polled_at - watch.polled_at if watch.polled_at is not None else 0.0
+        watch.state = state
+        watch.polled_at = polled_at
+        events = [PlaybackEvent(watch.user, kind, previous, state)
+                  for kind in diff_states(previous, state, elapsed, self.seek_tolerance)]
+        for event in events:
+            for callback, kinds in self._subscribers:
+                if kinds is None or event.kind in kinds:
+                    try:
+                        callback(event)
+                    except Exception:
+                        logger.exception('Playback subscriber %r failed', callback)
+        return events
+
+    @staticmethod
+    def _api_call():
+        # 204 comes back as an empty body instead of SpotifyRequestNoContent
+        return endpoints.getUserCurrentPlayback()._replace(no_content=False, decode=False)
+
+    def poll(self, user) -> list:
+        """ Poll the user's playback once with a `Spotify` client. Returns the events """
+        watch = self._watches[user]
+        client = watch.client
+        body = client._call(self._api_call())
+        return self._emit(watch, client.decoder(body) if body else None, self._clock())
+
+    async def poll_async(self, user) -> list:
+        """ `poll()` for `AsyncSpotify` clients """
+        watch = self._watches[user]
+        client = watch.client
+        body = await client._call(self._api_call())
+        return self._emit(watch, client.decoder(body) if body else None, self._clock())
+
+    ## Threads
+
+    def _schedule(self, watch, delay) -> None:
+        heapq.heappush(self._queue, (self._clock() + delay, next(self._seq), watch))
+        self._lock.notify()
+
+    def _poll_job(self, watch) -> None:
+        try:
+            self.poll(watch.user)
+            delay = self.next_interval(watch.state)
+        except Exception as err:
+            logger.warning('Polling playback of %s failed: %s', watch.user, err)
+            delay = self.idle_interval
+        with self._lock:
+            if watch.active and self._running:
+                self._schedule(watch, delay)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while self._running and (not self._queue or self._queue[0][0] > self._clock()):
+                    self._lock.wait(self._queue[0][0] - self._clock() if self._queue else None)
+                if not self._running:
+                    return
+                _, _, watch = heapq.heappop(self._queue)
+            if watch.active:
+                self._executor.submit(self._poll_job, watch)
+
+    def start(self) -> 'PlaybackWatcher':
+        """ Poll `Spotify` clients on a pool of `workers` threads """
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+            # users whose poll was in flight at stop(), or watched by run_async(), are not queued
+            queued = {id(watch) for _, _, watch in self._queue}
+            for watch in self._watches.values():
+                if id(watch) not in queued:
+                    self._schedule(watch, 0)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='spotify-watcher')
+            self._thread = threading.Thread(target=self._run, name='spotify-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    ## asyncio
+
+    async def _watch_async(self, watch) -> None:
+        while watch.active:
+            try:
+                await self.poll_async(watch.user)
+                delay = self.next_interval(watch.state)
+            except Exception as err:
+                logger.warning('Polling playback of %s failed: %s', watch.user, err)
+                delay = self.idle_interval
+            await asyncio.sleep(delay)
+
+    async def run_async(self) -> None:
+        """ Poll `AsyncSpotify` clients in the running loop, one task per user, until `stop()` or cancellation """
+        with self._lock:
+            if self._running:
+                raise SpotifyError('PlaybackWatcher is already running')
+            self._running = True
+            self._loop = asyncio.get_running_loop()
+            self._stopped = asyncio.Event()
+            self._queue.clear()
+        try:
+            for user, watch in list(self._watches.items()):
+                self._tasks[user] = self._loop.create_task(self._watch_async(watch))
+            await self._stopped.wait()
+        finally:
+            self._running = False
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            self._tasks.clear()
+            self._loop = None
+            self._stopped = None
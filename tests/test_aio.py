@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from spotifyapi.aio import AsyncAuth, AsyncSpotify
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.retry import RetryPolicy
+from spotifyapi.spotify import Spotify
+
+
+def test_async_client_has_the_methods_of_spotify():
+    methods = {name for name in vars(Spotify) if name.startswith(('get', 'iter', 'search', 'pause', 'start'))}
+    assert methods <= set(vars(AsyncSpotify))
+
+
+@pytest.mark.parametrize('workers', [None, 3])
+def test_iter_album_tracks(workers):
+    with MockSpotify() as mock:
+        expected = [track['id'] for track in mock.spotify().iterAlbumTracks('x', limit=20)]
+
+        async def run():
+            async with mock.async_spotify() as sp:
+                return [track['id'] async for track in sp.iterAlbumTracks('x', limit=20, workers=workers)]
+        assert asyncio.run(run()) == expected
+        assert len(expected) > 20
+
+
+def test_timeout():
+    with MockSpotify(latency=0.5) as mock:
+        async def run():
+            async with mock.async_spotify(timeout=0.1, retry_policy=RetryPolicy(max_retries=0)) as sp:
+                await sp.getAlbum('x')
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(run())
+
+
+def test_async_auth_starts_the_refresh_within_refresh_margin():
+    with MockSpotify() as mock:
+        auth_manager = mock.auth_manager(refresh_margin=300)
+        auth = AsyncAuth(auth_manager)
+        token = asyncio.run(auth.get_token())
+        assert asyncio.run(auth.get_token()) == token
+        assert mock.tokens_issued == 1
+
+        # 200 s before expires_at: the old token is still handed out, a new one is on its way
+        expires_at = auth_manager.token_info['expires_at']
+        auth_manager._clock = lambda: expires_at - 200
+        assert asyncio.run(auth.get_token()) == token
+        auth_manager._refresh_thread.join()
+        assert mock.tokens_issued == 2
+        assert asyncio.run(auth.get_token()) != token
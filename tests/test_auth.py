@@ -0,0 +1,166 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from spotifyapi import auth as auth_module
+from spotifyapi.auth import AuthorizationCode, ClientCredentials, TokenRefresher, _LazyCtime
+from spotifyapi.tokenstore import FileTokenStore
+
+
+class FakeClock():
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTokenEndpoint():
+    """ Session answering the token requests of the auth managers """
+
+    def __init__(self, expires_in=3600, delay=0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, data=None):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.delay)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps({'access_token': f'token-{number}', 'token_type': 'Bearer',
+                                    'expires_in': self.expires_in}).encode()
+        return resp
+
+
+class CountingStore(FileTokenStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.loads = self.saves = self.locks = 0
+
+    def load(self):
+        self.loads += 1
+        return super().load()
+
+    def save(self, token_info):
+        self.saves += 1
+        super().save(token_info)
+
+    @contextmanager
+    def lock(self):
+        self.locks += 1
+        with super().lock():
+            yield
+
+
+def client_credentials(endpoint, clock, **kwargs):
+    auth = ClientCredentials('id', 'secret', request_session=endpoint, **kwargs)
+    auth._clock = clock
+    return auth
+
+
+def test_token_is_kept_in_memory():
+    endpoint = FakeTokenEndpoint()
+    auth = client_credentials(endpoint, FakeClock())
+    assert [auth.get_token() for _ in range(10)] == ['token-1'] * 10
+    assert endpoint.calls == 1
+
+
+def test_refresher_renews_ahead_of_expiry():
+    clock = FakeClock()
+    endpoint = FakeTokenEndpoint(expires_in=3600)
+    auth = client_credentials(endpoint, clock)
+    auth.get_token()
+    refresher = TokenRefresher(auth, margin=300)
+
+    assert refresher.run_once() == 3300
+    assert endpoint.calls == 1
+
+    clock.now += 3400
+    assert refresher.run_once() == 3300
+    assert endpoint.calls == 2
+    assert auth.token_info['access_token'] == 'token-2'
+
+
+def test_concurrent_refreshes_are_one_request():
+    clock = FakeClock()
+    endpoint = FakeTokenEndpoint(delay=0.05)
+    auth = client_credentials(endpoint, clock)
+    auth.get_token()
+    clock.now += 3400
+
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(auth.refresh(300))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ['token-2'] * 8
+    assert endpoint.calls == 2
+
+
+def test_margin_longer_than_lifetime_does_not_refresh_every_call():
+    clock = FakeClock()
+    endpoint = FakeTokenEndpoint(expires_in=60)
+    auth = client_credentials(endpoint, clock, refresh_margin=300)
+    assert [auth.get_token() for _ in range(10)] == ['token-1'] * 10
+    if auth._refresh_thread:
+        auth._refresh_thread.join()
+    assert endpoint.calls == 1
+    # the margin is clamped to half the lifetime
+    assert TokenRefresher(auth, margin=300, retry_interval=5).run_once() == 30
+
+
+def test_authorization_code_reads_the_store_once(tmp_path):
+    clock = FakeClock()
+    store = CountingStore(str(tmp_path / 'token'))
+    FileTokenStore.save(store, {'access_token': 'stored', 'token_type': 'Bearer', 'refresh_token': 'refresh',
+                                'scope': 'user-read-private', 'expires_in': 3600, 'expires_at': clock.now + 3600})
+    endpoint = FakeTokenEndpoint()
+    auth = AuthorizationCode('id', 'secret', request_session=endpoint, scope=['user-read-private'],
+                             redirect_uri='http://127.0.0.1/', token_store=store)
+    auth._clock = clock
+
+    assert [auth.get_token() for _ in range(100)] == ['stored'] * 100
+    clock.now += 3600 - 100
+    assert auth.get_token() == 'stored'
+    assert (store.loads, store.locks, store.saves) == (1, 1, 0)
+
+    # within the margin before expires_at: the store is locked again and the token refreshed
+    clock.now += 50
+    assert auth.get_token() == 'token-1'
+    assert endpoint.calls == 1
+    assert store.locks == 2 and store.saves == 1
+    assert auth.get_token() == 'token-1'
+    assert store.locks == 2
+
+
+def test_lazy_ctime(tmp_path, monkeypatch, caplog):
+    assert str(_LazyCtime(86400.5)) == time.ctime(86400)
+    formatted = []
+    ctime = time.ctime
+    monkeypatch.setattr(auth_module.time, 'ctime', lambda *args: formatted.append(args) or ctime(*args))
+
+    def authorize():
+        store = FileTokenStore(str(tmp_path / 'token'))
+        store.save({'access_token': 'stored', 'token_type': 'Bearer', 'refresh_token': 'refresh', 'scope': '',
+                    'expires_in': 3600, 'expires_at': time.time() + 3600})
+        auth = AuthorizationCode('id', 'secret', request_session=FakeTokenEndpoint(),
+                                 redirect_uri='http://127.0.0.1/', token_store=store)
+        return auth.get_token()
+
+    # the expiry time is formatted only when the record is logged
+    caplog.set_level(logging.WARNING, logger='spotifyapi')
+    assert authorize() == 'stored'
+    assert formatted == []
+    caplog.set_level(logging.INFO, logger='spotifyapi')
+    authorize()
+    assert formatted
+    assert 'will be expire at' in caplog.text
@@ -0,0 +1,20 @@
+import pytest
+
+from spotifyapi.exceptions import SpotifyError
+from spotifyapi.mockserver import MockSpotify
+
+
+def test_ids_are_chunked_and_returned_in_order():
+    with MockSpotify() as mock:
+        sp = mock.spotify()
+        ids = [f'artist{n}' for n in range(120)] + ['artist0']
+        artists = sp.getArtists(ids)
+        assert [artist['id'] for artist in artists] == ids
+        assert mock.requests['artists'] == 3
+
+
+def test_a_string_is_not_a_list_of_ids():
+    with MockSpotify() as mock:
+        with pytest.raises(SpotifyError):
+            mock.spotify().getArtists('4Z8W4fKeB5YxbusRsdQVPb')
+        assert 'artists' not in mock.requests
@@ -0,0 +1,104 @@
+import time
+
+from spotifyapi.cache import CacheEntry, MemoryCache, ResponseCache, SQLiteCache
+from spotifyapi.mockserver import MockSpotify
+
+
+def entry(body=b'{}', etag='"e"', max_age=60, age=0):
+    now = time.time()
+    return CacheEntry(body=body, etag=etag, expires_at=now - age + max_age, stored_at=now - age)
+
+
+def test_fresh_responses_are_served_from_the_cache():
+    with MockSpotify(cache_max_age=60) as mock:
+        cache = ResponseCache()
+        sp = mock.spotify(cache=cache)
+        assert sp.getAlbum('x') == sp.getAlbum('x')
+        assert mock.requests['albums/{id}'] == 1
+        assert cache.stats == {'hits': 1, 'misses': 1, 'revalidations': 0}
+
+
+def test_stale_responses_are_revalidated():
+    with MockSpotify(cache_max_age=60) as mock:
+        cache = ResponseCache()
+        sp = mock.spotify(cache=cache)
+        album = sp.getAlbum('x')
+        [key] = cache.backend._entries
+        stale = cache.backend.get(key)._replace(expires_at=0)
+        cache.backend.set(key, stale)
+
+        assert sp.getAlbum('x') == album
+        assert mock.requests['albums/{id}'] == 2
+        assert cache.revalidations == 1
+        revalidated = cache.backend.get(key)
+        assert revalidated.fresh and revalidated.body == stale.body
+        assert revalidated.stored_at == stale.stored_at
+
+
+def test_user_state_is_not_cached():
+    with MockSpotify(cache_max_age=60) as mock:
+        cache = ResponseCache()
+        sp = mock.spotify(cache=cache)
+        sp.getUserCurrentPlayback()
+        sp.getUserCurrentPlayback()
+        assert mock.requests['me/player'] == 2
+        assert len(cache.backend) == 0
+
+
+def test_cache_control():
+    cache = ResponseCache()
+    cache.store('no-store', {'Cache-Control': 'no-store', 'ETag': '"e"'}, b'{}')
+    cache.store('no-cache', {'Cache-Control': 'no-cache, max-age=60', 'ETag': '"e"'}, b'{}')
+    cache.store('no-etag', {}, b'{}')
+    cache.store('max-age', {'Cache-Control': 'public, max-age=60'}, b'{}')
+    assert cache.backend.get('no-store') is None and cache.backend.get('no-etag') is None
+    assert not cache.backend.get('no-cache').fresh
+    assert cache.backend.get('max-age').fresh
+
+
+def test_revalidation_does_not_extend_the_ttl():
+    cache = ResponseCache(MemoryCache(ttl=10))
+    old = entry(age=20, max_age=0)
+    cache.backend._entries['key'] = old
+    cache.revalidate('key', old, {'Cache-Control': 'max-age=60'})
+    assert cache.backend.get('key') is None
+
+
+def test_memory_cache_limits():
+    cache = MemoryCache(max_entries=2)
+    for key in 'abc':
+        cache.set(key, entry())
+    assert cache.get('a') is None and len(cache) == 2
+
+    cache = MemoryCache(max_bytes=10)
+    cache.set('a', entry(b'x' * 6))
+    cache.set('b', entry(b'x' * 6))
+    assert cache.get('a') is None and cache.get('b') is not None
+
+    cache = MemoryCache(ttl=10)
+    cache.set('old', entry(age=20))
+    cache.set('new', entry())
+    assert cache.get('old') is None and cache.get('new') is not None
+    assert len(cache) == 1
+
+
+def test_sqlite_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = SQLiteCache(path, max_entries=2)
+    cache.set('a', entry(b'a'))
+    cache.set('b', entry(b'b'))
+    time.sleep(0.01)
+    cache.get('a')
+    cache.set('c', entry(b'c'))
+    del cache
+
+    cache = SQLiteCache(path, max_entries=2)
+    assert len(cache) == 2
+    assert cache.get('a').body == b'a' and cache.get('c').body == b'c'
+    assert cache.get('b') is None
+
+
+def test_sqlite_cache_ttl(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    cache.set('old', entry(age=20))
+    assert cache.get('old') is None and len(cache) == 0
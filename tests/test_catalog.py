@@ -0,0 +1,221 @@
+import pytest
+
+from spotifyapi import endpoints
+from spotifyapi.catalog import DAY, CatalogStore
+from spotifyapi.exceptions import SpotifyRequestError
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.paging import _next_call
+from spotifyapi.ratelimit import RateLimiter
+from spotifyapi.retry import RetryPolicy
+
+
+class FakeClock():
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def store(**kwargs):
+    catalog = CatalogStore(':memory:', **kwargs)
+    catalog._clock = FakeClock()
+    return catalog
+
+
+def client(mock, catalog, **kwargs):
+    # failures reach the catalog at once
+    return mock.spotify(catalog=catalog, retry_policy=RetryPolicy(max_retries=0),
+                        rate_limiter=RateLimiter(max_retries=0), **kwargs)
+
+
+def artist(id, name):
+    return {'id': id, 'name': name, 'type': 'artist'}
+
+
+def test_hit_after_write_through():
+    with MockSpotify() as mock:
+        catalog = store()
+        sp = client(mock, catalog)
+        album = sp.getAlbum('x')
+        assert sp.getAlbum('x') == album
+        assert sp.getArtist('xa')['id'] == 'xa'
+        assert mock.requests['albums/{id}'] == 1
+        # the album's artists are stored as simplified objects, getArtist needs the full one
+        assert mock.requests['artists/{id}'] == 1
+        assert catalog.stats == {'hits': 1, 'misses': 2, 'stale_hits': 0, 'writes': 23}
+        # calls with a market are always sent
+        sp.getAlbum('x', market='US')
+        assert mock.requests['albums/{id}'] == 2
+
+
+def test_miss_when_stale():
+    with MockSpotify() as mock:
+        catalog = store()
+        sp = client(mock, catalog)
+        sp.getAlbum('x')
+        catalog._clock.now += 30 * DAY - 1
+        sp.getAlbum('x')
+        assert mock.requests['albums/{id}'] == 1
+        catalog._clock.now += 2
+        sp.getAlbum('x')
+        assert mock.requests['albums/{id}'] == 2
+        assert catalog.misses == 2
+
+
+@pytest.mark.parametrize('status', [500, 503, 429])
+def test_fallback_to_stale_entries(status):
+    with MockSpotify(retry_after=0) as mock:
+        catalog = store()
+        sp = client(mock, catalog)
+        album = sp.getAlbum('x')
+        catalog._clock.now += 31 * DAY
+        mock.fail_next(status)
+        assert sp.getAlbum('x') == album
+        assert catalog.stale_hits == 1
+
+        # no stale entry, or not an outage: the error is raised
+        mock.fail_next(status)
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('y')
+        mock.fail_next(404)
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('x')
+
+
+def test_no_fallback_when_disabled():
+    with MockSpotify() as mock:
+        catalog = store(stale_if_error=False)
+        sp = client(mock, catalog)
+        sp.getAlbum('x')
+        catalog._clock.now += 31 * DAY
+        mock.fail_next(500)
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('x')
+
+
+def test_lookup_list_rebuilds_next_and_previous():
+    with MockSpotify() as mock:
+        catalog = store()
+        sp = client(mock, catalog)
+        assert len(list(sp.iterAlbumTracks('x', limit=20))) == 120
+        sent = mock.requests['albums/{id}/tracks']
+
+        api_call = endpoints.getAlbumTracks('x', limit=20, offset=40)
+        page = catalog.lookup(api_call)
+        href = f'{mock.api_url}albums/x/tracks'
+        assert [track['id'] for track in page['items']] == [f'xt{n}' for n in range(40, 60)]
+        assert page['href'] == f'{href}?offset=40&limit=20'
+        assert page['next'] == f'{href}?offset=60&limit=20'
+        assert page['previous'] == f'{href}?offset=20&limit=20'
+        assert page['total'] == 120
+
+        # the rebuilt `next` is answered from the catalog too, the last page has none
+        last = catalog.lookup(_next_call({'next': f'{href}?offset=100&limit=20'}, api_call))
+        assert last['offset'] == 100 and last['next'] is None
+        assert catalog.lookup(endpoints.getAlbumTracks('x'))['previous'] is None
+        assert len(list(sp.iterAlbumTracks('x', limit=20))) == 120
+        assert mock.requests['albums/{id}/tracks'] == sent
+
+
+def test_lookup_list_needs_every_item():
+    with MockSpotify() as mock:
+        catalog = store()
+        sp = client(mock, catalog)
+        # getAlbum stores the first 20 tracks of 120
+        sp.getAlbum('x')
+        assert catalog.lookup(endpoints.getAlbumTracks('x', limit=20)) is not None
+        assert catalog.lookup(endpoints.getAlbumTracks('x', limit=30)) is None
+        assert catalog.lookup(endpoints.getAlbumTracks('x', limit=20, offset=20)) is None
+
+
+def album(id, track_ids):
+    tracks = [{'id': track_id, 'name': f'Track {track_id}', 'type': 'track'} for track_id in track_ids]
+    return {'id': id, 'name': f'Album {id}', 'type': 'album',
+            'tracks': {'href': f'https://api.spotify.com/v1/albums/{id}/tracks', 'items': tracks, 'limit': 20,
+                       'next': None, 'offset': 0, 'previous': None, 'total': len(tracks)}}
+
+
+def test_evict_removes_owned_lists():
+    catalog = store(max_entities=5)
+    catalog.store(endpoints.getAlbum('old'), album('old', ['t1', 't2']))
+    catalog._clock.now += 1
+    catalog.store(endpoints.getTracks(['t1', 't2']), {'tracks': [album('t1', [])] and
+                                                      [{'id': 't1', 'type': 'track'}, {'id': 't2', 'type': 'track'}]})
+    catalog._clock.now += 1
+    catalog.store(endpoints.getAlbum('new'), album('new', ['t3', 't4']))
+    assert len(catalog) == 6
+    assert catalog.members('album_tracks', 'old') is not None
+
+    # the oldest entity is the album 'old', its tracks were fetched again since
+    assert catalog.evict() == 1
+    assert catalog.get('album', 'old') is None
+    assert catalog.get('track', 't1') is not None
+    assert catalog.members('album_tracks', 'old') is None
+    assert catalog.lookup(endpoints.getAlbumTracks('old')) is None
+    for table in ('members', 'lists'):
+        assert catalog._db.execute(f"SELECT COUNT(*) FROM {table} WHERE owner = 'old'").fetchone()[0] == 0
+    assert [track['id'] for track in catalog.members('album_tracks', 'new')] == ['t3', 't4']
+    assert catalog.evict() == 0
+
+
+def test_search():
+    catalog = store()
+    for id, name in [('1', 'Daft Punk'), ('2', 'Punk Rock Band'), ('3', 'Björk')]:
+        catalog.store(endpoints.getArtist(id), artist(id, name))
+    catalog.store(endpoints.getAlbum('a'), {'id': 'a', 'name': 'Punk', 'type': 'album'})
+
+    if catalog._fts:
+        assert {found['id'] for found in catalog.search('punk')} == {'1', '2'}
+        assert [found['id'] for found in catalog.search('daft pu')] == ['1']
+        assert [found['id'] for found in catalog.search('bjork')] == ['3']
+    assert [found['id'] for found in catalog.search('punk', 'album')] == ['a']
+    assert catalog.search('') == []
+    assert catalog.search('punk', 'playlist') == []
+
+    # stale entries are left out on demand
+    catalog._clock.now += 8 * DAY
+    assert catalog.search('daft', stale=False) == []
+    assert [found['id'] for found in catalog.search('daft')] == ['1']
+
+
+def test_search_without_fts(monkeypatch):
+    # as with an SQLite built without FTS5
+    create_tables = CatalogStore._create_tables
+    monkeypatch.setattr(CatalogStore, '_create_tables', lambda self: create_tables(self) and False)
+    catalog = store()
+    assert not catalog._fts
+    for id, name in [('1', 'Daft Punk'), ('2', 'Punk Rock Band'), ('3', '100%_real')]:
+        catalog.store(endpoints.getArtist(id), artist(id, name))
+    # the whole name has to start with the query
+    assert [found['id'] for found in catalog.search('punk')] == ['2']
+    assert [found['id'] for found in catalog.search('daft p')] == ['1']
+    assert [found['id'] for found in catalog.search('100%_')] == ['3']
+    assert catalog.search('100%x') == []
+
+
+def test_search_after_vacuum():
+    catalog = store(max_entities=2)
+    for id, name in [('1', 'First'), ('2', 'Second'), ('3', 'Third')]:
+        catalog.store(endpoints.getArtist(id), artist(id, name))
+        catalog._clock.now += 1
+    assert catalog.evict() == 1
+    catalog._db.execute('VACUUM')
+    if catalog._fts:
+        assert [found['id'] for found in catalog.search('third')] == ['3']
+        assert [found['id'] for found in catalog.search('second')] == ['2']
+        assert catalog.search('first') == []
+
+
+def test_old_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'catalog.sqlite')
+    catalog = CatalogStore(path)
+    catalog._db.execute('DROP TABLE entities')
+    catalog._db.execute('CREATE TABLE entities (kind TEXT NOT NULL, id TEXT NOT NULL, name TEXT, full TEXT, '
+                        'full_at REAL, simple TEXT, simple_at REAL, fetched_at REAL NOT NULL, PRIMARY KEY (kind, id))')
+    catalog._db.commit()
+    del catalog
+
+    catalog = CatalogStore(path)
+    catalog.store(endpoints.getArtist('1'), artist('1', 'First'))
+    assert catalog.get('artist', '1')['name'] == 'First'
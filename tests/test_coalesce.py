@@ -0,0 +1,42 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from spotifyapi.coalesce import Coalescer
+from spotifyapi.mockserver import MockSpotify
+
+
+def test_concurrent_identical_gets_are_one_request():
+    with MockSpotify(latency=0.2) as mock:
+        coalescer = Coalescer()
+        sp = mock.spotify(coalescer=coalescer)
+        sp.getAlbum('warmup')
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            albums = list(executor.map(lambda _: sp.getAlbum('x'), range(8)))
+        assert all(album is albums[0] for album in albums)
+        assert mock.requests['albums/{id}'] == 2
+        assert coalescer.stats == {'calls': 2, 'coalesced': 7}
+
+
+def test_concurrent_identical_gets_are_one_request_async():
+    with MockSpotify(latency=0.2) as mock:
+        coalescer = Coalescer()
+
+        async def run():
+            async with mock.async_spotify(coalescer=coalescer) as sp:
+                return await asyncio.gather(*(sp.getAlbum('x') for _ in range(8)))
+        albums = asyncio.run(run())
+        assert all(album is albums[0] for album in albums)
+        assert mock.requests['albums/{id}'] == 1
+        assert coalescer.stats == {'calls': 1, 'coalesced': 7}
+
+
+def test_requests_of_different_users_are_not_merged():
+    with MockSpotify(latency=0.2) as mock:
+        coalescer = Coalescer()
+        alice, bob = mock.spotify(coalescer=coalescer), mock.spotify(coalescer=coalescer)
+        alice.getAlbum('warmup')
+        bob.getAlbum('warmup')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda sp: sp.getUserCurrentPlayback(), [alice, bob]))
+        assert mock.requests['me/player'] == 2
+        assert coalescer.stats['coalesced'] == 0
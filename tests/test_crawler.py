@@ -0,0 +1,66 @@
+import json
+
+from spotifyapi.crawler import Crawler, JSONLSink
+from spotifyapi.mockserver import MockSpotify
+
+
+def page(items):
+    return {'href': None, 'items': items, 'limit': 50, 'next': None, 'offset': 0, 'previous': None,
+            'total': len(items)}
+
+
+def artist(id):
+    return {'id': id, 'name': f'Artist {id}', 'type': 'artist'}
+
+
+# a -> b -> c, album y belongs to a and b
+GRAPH = {
+    'artists/a/related-artists': {'artists': [artist('b')]},
+    'artists/b/related-artists': {'artists': [artist('a'), artist('c')]},
+    'artists/c/related-artists': {'artists': []},
+    'artists/a/albums': page([{'id': 'x'}, {'id': 'y'}]),
+    'artists/b/albums': page([{'id': 'y'}, {'id': 'z'}]),
+    'artists/c/albums': page([]),
+    'albums/x/tracks': page([{'id': 't1'}, {'id': 't2'}]),
+    'albums/y/tracks': page([{'id': 't3'}]),
+    'albums/z/tracks': page([{'id': 't4'}]),
+}
+
+
+def read(directory, kind):
+    with open(directory / f'{kind}.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+
+def crawler(mock, directory, **kwargs):
+    return Crawler(mock.spotify(), JSONLSink(str(directory)), checkpoint_path=str(directory / 'checkpoint.json'),
+                   **kwargs)
+
+
+def test_crawls_the_graph_once(tmp_path):
+    with MockSpotify(fixtures=GRAPH) as mock:
+        stats = crawler(mock, tmp_path, max_depth=2).run(['a'])
+    assert (stats['artists'], stats['albums'], stats['tracks'], stats['failed']) == (3, 3, 4, 0)
+    assert sorted(artist['id'] for artist in read(tmp_path, 'artists')) == ['a', 'b', 'c']
+    assert sorted(track['id'] for track in read(tmp_path, 'tracks')) == ['t1', 't2', 't3', 't4']
+    with open(tmp_path / 'checkpoint.json') as f:
+        checkpoint = json.load(f)
+    assert sorted(checkpoint['visited']) == ['albums', 'artists']
+
+
+def test_resume_crawls_new_seeds(tmp_path):
+    with MockSpotify(fixtures=GRAPH) as mock:
+        crawler(mock, tmp_path, max_depth=0, tracks=False).run(['a'])
+        stats = crawler(mock, tmp_path, max_depth=0, tracks=False).run(['a', 'b'])
+    assert (stats['artists'], stats['albums']) == (2, 3)
+    assert sorted(artist['id'] for artist in read(tmp_path, 'artists')) == ['a', 'b']
+
+
+def test_resume_retries_failed_tasks(tmp_path):
+    # an albums page without items fails the task
+    with MockSpotify(fixtures=dict(GRAPH, **{'artists/a/albums': {}})) as mock:
+        stats = crawler(mock, tmp_path, max_depth=0, tracks=False).run(['a'])
+        assert (stats['albums'], stats['failed']) == (0, 1)
+        mock.fixtures['artists/a/albums'] = GRAPH['artists/a/albums']
+        stats = crawler(mock, tmp_path, max_depth=0, tracks=False).run(['a'])
+    assert (stats['albums'], stats['failed']) == (2, 0)
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from spotifyapi import decoders
+from spotifyapi.decoders import DECODERS, get_decoder
+from spotifyapi.mockserver import MockSpotify
+
+
+BODY = {'name': 'Björk', 'ids': ['a', 'b'], 'total': 120, 'popularity': 0.5, 'next': None, 'explicit': False}
+
+
+@pytest.mark.parametrize('name', sorted(DECODERS))
+def test_decoders_agree(name):
+    data = json.dumps(BODY, ensure_ascii=False).encode()
+    assert DECODERS[name](data) == BODY
+
+
+def test_get_decoder():
+    assert get_decoder('json') is DECODERS['json']
+    decode = lambda data: 'decoded'
+    assert get_decoder(decode) is decode
+    for name in ('orjson', 'msgspec', 'json'):
+        if name in DECODERS:
+            assert get_decoder() is DECODERS[name]
+            break
+    with pytest.raises(ValueError) as err:
+        get_decoder('simdjson')
+    assert 'json' in str(err.value)
+
+
+def test_fastest_installed_is_the_default(monkeypatch):
+    monkeypatch.setattr(decoders, 'DECODERS', {'json': DECODERS['json'], 'msgspec': 'msgspec'})
+    assert decoders.get_decoder() == 'msgspec'
+    monkeypatch.setattr(decoders, 'DECODERS', dict(decoders.DECODERS, orjson='orjson'))
+    assert decoders.get_decoder() == 'orjson'
+
+
+@pytest.mark.parametrize('name', sorted(DECODERS))
+def test_client_decodes_with(name):
+    with MockSpotify() as mock:
+        sp = mock.spotify(decoder=name)
+        assert sp.decoder is DECODERS[name]
+        assert sp.getAlbum('x')['tracks']['total'] == 120
+        assert sp.search('abba', 'track', limit=50)['tracks']['items'][0]['type'] == 'track'
+
+
+def test_client_decoder_function():
+    calls = []
+
+    def decode(data):
+        calls.append(len(data))
+        return json.loads(data)
+
+    with MockSpotify() as mock:
+        assert mock.spotify(decoder=decode).getAlbum('x')['id'] == 'x'
+    assert len(calls) == 1
@@ -0,0 +1,76 @@
+import inspect
+import json
+
+import pytest
+
+from spotifyapi import endpoints, models
+from spotifyapi.endpoints import ApiCall, endpoint
+from spotifyapi.exceptions import SpotifyError
+
+
+def test_path_and_optional_query():
+    assert endpoints.getAlbum('x') == ApiCall('GET', 'albums/x', {}, None, True, False, None, models.Album,
+                                              'albums/{id}', None)
+    assert endpoints.getAlbum('x', market='US').params == {'market': 'US'}
+    assert endpoints.getAlbum(id='x', market=None).params == {}
+    assert endpoints.getArtist('y').params is None
+    assert endpoints.getCategoryPlaylist('party', limit=5).url_path == 'browse/categories/party/playlists'
+
+
+def test_convert_and_max_ids():
+    api_call = endpoints.getAlbums(['a', 'b'], market='US')
+    assert api_call.params == {'ids': 'a,b', 'market': 'US'}
+    assert api_call.result_key == 'albums'
+    assert endpoints.getAlbums.max_ids == 20
+    assert endpoints.getAudioFeatures.max_ids == 100
+
+
+def test_rename_choices_and_result_key_template():
+    api_call = endpoints.search('abba', 'track', limit=5)
+    assert api_call.params == {'q': 'abba', 'type': 'track', 'limit': 5}
+    assert api_call.result_key == 'tracks'
+    assert endpoints.search('abba', 'artist', include_external='audio').params['include_external'] == 'audio'
+    with pytest.raises(SpotifyError) as err:
+        endpoints.search('abba', 'song')
+    assert 'q_type' in str(err.value)
+
+
+def test_json_body():
+    api_call = endpoints.startOrResumeUserPlayback(context_uri='spotify:album:x', position_ms=10)
+    assert api_call.method == 'PUT'
+    assert api_call.params == {}
+    assert json.loads(api_call.data) == {'context_uri': 'spotify:album:x', 'position_ms': 10}
+    assert endpoints.startOrResumeUserPlayback(device_id='d').params == {'device_id': 'd'}
+    assert api_call.decode is False and api_call.idempotent is False
+
+
+def test_compiled_function_keeps_the_declaration():
+    build = endpoints.getAlbumTracks
+    assert build.__name__ == 'getAlbumTracks'
+    assert 'maximum number of tracks' in build.__doc__
+    assert list(inspect.signature(build).parameters) == ['id', 'market', 'limit', 'offset']
+    assert build.__defaults__ == (None, None, None)
+    assert build.__code__.co_filename == '<endpoint getAlbumTracks>'
+    with pytest.raises(TypeError):
+        build()
+
+
+def test_declaration_errors():
+    with pytest.raises(TypeError, match='no arguments named album_id'):
+        @endpoint('GET', 'albums/{album_id}')
+        def getAlbum(id):
+            pass
+
+    with pytest.raises(TypeError, match='positional or keyword'):
+        @endpoint('GET', 'albums')
+        def getAlbums(*ids):
+            pass
+
+
+def test_body_of_the_declaration_is_not_run():
+    @endpoint('GET', 'things/{id}', result_key='things', idempotent=True)
+    def getThing(id, flag=False):
+        raise AssertionError('never run')
+
+    assert getThing('1') == ApiCall('GET', 'things/1', {}, None, True, False, 'things', None, 'things/{id}', True)
+    assert getThing('1', flag=True).params == {'flag': True}
@@ -0,0 +1,48 @@
+import csv
+import json
+
+import pytest
+
+from spotifyapi.export import ExportSink, export
+
+
+def test_sink_appends_on_resume(tmp_path):
+    for run in range(2):
+        sink = ExportSink(str(tmp_path))
+        sink.write('artists', {'id': f'a{run}'})
+        sink.close()
+    with open(tmp_path / 'artists.ndjson') as f:
+        assert [json.loads(line)['id'] for line in f] == ['a0', 'a1']
+
+
+def test_csv_sink_keeps_one_header(tmp_path):
+    for run in range(2):
+        sink = ExportSink(str(tmp_path), format='csv', fields=['id', 'name'])
+        sink.write('artists', {'id': f'a{run}', 'name': 'x'})
+        sink.close()
+    with open(tmp_path / 'artists.csv', newline='') as f:
+        assert list(csv.reader(f)) == [['id', 'name'], ['a0', 'x'], ['a1', 'x']]
+
+
+def test_parquet_nested_values_missing_from_the_first_batch(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    rows = [{'id': 'a', 'album': {'label': None, 'genres': []}},
+            {'id': 'b', 'album': {'label': 'Mock', 'genres': ['rock']}}]
+    export(rows, str(tmp_path / 'tracks.parquet'), batch_rows=1)
+    table = pyarrow.parquet.read_table(str(tmp_path / 'tracks.parquet'))
+    assert table.schema.field('album').type == pyarrow.struct([('label', pyarrow.string()),
+                                                               ('genres', pyarrow.list_(pyarrow.string()))])
+    assert table.to_pylist() == rows
+
+
+def test_parquet_sink_adds_a_file_on_resume(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.dataset
+    for run in range(2):
+        sink = ExportSink(str(tmp_path), format='parquet')
+        sink.write('artists', {'id': f'a{run}'})
+        sink.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['artists.1.parquet', 'artists.parquet']
+    dataset = pyarrow.dataset.dataset(str(tmp_path), format='parquet')
+    assert sorted(dataset.to_table().column('id').to_pylist()) == ['a0', 'a1']
@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from spotifyapi import metrics
+from spotifyapi.cache import MemoryCache, ResponseCache
+from spotifyapi.exceptions import SpotifyError
+from spotifyapi.metrics import Histogram, Hooks, Metrics, PrometheusExporter, RequestEvent, TokenEvent
+from spotifyapi.mockserver import MockSpotify
+
+
+def test_hooks_register_functions_and_objects():
+    events, tokens = [], []
+
+    class TokenHook():
+        def on_token(self, event):
+            tokens.append(event)
+
+    hooks = Hooks(events.append, TokenHook())
+    assert hooks and not Hooks()
+    event = RequestEvent('albums/{id}', 'GET', 200, 0.1, 1, 10, False)
+    hooks.request(event)
+    hooks.token(TokenEvent('ClientCredentials', 'get', 0.1))
+    assert events == [event]
+    assert [token.action for token in tokens] == ['get']
+
+
+def test_failing_hook_does_not_break_the_call():
+    def broken(event):
+        raise RuntimeError('hook')
+
+    with MockSpotify() as mock:
+        assert mock.spotify(hooks=Hooks(broken)).getAlbum('x')['id'] == 'x'
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    assert histogram.quantile(0.5) is None
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(0.99) == float('inf')
+    assert histogram.to_dict()['count'] == 4
+
+
+def test_metrics_of_a_client():
+    with MockSpotify(retry_after=0, cache_max_age=60) as mock:
+        collected = Metrics()
+        hooks = Hooks(collected)
+        auth_manager = mock.auth_manager()
+        auth_manager.hooks = hooks
+        sp = mock.spotify(auth_manager=auth_manager, hooks=hooks, cache=ResponseCache(MemoryCache()))
+        sp.getAlbum('x')
+        sp.getAlbum('x')
+        mock.fail_next(429)
+        sp.getAlbum('y')
+        mock.fail_next(404)
+        with pytest.raises(SpotifyError):
+            sp.getAlbum('z')
+
+        snapshot = collected.snapshot()
+        albums = snapshot['albums/{id}']
+        assert albums['statuses'] == {200: 2, 429: 1, 404: 1}
+        assert albums['cache_hits'] == 1
+        assert albums['retries'] == 1
+        assert albums['latency']['count'] == 4
+        assert albums['bytes'] > 0
+        assert snapshot['token:ClientCredentials.get']['count'] == 1
+
+        collected.reset()
+        assert collected.snapshot() == {}
+
+
+def test_transport_errors_are_counted():
+    events = []
+    with MockSpotify() as mock:
+        sp = mock.spotify(hooks=Hooks(events.append))
+        sp.getAlbum('warmup')
+        mock.drop_next(1)
+        with pytest.raises(Exception):
+            sp.startOrResumeUserPlayback(context_uri='spotify:album:x')
+    event = events[-1]
+    assert event.status is None and event.error == 'ConnectionError'
+    assert event.endpoint == 'me/player/play'
+
+
+def test_no_clock_without_hooks(monkeypatch):
+    calls = []
+    perf_counter = time.perf_counter
+
+    def counting():
+        if threading.current_thread() is threading.main_thread():
+            calls.append(1)
+        return perf_counter()
+
+    with MockSpotify() as mock:
+        sp = mock.spotify()
+        sp.getAlbum('warmup')
+        monkeypatch.setattr(time, 'perf_counter', counting)
+        assert sp.getAlbum('x')['id'] == 'x'
+        assert calls == []
+        sp.hooks = Hooks(Metrics())
+        sp.getAlbum('x')
+        assert calls
+
+
+def test_prometheus_exporter():
+    prometheus_client = pytest.importorskip('prometheus_client')
+    registry = prometheus_client.CollectorRegistry()
+    exporter = PrometheusExporter(registry=registry)
+    exporter.on_request(RequestEvent('albums/{id}', 'GET', 200, 0.1, 1, 100, False))
+    exporter.on_request(RequestEvent('albums/{id}', 'GET', 200, 0.1, 2, 100, False))
+    exporter.on_request(RequestEvent('albums/{id}', 'GET', None, 0.2, 1, 0, False, 'ConnectionError'))
+    exporter.on_request(RequestEvent('albums/{id}', 'GET', 200, 0.0, 0, 0, True))
+    exporter.on_token(TokenEvent('ClientCredentials', 'get', 0.3))
+
+    def value(name, **labels):
+        return registry.get_sample_value(f'spotifyapi_{name}', labels)
+
+    assert value('request_duration_seconds_count', endpoint='albums/{id}', method='GET', status='200') == 2
+    assert value('request_duration_seconds_count', endpoint='albums/{id}', method='GET',
+                 status='ConnectionError') == 1
+    assert value('response_bytes_total', endpoint='albums/{id}') == 200
+    assert value('retries_total', endpoint='albums/{id}') == 1
+    assert value('cache_hits_total', endpoint='albums/{id}') == 1
+    assert value('token_duration_seconds_count', flow='ClientCredentials', action='get', error='') == 1
+
+
+def test_prometheus_exporter_needs_prometheus_client(monkeypatch):
+    monkeypatch.setattr(metrics, 'prometheus_client', None)
+    with pytest.raises(SpotifyError):
+        PrometheusExporter()
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+import requests
+
+from spotifyapi.mockserver import MockSpotify
+
+
+AUTH = {'Authorization': 'Bearer x'}
+
+
+def statuses(mock, count):
+    with requests.Session() as session:
+        return [session.get(f'{mock.url}v1/albums/x', headers=AUTH) for _ in range(count)]
+
+
+def test_latency():
+    with MockSpotify(latency=0.05) as mock:
+        statuses(mock, 1)
+        start = time.monotonic()
+        statuses(mock, 3)
+        assert time.monotonic() - start >= 0.15
+
+    with MockSpotify(latency=(0.01, 0.02)) as mock:
+        start = time.monotonic()
+        statuses(mock, 5)
+        assert time.monotonic() - start >= 0.05
+
+
+def test_error_rate():
+    with MockSpotify(error_rate=0.5, seed=1) as mock:
+        codes = [response.status_code for response in statuses(mock, 200)]
+        assert set(codes) == {200, 500}
+        assert 60 < codes.count(500) < 140
+        assert mock.requests['albums/{id}'] == codes.count(200)
+
+
+def test_throttle_rate_and_retry_after():
+    with MockSpotify(throttle_rate=0.3, retry_after=7, seed=2) as mock:
+        responses = statuses(mock, 200)
+        throttled = [response for response in responses if response.status_code == 429]
+        assert 30 < len(throttled) < 90
+        assert all(response.headers['Retry-After'] == '7' for response in throttled)
+        assert all(response.status_code == 200 for response in responses if response not in throttled)
+
+
+def test_all_requests_fail():
+    with MockSpotify(error_rate=1) as mock:
+        assert {response.status_code for response in statuses(mock, 10)} == {500}
+        assert statuses(mock, 1)[0].json()['error']['status'] == 500
+
+
+def test_client_disconnect_is_quiet(capfd):
+    with MockSpotify(latency=0.2) as mock:
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.Timeout):
+                requests.get(f'{mock.url}v1/albums/x', headers=AUTH, timeout=0.05)
+        # let the handlers write to the closed connections
+        time.sleep(0.4)
+    assert 'Traceback' not in capfd.readouterr().err
@@ -0,0 +1,78 @@
+import json
+import pickle
+import tracemalloc
+
+from spotifyapi import endpoints, models
+from spotifyapi.mockserver import MockSpotify
+
+
+def album_body():
+    with MockSpotify() as mock:
+        return mock.spotify().getAlbum('x')
+
+
+def test_raw_round_trips():
+    body = dict(album_body(), label=None, undeclared={'a': [1, 2]})
+    del body['popularity']
+    album = models.Album(body)
+    assert album.raw == body
+    assert 'popularity' not in album.raw and album.popularity is None
+    assert album.raw['undeclared'] == {'a': [1, 2]}
+    assert album._get('undeclared') == {'a': [1, 2]}
+
+
+def test_nested_parts_are_decoded_when_read():
+    album = models.Album(album_body())
+    index = models.Album._index
+    assert isinstance(album._values[index['available_markets']], bytes)
+    assert isinstance(album._values[index['images']], bytes)
+    assert album.images[0].url == 'https://i.scdn.co/image/x'
+    assert album._values[index['images']] is album.images
+    assert len(album.available_markets) == 180
+    assert album.tracks.items[0].name == 'Track xt0'
+    assert album.artists[0].name == 'Artist xa'
+
+
+def test_equal_models_hash_alike():
+    body = album_body()
+    assert models.Album(body) == models.Album(json.loads(json.dumps(body)))
+    assert len({models.Album(body), models.Album(body)}) == 1
+    assert pickle.loads(pickle.dumps(models.Album(body))).raw == body
+
+
+def test_paging_items_get_the_item_model():
+    page = models.TrackPage(album_body()['tracks'])
+    assert len(page) == 20
+    assert all(isinstance(track, models.Track) for track in page)
+    assert page.next.endswith('offset=20&limit=20')
+
+
+def test_wrap_and_result_model():
+    assert models.wrap(endpoints.getAlbum('x'), None) is None
+    assert isinstance(models.wrap(endpoints.getAlbum('x'), album_body()), models.Album)
+    assert models.result_model(endpoints.search('q', 'track')) is models.TrackPage
+    assert models.result_model(endpoints.getAlbums(['x'])) is models.Album
+    assert models.result_model(endpoints.getAlbum('x')) is models.Album
+
+
+def test_client_returns_models():
+    with MockSpotify() as mock:
+        sp = mock.spotify(models=True)
+        assert isinstance(sp.getAlbum('x'), models.Album)
+        assert sp.search('q', 'track', limit=5).tracks.items[0].album.name == 'Album track0al'
+        assert all(isinstance(track, models.Track) for track in sp.iterAlbumTracks('x', limit=50))
+
+
+def _held(body, model):
+    tracemalloc.start()
+    held = [model(page) if model else page for page in (json.loads(body) for _ in range(20))]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert held
+    return size
+
+
+def test_models_hold_less_than_dicts():
+    with MockSpotify() as mock:
+        body = mock.spotify().getAlbumTracks('x', limit=50, raw=True)
+    assert _held(body, models.TrackPage) < _held(body, None) / 2
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+from spotifyapi import endpoints
+from spotifyapi.paging import iter_pages, iter_pages_async
+
+
+class FakeSearch():
+    """ Search answering `served` results but claiming `total` of them """
+
+    def __init__(self, total, served):
+        self.total = total
+        self.served = served
+        self.offsets = []
+        self._lock = threading.Lock()
+
+    def __call__(self, api_call):
+        params = api_call.params
+        offset, limit = params.get('offset', 0), params['limit']
+        with self._lock:
+            self.offsets.append(offset)
+        assert offset + limit <= 1000, 'Spotify answers 400 past 1000 results'
+        end = min(offset + limit, self.served)
+        more = end < self.served
+        return {'tracks': {'items': list(range(offset, end)), 'offset': offset, 'limit': limit,
+                           'total': self.total, 'next': 'next' if more else None}}
+
+
+def test_parallel_search_stays_within_1000_results():
+    call = FakeSearch(total=5000, served=1000)
+    pages = list(iter_pages(call, endpoints.search('abba', 'track', limit=50), workers=4))
+    assert [item for page in pages for item in page['items']] == list(range(1000))
+    assert max(call.offsets) == 950
+    assert len(call.offsets) == 20
+
+
+def test_parallel_stops_at_the_last_page():
+    call = FakeSearch(total=500, served=120)
+    pages = list(iter_pages(call, endpoints.search('abba', 'track', limit=50), workers=2))
+    assert [item for page in pages for item in page['items']] == list(range(120))
+    assert pages[-1]['next'] is None
+    # at most the window is requested past the end
+    assert len(call.offsets) <= 3 + 2
+
+
+def test_parallel_single_page():
+    call = FakeSearch(total=5000, served=10)
+    pages = list(iter_pages(call, endpoints.search('abba', 'track', limit=50), workers=4))
+    assert len(pages) == 1
+    assert call.offsets == [0]
+
+
+def test_async_parallel_search():
+    fake = FakeSearch(total=5000, served=1000)
+
+    async def call(api_call):
+        return fake(api_call)
+
+    async def run():
+        return [page async for page in iter_pages_async(call, endpoints.search('abba', 'track', limit=50),
+                                                        workers=4)]
+
+    pages = asyncio.run(run())
+    assert sum(len(page['items']) for page in pages) == 1000
+    assert max(fake.offsets) == 950
+
+    fake = FakeSearch(total=500, served=120)
+    pages = asyncio.run(run())
+    assert pages[-1]['next'] is None
+    assert sum(len(page['items']) for page in pages) == 120
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from spotifyapi import endpoints
+from spotifyapi.exceptions import SpotifyRequestError
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.pipeline import Paged, Pipeline
+
+
+def albums(depth):
+    for n in range(depth):
+        album = yield endpoints.getAlbum(f'album{depth}-{n}')
+    return album['id']
+
+
+def test_results_stream_as_jobs_finish():
+    with MockSpotify(latency=0.05) as mock:
+        results = Pipeline(mock.spotify(), workers=4).run(albums, [4, 1, 2])
+        first = next(results)
+        assert (first.input, first.value) == (1, 'album1-0')
+        # the deeper jobs are still going
+        assert mock.requests['albums/{id}'] < 7
+        assert sorted(result.input for result in results) == [2, 4]
+
+
+def test_lists_and_paged_calls():
+    def job(id):
+        tracks, album = yield [Paged(endpoints.getAlbumTracks(id, limit=50)), endpoints.getAlbum(id)]
+        return len(tracks), album['id']
+
+    with MockSpotify() as mock:
+        results = list(Pipeline(mock.spotify()).run(job, ['x']))
+    assert [result.value for result in results] == [(120, 'x')]
+
+
+def test_failed_sub_job_drops_its_siblings():
+    def failing():
+        yield endpoints.getAlbum('failing')
+        raise ValueError('sub-job failed')
+
+    def slow():
+        for n in range(5):
+            yield endpoints.getAlbum(f'slow{n}')
+        return 'slow'
+
+    def job(_):
+        return (yield [failing(), slow()])
+
+    with MockSpotify(latency=0.05) as mock:
+        [result] = list(Pipeline(mock.spotify(), workers=4).run(job, [0]))
+        time.sleep(0.1)
+    assert isinstance(result.error, ValueError)
+    # the first calls of both, and maybe the next one of `slow` if it was answered first
+    assert mock.requests['albums/{id}'] <= 3
+
+
+def test_errors_are_thrown_into_the_job():
+    def job(_):
+        try:
+            yield endpoints.getAlbum('x')
+        except SpotifyRequestError as err:
+            return f'handled {err.status}'
+
+    with MockSpotify() as mock:
+        mock.fail_next(404)
+        [result] = list(Pipeline(mock.spotify()).run(job, [0]))
+    assert result.value == 'handled 404'
+
+
+def test_empty_list_is_answered_at_once():
+    def job(_):
+        return (yield [])
+
+    with MockSpotify() as mock:
+        assert [result.value for result in Pipeline(mock.spotify()).run(job, [0, 1])] == [[], []]
+
+
+def test_max_jobs_limits_the_inputs_taken():
+    taken = []
+
+    def inputs():
+        for n in range(20):
+            taken.append(n)
+            yield n
+
+    with MockSpotify(latency=0.02) as mock:
+        results = Pipeline(mock.spotify(), workers=2, max_jobs=3).run(albums, inputs())
+        next(results)
+        assert len(taken) <= 4
+        assert len(list(results)) == 19
+
+
+class SlowClient():
+    """ Client answering every call after `delay`, counting the calls in flight """
+    models = False
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _call(self, api_call):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return {'id': api_call.url_path}
+
+
+def test_workers_bound_the_calls_in_flight():
+    client = SlowClient(0.02)
+    results = list(Pipeline(client, workers=3).run(albums, [2] * 10))
+    assert len(results) == 10 and not any(result.error for result in results)
+    assert client.max_in_flight == 3
+
+
+def test_job_must_be_a_generator_function():
+    with pytest.raises(TypeError, match='generator function'):
+        list(Pipeline(SlowClient(0)).run(lambda n: n, [1]))
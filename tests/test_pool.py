@@ -0,0 +1,36 @@
+import threading
+import time
+
+from spotifyapi.cache import ResponseCache
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.pool import SpotifyPool, UserAuth
+from spotifyapi.tokenstore import SQLiteTokenStore
+
+
+def test_users_refresh_their_tokens_in_parallel(tmp_path, monkeypatch):
+    with MockSpotify(latency=0.3) as mock:
+        monkeypatch.setattr(UserAuth, 'AUTH_TOKEN_URL', mock.token_url)
+        pool = SpotifyPool('id', 'secret', 'http://localhost', token_store=SQLiteTokenStore(str(tmp_path / 'tokens')))
+        users = [f'user{n}' for n in range(4)]
+        for user in users:
+            pool.add_user(user, {'access_token': 'old', 'refresh_token': 'r', 'expires_in': 3600,
+                                 'expires_at': time.time() - 10})
+
+        tokens = dict()
+        threads = [threading.Thread(target=lambda user=user: tokens.update({user: pool[user].auth_manager.get_token()}))
+                   for user in users]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.monotonic() - start < 0.3 * len(users) - 0.2
+        assert len(set(tokens.values())) == len(users)
+        assert mock.tokens_issued == len(users)
+        pool.close()
+
+
+def test_shared_cache_skips_the_token_users_market():
+    cache = ResponseCache()
+    assert cache.key('GET', 'https://api.spotify.com/v1/albums/x', {'market': 'from_token'}) is None
+    assert cache.key('GET', 'https://api.spotify.com/v1/albums/x', {'market': 'DE'}) is not None
@@ -0,0 +1,115 @@
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.processes import ProcessRunner, SharedRateLimiter, TokenCoordinator
+
+
+def album_name(client, id):
+    return client.getAlbum(id)['name']
+
+def worker_token(auth, queue):
+    queue.put(auth.get_token())
+
+
+def test_pause_in_one_process_delays_the_others():
+    limiter = SharedRateLimiter()
+    process = multiprocessing.Process(target=limiter.pause, args=(0.5,))
+    process.start()
+    process.join()
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.4
+    assert limiter.retries == 1
+    assert limiter.throttled_time >= 0.4
+
+
+def test_shared_budget():
+    limiter = SharedRateLimiter(rate=20, burst=1)
+    processes = [multiprocessing.Process(target=limiter.acquire) for _ in range(4)]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    limiter.acquire()
+    # 5 requests, one at once, then 20 per second
+    assert time.monotonic() - start >= 0.18
+
+
+def test_runner_workers_share_the_pauses():
+    with MockSpotify(retry_after=0.5) as mock:
+        with ProcessRunner(mock.auth_manager(), workers=2, api_url=mock.api_url) as runner:
+            assert runner.submit(album_name, 'warmup').result() == 'Album warmup'
+            mock.fail_next(429)
+            names = sorted(runner.map_unordered(album_name, ['a', 'b', 'c', 'd']))
+            assert names == ['Album a', 'Album b', 'Album c', 'Album d']
+            assert runner.stats['retries'] == 1
+            start = time.monotonic()
+            runner.rate_limiter.pause(0.3)
+            runner.submit(album_name, 'e').result()
+            assert time.monotonic() - start >= 0.25
+
+
+def test_workers_get_a_republished_token():
+    with MockSpotify() as mock:
+        auth_manager = mock.auth_manager()
+        coordinator = TokenCoordinator(auth_manager, margin=1, timeout=10)
+        coordinator.start()
+        try:
+            old = auth_manager.get_token()
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=worker_token, args=(coordinator.worker_auth(), queue))
+            process.start()
+            assert queue.get(timeout=10) == old
+            process.join()
+
+            # the token expires: a worker asks, the parent gets a new one and publishes it
+            auth_manager._clock = lambda: time.time() + 3600
+            coordinator.shared.publish(old, time.time() - 1)
+            process = multiprocessing.Process(target=worker_token, args=(coordinator.worker_auth(), queue))
+            process.start()
+            new = queue.get(timeout=10)
+            process.join()
+        finally:
+            coordinator.stop()
+        assert new != old
+        assert new == auth_manager.token_info['access_token']
+        assert mock.tokens_issued == 2
+        assert coordinator.published == 2
+
+
+def test_map_unordered_window():
+    runner = ProcessRunner(None, workers=2)
+    executor = ThreadPoolExecutor(max_workers=10)
+    lock = threading.Lock()
+    running = [0, 0]    # now, most
+    submitted = []
+
+    def task(item):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return item
+
+    def submit(fn, item):
+        submitted.append(item)
+        return executor.submit(task, item)
+
+    runner.submit = submit
+    with executor:
+        # items can be endless, only `window` of them are taken ahead
+        results = list(itertools.islice(runner.map_unordered(album_name, itertools.count(), window=3), 20))
+        assert len(set(results)) == 20
+        assert running[1] == 3
+        assert len(submitted) <= 23
+
+        submitted.clear()
+        assert sorted(runner.map_unordered(album_name, range(10))) == list(range(10))
+        assert sorted(submitted) == list(range(10))
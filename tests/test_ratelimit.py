@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from spotifyapi.exceptions import SpotifyRequestError
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.ratelimit import RateLimiter
+
+
+def test_429_is_retried_after_retry_after():
+    with MockSpotify(retry_after=0.2) as mock:
+        limiter = RateLimiter()
+        sp = mock.spotify(rate_limiter=limiter)
+        mock.fail_next(429, 2)
+        start = time.monotonic()
+        assert sp.getAlbum('x')['id'] == 'x'
+        assert time.monotonic() - start >= 0.4
+        assert limiter.retries == 2
+        assert limiter.throttled_time >= 0.3
+
+
+def test_429_pauses_every_client_sharing_the_limiter():
+    with MockSpotify(retry_after=0.5) as mock:
+        limiter = RateLimiter()
+        throttled, other = mock.spotify(rate_limiter=limiter), mock.spotify(rate_limiter=limiter)
+        throttled.getAlbum('warmup')
+        other.getAlbum('warmup')
+        mock.fail_next(429)
+        thread = threading.Thread(target=throttled.getAlbum, args=('x',))
+        thread.start()
+        time.sleep(0.1)
+        start = time.monotonic()
+        other.getAlbum('y')
+        assert time.monotonic() - start >= 0.3
+        thread.join()
+
+
+def test_gives_up_after_max_retries():
+    with MockSpotify(retry_after=0) as mock:
+        limiter = RateLimiter(max_retries=2, default_retry_after=0)
+        sp = mock.spotify(rate_limiter=limiter)
+        mock.fail_next(429, 5)
+        with pytest.raises(SpotifyRequestError) as err:
+            sp.getAlbum('x')
+        assert err.value.status == 429
+        assert limiter.retries == 2
+
+
+def test_budget_spaces_requests():
+    with MockSpotify() as mock:
+        sp = mock.spotify(rate_limiter=RateLimiter(rate=20, burst=1))
+        sp.getAlbum('warmup')
+        start = time.monotonic()
+        for n in range(10):
+            sp.getAlbum(f'album{n}')
+        assert time.monotonic() - start >= 0.45
@@ -0,0 +1,139 @@
+import time
+
+import pytest
+import requests
+
+from spotifyapi.exceptions import SpotifyCircuitOpen, SpotifyRequestError
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.retry import CircuitBreaker, RetryPolicy
+
+
+def policy(**kwargs):
+    kwargs.setdefault('backoff', 0.01)
+    return RetryPolicy(**kwargs)
+
+
+def test_5xx_is_retried_for_get():
+    with MockSpotify() as mock:
+        retry_policy = policy()
+        sp = mock.spotify(retry_policy=retry_policy)
+        mock.fail_next(503, 2)
+        assert sp.getAlbum('x')['id'] == 'x'
+        assert retry_policy.retries == 2
+        assert mock.requests['albums/{id}'] == 1
+
+
+def test_5xx_gives_up_after_max_retries():
+    with MockSpotify() as mock:
+        retry_policy = policy(max_retries=2)
+        sp = mock.spotify(retry_policy=retry_policy)
+        mock.fail_next(500, 5)
+        with pytest.raises(SpotifyRequestError) as err:
+            sp.getAlbum('x')
+        assert err.value.status == 500
+        assert retry_policy.stats['gave_up'] == 1
+
+
+def test_play_is_not_retried_on_5xx():
+    with MockSpotify() as mock:
+        retry_policy = policy()
+        sp = mock.spotify(retry_policy=retry_policy)
+        mock.fail_next(503)
+        with pytest.raises(SpotifyRequestError):
+            sp.startOrResumeUserPlayback(context_uri='spotify:album:x')
+        assert retry_policy.retries == 0
+
+
+def test_dropped_get_is_retried_by_the_policy():
+    with MockSpotify() as mock:
+        retry_policy = policy()
+        sp = mock.spotify(retry_policy=retry_policy)
+        sp.getAlbum('warmup')
+        mock.drop_next(2)
+        assert sp.getAlbum('x')['id'] == 'x'
+        assert mock.dropped == 2
+        assert retry_policy.retries == 2
+
+
+def test_dropped_play_is_sent_once():
+    with MockSpotify() as mock:
+        retry_policy = policy()
+        sp = mock.spotify(retry_policy=retry_policy)
+        sp.getAlbum('warmup')
+        mock.drop_next(5)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            sp.startOrResumeUserPlayback(context_uri='spotify:album:x')
+        assert mock.dropped == 1
+        assert retry_policy.retries == 0
+
+
+def test_circuit_opens_after_failures():
+    with MockSpotify() as mock:
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        sp = mock.spotify(retry_policy=policy(max_retries=0, circuit_breaker=breaker))
+        mock.fail_next(500, 3)
+        for _ in range(3):
+            with pytest.raises(SpotifyRequestError):
+                sp.getAlbum('x')
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(SpotifyCircuitOpen):
+            sp.getAlbum('x')
+        assert 'albums/{id}' not in mock.requests
+
+
+def test_deadline_stops_retries():
+    with MockSpotify() as mock:
+        retry_policy = policy(max_retries=100, backoff=0.2, deadline=0.5)
+        sp = mock.spotify(retry_policy=retry_policy)
+        mock.fail_next(500, 100)
+        start = time.monotonic()
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('x')
+        assert time.monotonic() - start < 1
+        assert retry_policy.stats['deadline_exceeded'] == 1
+
+
+def test_429_does_not_close_the_circuit():
+    with MockSpotify(retry_after=0) as mock:
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        sp = mock.spotify(retry_policy=policy(max_retries=0, circuit_breaker=breaker))
+        mock.fail_next(500)
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('x')
+        # the 429 and its retry: only the answered retry resets the failures
+        mock.fail_next(429)
+        sp.getAlbum('x')
+        assert breaker.failures == 0
+
+        mock.fail_next(500)
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('x')
+        # a call giving up on 429s: one failure still, the circuit stays closed
+        mock.fail_next(429, 6)
+        with pytest.raises(SpotifyRequestError) as err:
+            sp.getAlbum('x')
+        assert err.value.status == 429
+        assert breaker.failures == 1 and breaker.state == CircuitBreaker.CLOSED
+
+
+def test_429_keeps_a_half_open_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    with MockSpotify(retry_after=0) as mock:
+        sp = mock.spotify(retry_policy=policy(max_retries=0, circuit_breaker=breaker))
+        mock.fail_next(500)
+        with pytest.raises(SpotifyRequestError):
+            sp.getAlbum('x')
+        assert breaker.state == CircuitBreaker.OPEN
+        time.sleep(0.06)
+        # the trial is throttled: still half-open, and its retry is the next trial
+        mock.fail_next(429)
+        assert sp.getAlbum('x')['id'] == 'x'
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.failure()
+    breaker._opened_at -= 60
+    assert breaker.allow() and not breaker.allow()
+    breaker.neutral()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
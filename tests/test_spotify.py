@@ -0,0 +1,26 @@
+import asyncio
+
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.spotify import Spotify
+
+
+def test_paged_methods_keep_their_names():
+    assert Spotify.iterAlbumTracks.__name__ == 'iterAlbumTracks'
+    assert Spotify.iterSearch.__name__ == 'iterSearch'
+    assert Spotify.getAlbum.__name__ == 'getAlbum'
+
+
+def test_clients_return_the_same_for_undecoded_endpoints():
+    with MockSpotify() as mock:
+        sp = mock.spotify()
+        assert sp.pauseUserPlayback() is None
+        assert sp.startOrResumeUserPlayback(context_uri='spotify:album:x') is None
+        assert isinstance(sp.getAlbum('x', raw=True), bytes)
+
+        async def run():
+            async with mock.async_spotify() as sp:
+                return (await sp.pauseUserPlayback(), await sp.startOrResumeUserPlayback(context_uri='spotify:album:x'),
+                        await sp.getAlbum('x', raw=True))
+        paused, started, raw = asyncio.run(run())
+        assert paused is None and started is None
+        assert isinstance(raw, bytes)
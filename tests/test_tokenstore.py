@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from spotifyapi.auth import AuthorizationCode
+from spotifyapi.tokenstore import FileTokenStore, SQLiteTokenStore
+
+pytestmark = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+
+WORKERS = 4
+
+
+def _store(kind, directory):
+    if kind == 'file':
+        return FileTokenStore(os.path.join(directory, 'token'))
+    return SQLiteTokenStore(os.path.join(directory, 'tokens.sqlite'))
+
+
+def _write(path, count):
+    store = FileTokenStore(path)
+    for n in range(count):
+        # large enough that a non-atomic write would be seen half done
+        store.save({'access_token': f'{os.getpid()}-{n}', 'padding': 'x' * 200000})
+
+
+def _read(path, until):
+    torn = 0
+    while time.monotonic() < until:
+        with open(path) as f:
+            try:
+                token_info = json.load(f)
+            except ValueError:
+                torn += 1
+                continue
+        torn += len(token_info['padding']) != 200000
+    return torn
+
+
+def test_readers_never_see_a_torn_file(tmp_path):
+    path = str(tmp_path / 'token')
+    FileTokenStore(path).save({'access_token': 'first', 'padding': 'x' * 200000})
+    context = multiprocessing.get_context('fork')
+    with context.Pool(2 * WORKERS) as pool:
+        until = time.monotonic() + 2
+        readers = [pool.apply_async(_read, (path, until)) for _ in range(WORKERS)]
+        writers = [pool.apply_async(_write, (path, 100)) for _ in range(WORKERS)]
+        for writer in writers:
+            writer.get()
+        assert [reader.get() for reader in readers] == [0] * WORKERS
+
+
+def _increment(kind, directory, count):
+    store = _store(kind, directory)
+    for _ in range(count):
+        with store.lock():
+            token_info = store.load()
+            store.save({'access_token': 'x', 'count': token_info['count'] + 1})
+
+
+@pytest.mark.parametrize('kind', ['file', 'sqlite'])
+def test_lock_is_exclusive_between_processes(tmp_path, kind):
+    _store(kind, str(tmp_path)).save({'access_token': 'x', 'count': 0})
+    context = multiprocessing.get_context('fork')
+    with context.Pool(WORKERS) as pool:
+        pool.starmap(_increment, [(kind, str(tmp_path), 50)] * WORKERS)
+    assert _store(kind, str(tmp_path)).load()['count'] == WORKERS * 50
+
+
+class _TokenResponse():
+    status_code = 200
+    text = ''
+
+    def json(self):
+        return {'access_token': f'token-{os.getpid()}', 'token_type': 'Bearer', 'expires_in': 3600, 'scope': 'a'}
+
+
+class _TokenEndpoint():
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    def post(self, **kwargs):
+        with open(self.log_path, 'a') as f:
+            f.write('refresh\n')
+        time.sleep(0.2)
+        return _TokenResponse()
+
+
+def _get_token(kind, directory):
+    auth = AuthorizationCode('id', 'secret', redirect_uri='http://localhost', scope='a',
+                             token_store=_store(kind, directory))
+    auth._session = _TokenEndpoint(os.path.join(directory, 'refreshes'))
+    return auth.get_token()
+
+
+@pytest.mark.parametrize('kind', ['file', 'sqlite'])
+def test_processes_share_one_refresh(tmp_path, kind):
+    _store(kind, str(tmp_path)).save({'access_token': 'old', 'refresh_token': 'r', 'scope': 'a',
+                                      'expires_in': 3600, 'expires_at': time.time() - 10})
+    context = multiprocessing.get_context('fork')
+    with context.Pool(WORKERS) as pool:
+        tokens = pool.starmap(_get_token, [(kind, str(tmp_path))] * WORKERS)
+    assert len(set(tokens)) == 1
+    with open(tmp_path / 'refreshes') as f:
+        assert f.read().split() == ['refresh']
@@ -0,0 +1,65 @@
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from spotifyapi.exceptions import SpotifyRequestError
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.retry import RetryPolicy
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_session_over_tls():
+    with MockSpotify(tls=True) as mock:
+        sp = mock.spotify()
+        assert mock.url.startswith('https://')
+        assert sp.getAlbum('x')['id'] == 'x'
+        assert sp.getAlbum('y')['id'] == 'y'
+        # the token and the API calls, each over a kept connection
+        assert mock.handshakes == 2
+
+
+def test_http2_session_round_trip():
+    pytest.importorskip('h2')
+    pytest.importorskip('httpx')
+    with MockSpotify(http2=True) as mock:
+        session = mock.session(http2=True)
+        sp = mock.spotify(request_session=session)
+        assert sp.getAlbum('x')['id'] == 'x'
+        handshakes = mock.handshakes
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            albums = list(executor.map(lambda n: sp.getAlbum(f'album{n}'), range(40)))
+        assert [album['id'] for album in albums] == [f'album{n}' for n in range(40)]
+        # concurrent calls are multiplexed over the connection already open
+        assert mock.handshakes == handshakes
+        response = session.get(f'{mock.url}v1/albums/x', headers={'Authorization': 'Bearer x'})
+        assert response.http_version == 'HTTP/2'
+
+
+def test_http2_session_errors_are_mapped():
+    pytest.importorskip('h2')
+    pytest.importorskip('httpx')
+    with MockSpotify(http2=True) as mock:
+        sp = mock.spotify(request_session=mock.session(http2=True),
+                          retry_policy=RetryPolicy(backoff=0.01))
+        sp.getAlbum('warmup')
+        mock.fail_next(404)
+        with pytest.raises(SpotifyRequestError) as err:
+            sp.getAlbum('x')
+        assert err.value.status == 404
+        # a reset stream is a transport error: retried for a GET, raised as requests' for a PUT
+        mock.drop_next(1)
+        assert sp.getAlbum('x')['id'] == 'x'
+        mock.drop_next(1)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            sp.startOrResumeUserPlayback(context_uri='spotify:album:x')
+
+    from spotifyapi.transport import HTTP2Session
+    with pytest.raises(requests.exceptions.ConnectionError):
+        HTTP2Session(max_retries=0).get(f'https://127.0.0.1:{closed_port()}/')
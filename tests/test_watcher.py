@@ -0,0 +1,35 @@
+import time
+
+from spotifyapi.mockserver import MockSpotify
+from spotifyapi.watcher import PlaybackWatcher
+
+
+def watcher(**kwargs):
+    return PlaybackWatcher(min_interval=0.05, max_interval=0.05, paused_interval=0.05, idle_interval=0.05, **kwargs)
+
+
+def test_polls_and_emits_changes():
+    with MockSpotify() as mock:
+        events = []
+        playback = watcher()
+        playback.subscribe(events.append)
+        playback.watch('alice', mock.spotify())
+        with playback:
+            time.sleep(0.2)
+            mock.player = dict(mock.player, is_playing=False)
+            time.sleep(0.2)
+        assert [event.kind for event in events] == ['started', 'paused']
+
+
+def test_restart_resumes_polls_in_flight_at_stop():
+    with MockSpotify(latency=0.3) as mock:
+        playback = watcher()
+        playback.watch('alice', mock.spotify())
+        playback.start()
+        time.sleep(0.1)
+        playback.stop()
+        polls = mock.requests['me/player']
+        playback.start()
+        time.sleep(0.8)
+        playback.stop()
+        assert mock.requests['me/player'] > polls